@@ -0,0 +1,269 @@
+"""
+JSON API, version 1.
+
+Listings select only the requested columns and serialize the rows directly instead of loading Book entities, so a
+call costs one narrow query and no template rendering. Clients pick the columns with the fields parameter:
+
+    GET  /api/v1/books?fields=id,title&author=J. K. Rowling&available=1&after=<cursor>
+    GET  /api/v1/search?query=potter&page=2
+    GET  /api/v1/my/books
+    GET  /api/v1/my/reserved
+    POST /api/v1/books/<id>/reserve
+    POST /api/v1/books/<id>/return
+    POST /api/v1/books/import       multipart upload of a CSV or JSON lines file in the field "file"
+    GET  /api/v1/csrf-token
+
+Requests are authenticated with the session cookie of the site, so POST requests have to send the token from
+/api/v1/csrf-token in the X-CSRFToken header. Errors are returned as {"error": message} with a matching status code.
+"""
+import functools
+import io
+import time
+from datetime import date
+
+from flask import Blueprint, Response, current_app, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms import ValidationError
+
+from models import queries
+from models.book import Book
+from models.database import db
+from utilities import lending
+from utilities.book_import import BookImporter, detect_format, read_rows
+from utilities.page_cache import catalog_changed
+from utilities.pagination import InvalidCursor, keyset_page
+from utilities.search import search_books
+from utilities.serialization import dumps
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+FIELDS = {'id': Book.id,
+          'title': Book.title,
+          'author': Book.author,
+          'image_url': Book.image_url,
+          'reserved': Book.reserved,
+          'lent_out': Book.lent_out,
+          'available_for_lending': Book.available_for_lending,
+          'return_date': Book.return_date,
+          'owner_id': Book.owner_id}
+DEFAULT_FIELDS = ('id', 'title', 'author', 'image_url', 'reserved')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, headers=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.headers = headers or {}
+
+
+def json_response(payload, status=200, headers=None):
+    return Response(dumps(payload), status=status, headers=headers, mimetype='application/json')
+
+
+@api_v1.errorhandler(ApiError)
+def api_error(error):
+    return json_response({'error': error.message}, error.status, error.headers)
+
+
+def check_rate_limit(rule):
+    """Apply the RATE_LIMITS rule shared with the HTML route."""
+    rate_limiter = current_app.extensions['rate_limiter']
+    if rate_limiter is None:
+        return
+    user = current_user.id if current_user.is_authenticated else None
+    retry_after = rate_limiter.hit(rule, ip=request.remote_addr, user=user)
+    if retry_after:
+        raise ApiError("Too many requests", 429, {'Retry-After': str(max(int(retry_after + 0.999), 1))})
+
+
+def selected_fields():
+    """Field names from the fields query parameter, in the requested order."""
+    fields = request.args.get('fields')
+    if not fields:
+        return DEFAULT_FIELDS
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown or not names:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(FIELDS)}")
+    return names
+
+
+def project(rows, names):
+    """Turn rows into dicts holding only the selected fields."""
+    return [{name: row._mapping[name] for name in names} for row in rows]
+
+
+def api_login_required(view):
+    """Answer requests without a logged-in user with 401 instead of redirecting to the login page."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise ApiError("Authentication required", 401)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@api_v1.before_request
+def use_replica():
+    """Run GET requests against a read replica, unless the user has written recently."""
+    replicas = current_app.extensions['replicas']
+    if request.method == 'GET' and replicas.engines and session.get('primary_until', 0) < time.time():
+        db.session.info['replica'] = replicas.choose()
+
+
+@api_v1.before_request
+def check_csrf_token():
+    """Refuse state changing requests without the CSRF token of the session, other sites cannot read it."""
+    if request.method == 'POST' and current_app.config['WTF_CSRF_ENABLED']:
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError as error:
+            raise ApiError(str(error))
+
+
+@api_v1.teardown_request
+def release_replica(error=None):
+    db.session.info.pop('replica', None)
+
+
+@api_v1.route('/csrf-token')
+def csrf_token():
+    """The CSRF token to send in the X-CSRFToken header of POST requests."""
+    return json_response({'csrf_token': generate_csrf()})
+
+
+@api_v1.route('/books')
+def books():
+    """One page of the catalog ordered by author and title, optionally only available books or one author."""
+    names = selected_fields()
+    stmt = queries.available_books() if request.args.get('available', type=int) else queries.catalog_books()
+    if request.args.get('author'):
+        stmt = stmt.where(Book.author == request.args['author'])
+    # The sort key columns are always selected, the cursors are built from them.
+    columns = dict.fromkeys([*(FIELDS[name] for name in names), *queries.CATALOG_ORDER])
+    per_page = request.args.get('per_page', default=current_app.config['BOOKS_PER_PAGE'], type=int)
+    try:
+        page = keyset_page(stmt.with_only_columns(*columns), queries.CATALOG_ORDER,
+                           after=request.args.get('after'),
+                           before=request.args.get('before'),
+                           per_page=max(1, min(per_page, current_app.config['MAX_BOOKS_PER_PAGE'])),
+                           scalars=False)
+    except InvalidCursor as error:
+        raise ApiError(str(error))
+    return json_response({'books': project(page.items, names), 'next': page.next_cursor, 'prev': page.prev_cursor})
+
+
+@api_v1.route('/search')
+def search():
+    """Books whose title or author words start with every word of the query, most relevant first."""
+    check_rate_limit('searchbar')
+    names = selected_fields()
+    query = request.args.get('query', '')
+    if not query.strip():
+        raise ApiError("The query parameter is required")
+    page = max(request.args.get('page', default=1, type=int), 1)
+    rows, has_next = search_books(query, page=page, per_page=current_app.config['SEARCH_RESULTS_PER_PAGE'],
+                                  columns=[FIELDS[name] for name in names])
+    return json_response({'books': project(rows, names), 'page': page, 'has_next': has_next})
+
+
+@api_v1.route('/my/books')
+@api_login_required
+def my_books():
+    """Books added by the current user, with an overdue flag."""
+    names = selected_fields()
+    stmt = queries.owner_books(current_user.id, date.today()).order_by(Book.id)
+    rows = db.session.execute(stmt.with_only_columns(*(FIELDS[name] for name in names),
+                                                     queries.overdue(date.today()))).all()
+    return json_response({'books': project(rows, (*names, 'overdue'))})
+
+
+@api_v1.route('/my/reserved')
+@api_login_required
+def my_reserved_books():
+    """Books reserved or borrowed by the current user, with an overdue flag."""
+    names = selected_fields()
+    stmt = queries.lender_books(current_user.id, date.today())
+    rows = db.session.execute(stmt.with_only_columns(*(FIELDS[name] for name in names),
+                                                     queries.overdue(date.today()))).all()
+    return json_response({'books': project(rows, (*names, 'overdue'))})
+
+
+@api_v1.route('/books/<int:book_id>/reserve', methods=['POST'])
+@api_login_required
+def reserve_book(book_id):
+    """Reserve a book for the current user."""
+    check_rate_limit('reserve_book')
+    title = lending.reserve_book(book_id, current_user.id)
+    if title is None:
+        book = db.session.execute(db.select(Book.owner_id, Book.pending_validation, Book.available_for_lending)
+                                  .where(Book.id == book_id)).first()
+        if book is None:
+            raise ApiError("Book not found", 404)
+        if book.owner_id == current_user.id:
+            raise ApiError("You cannot reserve your own book", 403)
+        if book.pending_validation or not book.available_for_lending:
+            raise ApiError("Book is not available for lending", 409)
+        raise ApiError("Book is already reserved", 409)
+    catalog_changed()
+    current_app.extensions['lending_events'].emit('reserve', book_id, current_user.id, title=title)
+    return json_response({'id': book_id, 'title': title, 'reserved': True})
+
+
+@api_v1.route('/books/<int:book_id>/return', methods=['POST'])
+@api_login_required
+def return_book(book_id):
+    """Return a book borrowed by or owned by the current user."""
+    title = lending.return_book(book_id, current_user.id)
+    if title is None:
+        book = db.session.execute(db.select(Book.owner_id, Book.lender_id).where(Book.id == book_id)).first()
+        if book is None:
+            raise ApiError("Book not found", 404)
+        if current_user.id in (book.owner_id, book.lender_id):
+            raise ApiError("Book is not reserved or lent out", 409)
+        raise ApiError("You have not borrowed this book", 403)
+    catalog_changed()
+    current_app.extensions['lending_events'].emit('return', book_id, current_user.id, title=title)
+    return json_response({'id': book_id, 'title': title, 'reserved': False})
+
+
+@api_v1.route('/books/import', methods=['POST'])
+@api_login_required
+def import_books():
+    """
+    Import books of the current user from an uploaded CSV or JSON lines file.
+
+    Covers are checked like add_book does: during the request, or by the cover validation workers when
+    ASYNC_COVER_VALIDATION is on.
+    """
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        raise ApiError("Upload the file in the form field 'file'")
+    # Only the first rejected rows are returned, the rest are counted.
+    errors = []
+    max_errors = current_app.config['IMPORT_MAX_REPORTED_ERRORS']
+
+    def keep_error(error):
+        if len(errors) < max_errors:
+            errors.append({'line': error.line, 'title': error.title, 'error': error.error})
+
+    try:
+        file_format = request.form.get('format') or detect_format(upload.filename)
+        check_covers = not current_app.config['ASYNC_COVER_VALIDATION']
+        importer = BookImporter(current_user.id,
+                                batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                                check_covers=check_covers,
+                                cover_workers=current_app.config['IMPORT_COVER_WORKERS'],
+                                events=current_app.extensions['lending_events'],
+                                on_error=keep_error,
+                                # Books the full queue refuses stay pending until the validate-covers command.
+                                on_pending=current_app.extensions['cover_validation'].submit)
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = importer.run(read_rows(lines, file_format))
+    except (ValueError, UnicodeDecodeError) as error:
+        raise ApiError(str(error))
+    return json_response(dict(report.summary(), pending=report.pending, errors=errors))
@@ -0,0 +1,104 @@
+"""
+Synthetic catalog generator for benchmarks.
+
+Users and books are inserted with executemany batches of plain INSERT statements, so generating a million books takes
+minutes rather than hours. The random generator is seeded, the same arguments always produce the same catalog.
+"""
+import random
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from models.book import Book, normalize_book_key
+from models.user import User
+
+BENCHMARK_PASSWORD = '123456'
+
+WORDS = ('river', 'shadow', 'garden', 'winter', 'silent', 'empire', 'glass', 'harbor', 'letter', 'forest', 'golden',
+         'night', 'island', 'storm', 'memory', 'north', 'city', 'paper', 'stone', 'fire', 'ocean', 'secret', 'house',
+         'mountain', 'journey', 'crown', 'light', 'summer', 'broken', 'wild')
+FIRST_NAMES = ('Anna', 'Mari', 'Kati', 'Liis', 'Eva', 'Juhan', 'Priit', 'Toomas', 'Mart', 'Jaan', 'Peeter', 'Karl')
+LAST_NAMES = ('Tamm', 'Saar', 'Sepp', 'Mägi', 'Kask', 'Kukk', 'Rebane', 'Ilves', 'Pärn', 'Koppel', 'Lepik', 'Kruus')
+
+# Share of books in each loan state, the remainder is available for lending.
+LOAN_STATES = (('unavailable', 0.10), ('reserved', 0.10), ('lent_out', 0.15), ('overdue', 0.05))
+
+
+def generate_users(count):
+    """Yield user rows. Every user has the password BENCHMARK_PASSWORD."""
+    password = generate_password_hash(BENCHMARK_PASSWORD, method='pbkdf2:sha256', salt_length=8)
+    for number in range(1, count + 1):
+        yield {'first_name': FIRST_NAMES[number % len(FIRST_NAMES)],
+               'last_name': LAST_NAMES[number // len(FIRST_NAMES) % len(LAST_NAMES)],
+               'email': f'user{number}@example.com',
+               'username': f'user{number:06d}',
+               'password': password,
+               'duration': 28}
+
+
+def generate_books(count, users, seed=0, today=None):
+    """
+    Yield book rows in a realistic mix of loan states.
+
+    :param count: number of books
+    :param users: number of users, book owners and lenders are picked from ids 1..users
+    :param seed: random seed
+    :param today: date the return dates are relative to
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    for number in range(1, count + 1):
+        title = f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).capitalize()} {number}"
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        owner_id = rng.randint(1, users)
+        book = {'title': title, 'author': author, 'normalized_key': normalize_book_key(title, author),
+                'image_url': f'https://example.com/covers/{number}.jpg', 'return_date': None, 'reserved': False,
+                'lent_out': False, 'available_for_lending': True, 'pending_validation': False,
+                'owner_id': owner_id, 'lender_id': None}
+        state = pick_state(rng.random())
+        if state == 'unavailable':
+            book['available_for_lending'] = False
+        elif state is not None and users > 1:
+            book['reserved'] = True
+            book['lender_id'] = owner_id % users + 1
+            if state == 'lent_out':
+                book['lent_out'] = True
+                book['return_date'] = today + timedelta(days=rng.randint(0, 28))
+            elif state == 'overdue':
+                book['lent_out'] = True
+                book['return_date'] = today - timedelta(days=rng.randint(1, 60))
+        yield book
+
+
+def pick_state(value):
+    for state, share in LOAN_STATES:
+        if value < share:
+            return state
+        value -= share
+    return None
+
+
+def insert_batches(connection, table, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            connection.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+
+
+def generate_catalog(connection, books=10000, users=1000, seed=0, batch_size=5000, today=None):
+    """
+    Fill an empty database with synthetic users and books.
+
+    :param connection: SQLAlchemy connection inside a transaction
+    :param books: number of books
+    :param users: number of users
+    :param seed: random seed
+    :param batch_size: rows per INSERT executemany call
+    :param today: date the loan return dates are relative to
+    """
+    insert_batches(connection, User.__table__, generate_users(users), batch_size)
+    insert_batches(connection, Book.__table__, generate_books(books, users, seed=seed, today=today), batch_size)
@@ -0,0 +1,314 @@
+"""
+Closed-loop load test.
+
+Starts the application in long-lived worker processes against a file SQLite or a Postgres database and runs scripted
+users in parallel threads. Every user logs in and then repeatedly picks a weighted action (browse, search,
+My Books, reserve, receive, return), waiting for each response before sending the next request. Reports throughput,
+latency percentiles, error rates, lost reservation races and lock timeouts:
+
+    python -m benchmarks.load --books 20000 --users 500 --clients 50 --workers 4 --duration 60
+    python -m benchmarks.load --database postgresql://books@localhost/books_load --clients 100
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from werkzeug.serving import make_server
+
+from benchmarks.catalog import BENCHMARK_PASSWORD, WORDS, generate_catalog
+from benchmarks.run import percentile
+from configuration.config import BenchmarkConfig, Config, DATABASE_PROFILES
+from main import create_app
+from models.book import Book
+from models.database import db
+
+ACTIONS = (('home', 30), ('available_books', 15), ('search', 20), ('my_books', 10), ('reserve', 15), ('return', 10))
+LOCK_ERRORS = ('database is locked', 'lock timeout', 'could not obtain lock', 'deadlock detected')
+
+
+def load_test_app(database_uri, profile=None):
+    """Create the application with the benchmark settings on top of a database profile from DATABASE_PROFILES."""
+    config = type('Config', (BenchmarkConfig, DATABASE_PROFILES.get(profile, Config)),
+                  {'SQLALCHEMY_DATABASE_URI': database_uri, 'LOG_FILE': 'load_test.log'})
+    app = create_app(config_class=config)
+    app.config['SECRET_KEY'] = app.config['SECRET_KEY'] or 'load-test'
+    return app
+
+
+def prepare_database(database_uri, books, users, seed, profile=None):
+    """
+    Create the schema and generate the catalog if the database has no books yet.
+
+    Runs in a spawned process: create_app starts the log listener, event flush and password hashing threads, and the
+    process that forks the workers must not have any, their locks could be copied into the workers while held.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_prepare_database, database_uri, books, users, seed, profile).result()
+
+
+def _prepare_database(database_uri, books, users, seed, profile):
+    app = load_test_app(database_uri, profile)
+    with app.app_context():
+        if not db.session.execute(db.select(func.count(Book.id))).scalar():
+            with db.engine.begin() as connection:
+                generate_catalog(connection, books=books, users=users, seed=seed)
+        book_count = db.session.execute(db.select(func.max(Book.id))).scalar()
+        db.engine.dispose()
+    return book_count
+
+
+def serve(database_uri, host, port, fd, profile=None):
+    """
+    Run one worker: a threaded WSGI server that accepts connections from the listening socket fd shared by all workers.
+
+    Every worker creates its own application, so like in a multi-process deployment each one keeps its caches, rate
+    limit buckets, connection pool and log threads for the whole run. Lock errors are answered with 503 and an
+    X-Lock-Timeout header.
+    """
+    app = load_test_app(database_uri, profile)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    @app.errorhandler(OperationalError)
+    def database_error(error):
+        db.session.rollback()
+        if any(message in str(error.orig).lower() for message in LOCK_ERRORS):
+            return "Database lock timeout", 503, {'X-Lock-Timeout': '1'}
+        return "Database error", 500
+
+    # Compile the templates before the first measured request.
+    for path in ('/', '/available_books', '/login'):
+        app.test_client().get(path)
+    make_server(host, port, app, threaded=True, fd=fd).serve_forever()
+
+
+def start_workers(database_uri, host, workers, profile=None):
+    """
+    Bind a listening socket and fork workers server processes that accept connections from it.
+
+    :return: tuple of (port, list of worker processes)
+    """
+    listener = socket.create_server((host, 0), backlog=1024)
+    port = listener.getsockname()[1]
+    # The forked workers inherit the socket descriptor. The parent has not created an app, so it has no threads.
+    if threading.active_count() > 1:
+        raise RuntimeError("Workers must be forked before any thread is started")
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=serve, args=(database_uri, host, port, listener.fileno(), profile),
+                                 daemon=True)
+                 for _ in range(max(workers, 1))]
+    for process in processes:
+        process.start()
+    listener.close()
+    return port, processes
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.exceptions.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+class Results:
+    """Thread safe collection of request outcomes."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.counters = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, action, elapsed, outcome):
+        with self._lock:
+            self.latencies[action].append(elapsed)
+            self.counters[action][outcome] += 1
+
+    def summary(self, duration):
+        with self._lock:
+            actions = {}
+            for action, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latency * 1000 for latency in latencies)
+                counters = self.counters[action]
+                actions[action] = {'requests': len(latencies),
+                                   'errors': counters['error'] + counters['lock_timeout'],
+                                   'lock_timeouts': counters['lock_timeout'],
+                                   'conflicts': counters['conflict'],
+                                   'p50_ms': round(percentile(latencies, 50), 3),
+                                   'p95_ms': round(percentile(latencies, 95), 3),
+                                   'p99_ms': round(percentile(latencies, 99), 3)}
+        total = sum(result['requests'] for result in actions.values())
+        errors = sum(result['errors'] for result in actions.values())
+        return {'duration_s': round(duration, 3),
+                'requests': total,
+                'throughput_rps': round(total / duration, 1) if duration else 0,
+                'error_rate': round(errors / total, 4) if total else 0,
+                'lock_timeouts': sum(result['lock_timeouts'] for result in actions.values()),
+                'reservation_conflicts': sum(result['conflicts'] for result in actions.values()),
+                'actions': actions}
+
+
+class VirtualUser(threading.Thread):
+    """One scripted user sending requests in a closed loop until the deadline."""
+
+    def __init__(self, base_url, username, book_count, results, ready, duration, think_time=0.0, seed=None):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.username = username
+        self.book_count = book_count
+        self.results = results
+        self.ready = ready
+        self.duration = duration
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.borrowed = []
+
+    def run(self):
+        # Logging in hashes the password and is slow on purpose, users start sending traffic once all are logged in.
+        try:
+            logged_in = self.session.post(self.base_url + '/login', timeout=60,
+                                          data={'username': self.username, 'password': BENCHMARK_PASSWORD}).ok
+        except requests.exceptions.RequestException:
+            logged_in = False
+        self.ready.wait()
+        if not logged_in:
+            self.results.record('login', 0.0, 'error')
+            return
+        names, weights = zip(*ACTIONS)
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            action = self.rng.choices(names, weights)[0]
+            getattr(self, f'do_{action}')()
+            if self.think_time:
+                time.sleep(self.think_time)
+
+    def request(self, action, method, path, success_text=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.exceptions.RequestException:
+            self.results.record(action, time.perf_counter() - start, 'error')
+            return None
+        elapsed = time.perf_counter() - start
+        if response.headers.get('X-Lock-Timeout'):
+            outcome = 'lock_timeout'
+        elif response.status_code >= 400:
+            outcome = 'error'
+        elif success_text and success_text not in response.text:
+            outcome = 'conflict'
+        else:
+            outcome = 'ok'
+        self.results.record(action, elapsed, outcome)
+        return outcome
+
+    def do_home(self):
+        self.request('home', 'GET', '/')
+
+    def do_available_books(self):
+        self.request('available_books', 'GET', '/available_books')
+
+    def do_search(self):
+        self.request('search', 'GET', '/searchbar/', params={'query': self.rng.choice(WORDS)})
+
+    def do_my_books(self):
+        self.request('my_books', 'GET', '/my_books')
+
+    def do_reserve(self):
+        # Pick from a small set of books so that users regularly race for the same book.
+        book_id = self.rng.randint(1, min(self.book_count, 200))
+        outcome = self.request('reserve', 'GET', f'/reserve_book/{book_id}?current_page=my_reserved_books',
+                               success_text='is reserved for You')
+        if outcome != 'ok':
+            return
+        self.borrowed.append(book_id)
+        if self.rng.random() < 0.5:
+            self.request('receive', 'GET', f'/receive_book/{book_id}?current_page=my_reserved_books')
+
+    def do_return(self):
+        if not self.borrowed:
+            return self.do_home()
+        book_id = self.borrowed.pop(self.rng.randrange(len(self.borrowed)))
+        self.request('return', 'GET', f'/return_book/{book_id}?current_page=my_reserved_books')
+
+
+def run_load_test(base_url, book_count, users, clients=20, duration=30.0, think_time=0.0, seed=0):
+    """Run clients virtual users against base_url for duration seconds and return the summary."""
+    results = Results()
+    ready = threading.Barrier(clients + 1)
+    virtual_users = [VirtualUser(base_url, f'user{number % users + 1:06d}', book_count, results, ready, duration,
+                                 think_time=think_time, seed=seed + number)
+                     for number in range(clients)]
+    for virtual_user in virtual_users:
+        virtual_user.start()
+    ready.wait()
+    start = time.monotonic()
+    for virtual_user in virtual_users:
+        virtual_user.join()
+    return results.summary(time.monotonic() - start)
+
+
+def print_summary(summary):
+    print(f"{summary['requests']} requests in {summary['duration_s']}s, {summary['throughput_rps']} req/s, "
+          f"error rate {summary['error_rate']:.2%}, lock timeouts {summary['lock_timeouts']}, "
+          f"lost reservation races {summary['reservation_conflicts']}")
+    print(f"{'action':<16} {'requests':>8} {'errors':>6} {'locks':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, result in summary['actions'].items():
+        print(f"{name:<16} {result['requests']:>8} {result['errors']:>6} {result['lock_timeouts']:>6} "
+              f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='Database URI, defaults to a new SQLite file in a temporary directory.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=200, help='Catalog users, virtual users log in as them.')
+    parser.add_argument('--clients', type=int, default=20, help='Concurrent virtual users.')
+    parser.add_argument('--workers', type=int, default=4, help='Server worker processes, each one is threaded.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds.')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Pause between requests of one user.')
+    parser.add_argument('--profile', choices=sorted(DATABASE_PROFILES),
+                        help='Database profile, defaults to the plain development settings.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the summary to this JSON file.')
+    args = parser.parse_args(argv)
+
+    database_uri = args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load_test.db')}"
+    book_count = prepare_database(database_uri, args.books, args.users, args.seed, args.profile)
+    port, servers = start_workers(database_uri, args.host, args.workers, args.profile)
+    base_url = f'http://{args.host}:{port}'
+    try:
+        wait_until_ready(base_url)
+        summary = run_load_test(base_url, book_count, args.users, clients=args.clients, duration=args.duration,
+                                think_time=args.think_time, seed=args.seed)
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.join()
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+    return 1 if summary['error_rate'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Route benchmarks.
+
+Generates a synthetic catalog, drives every route of the application through the Flask test client and reports
+p50/p95/p99 latency and SQL statements per request. Results can be saved as a JSON baseline and later runs compared
+against it:
+
+    python -m benchmarks.run --books 100000 --users 10000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --books 100000 --users 10000 --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, func
+
+from benchmarks.catalog import BENCHMARK_PASSWORD, generate_catalog
+from configuration.config import BenchmarkConfig
+from main import create_app
+from models import queries
+from models.book import Book, normalize_book_key
+from models.database import db
+from utilities.pagination import encode_cursor
+
+BENCHMARK_USER_ID = 1
+SEARCH_QUERY = 'garden'
+
+
+class QueryCounter:
+    """Count SQL statements executed through an engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class Recorder:
+    """Latency and query count of every measured request, keyed by route name."""
+
+    def __init__(self, client, counter):
+        self.client = client
+        self.counter = counter
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.enabled = True
+
+    def request(self, name, method, path, **kwargs):
+        queries_before = self.counter.count
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        # Streamed responses are produced while the body is read
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        if self.enabled:
+            self.samples[name].append((elapsed, self.counter.count - queries_before))
+            if response.status_code >= 400:
+                self.errors[name] += 1
+        return response
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of a sorted list."""
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def summarize(samples, errors):
+    results = {}
+    for name, measurements in sorted(samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in measurements)
+        results[name] = {'requests': len(measurements),
+                         'errors': errors.get(name, 0),
+                         'p50_ms': round(percentile(latencies, 50), 3),
+                         'p95_ms': round(percentile(latencies, 95), 3),
+                         'p99_ms': round(percentile(latencies, 99), 3),
+                         'queries_per_request': sum(count for _, count in measurements) / len(measurements)}
+    return results
+
+
+def lendable_books(limit):
+    """Ids of books the benchmark user can reserve."""
+    return db.session.execute(queries.available_books()
+                              .with_only_columns(Book.id)
+                              .where(Book.owner_id != BENCHMARK_USER_ID)
+                              .order_by(Book.id).limit(limit)).scalars().all()
+
+
+def own_books(limit):
+    """Ids of books of the benchmark user that are not lent out."""
+    return db.session.execute(db.select(Book.id)
+                              .where(Book.owner_id == BENCHMARK_USER_ID, Book.lent_out == False)
+                              .order_by(Book.id).limit(limit)).scalars().all()
+
+
+def login(recorder):
+    recorder.request('login', 'POST', '/login',
+                     data={'username': f'user{BENCHMARK_USER_ID:06d}', 'password': BENCHMARK_PASSWORD})
+
+
+def middle_cursor():
+    """Cursor that points to the middle of the catalog."""
+    total = db.session.execute(queries.catalog_books().with_only_columns(func.count())).scalar()
+    book = db.session.execute(queries.catalog_books().order_by(*queries.CATALOG_ORDER)
+                              .offset(total // 2).limit(1)).scalar()
+    return encode_cursor(getattr(book, column.key) for column in queries.CATALOG_ORDER) if book else ''
+
+
+def run_scenarios(app, recorder, iterations):
+    """
+    Request every route iterations times.
+
+    Requests are made outside of an application context, so every request pushes its own context and loads the
+    logged-in user like it does in production.
+    """
+    with app.app_context():
+        deep_cursor = middle_cursor()
+        book_ids = lendable_books(iterations)
+        own_book_ids = own_books(iterations)
+    for name, path in (('home', '/'), ('home_deep_page', f'/?after={deep_cursor}'),
+                       ('available_books', '/available_books'), ('search', f'/searchbar/?query={SEARCH_QUERY}'),
+                       ('my_books', '/my_books'), ('my_reserved_books', '/my_reserved_books'),
+                       ('add_book_form', '/add_book'), ('api_books', '/api/v1/books'),
+                       ('api_books_deep_page', f'/api/v1/books?after={deep_cursor}'),
+                       ('api_search', f'/api/v1/search?query={SEARCH_QUERY}'), ('api_my_books', '/api/v1/my/books'),
+                       ('export_books', '/export/books'), ('export_reservations', '/export/reservations?format=jsonl'),
+                       ('export_catalog', '/export/catalog')):
+        for _ in range(iterations):
+            recorder.request(name, 'GET', path)
+    for number in range(iterations):
+        recorder.request('change_duration', 'POST', f'/change_duration/{BENCHMARK_USER_ID}',
+                         data={'duration': str(14 + number % 2)})
+    # Every book is switched twice, so the catalog is unchanged afterwards.
+    for book_id in own_book_ids:
+        recorder.request('activate_to_borrow', 'GET', f'/activate_to_borrow/{book_id}')
+        recorder.request('activate_to_borrow', 'GET', f'/activate_to_borrow/{book_id}')
+    for _ in range(iterations):
+        for action in ('deactivate', 'activate'):
+            recorder.request('bulk_my_books', 'POST', '/my_books/bulk',
+                             data={'action': action, 'book_ids': [str(book_id) for book_id in own_book_ids]})
+    for book_id in book_ids:
+        recorder.request('reserve_book', 'GET', f'/reserve_book/{book_id}')
+        recorder.request('cancel_reservation', 'GET', f'/cancel_reservation/{book_id}')
+    for book_id in book_ids:
+        recorder.request('reserve_book', 'GET', f'/reserve_book/{book_id}')
+        recorder.request('receive_book', 'GET', f'/receive_book/{book_id}')
+        recorder.request('return_book', 'GET', f'/return_book/{book_id}')
+    for number in range(iterations):
+        title = f'Benchmark book {time.time_ns()} {number}'
+        recorder.request('add_book', 'POST', '/add_book',
+                         data={'title': title, 'author': 'Bench Mark', 'image_url': 'https://example.com/cover.jpg'})
+        with app.app_context():
+            book_id = db.session.execute(db.select(Book.id)
+                                         .where(Book.normalized_key == normalize_book_key(title, 'Bench Mark'))
+                                         ).scalar()
+        if book_id is not None:
+            recorder.request('remove_book', 'GET', f'/remove_book/{book_id}')
+    # Registering logs the new user in, the benchmark user logs out and back in after it.
+    for number in range(iterations):
+        username = f'bench{time.time_ns()}{number}'
+        recorder.request('register', 'POST', '/register',
+                         data={'first_name': 'Bench', 'last_name': 'Mark', 'email': f'{username}@example.com',
+                               'username': username, 'password': BENCHMARK_PASSWORD,
+                               'confirm_password': BENCHMARK_PASSWORD})
+        recorder.request('logout', 'GET', '/logout')
+        login(recorder)
+
+
+def run_benchmarks(database_uri, books=10000, users=1000, iterations=50, warmup=5, seed=0):
+    """
+    Generate the catalog if the database is empty and benchmark every route.
+
+    :return: dict with the run parameters and per route results
+    """
+    config = type('Config', (BenchmarkConfig,), {'SQLALCHEMY_DATABASE_URI': database_uri})
+    app = create_app(config_class=config)
+    app.config['SECRET_KEY'] = app.config['SECRET_KEY'] or 'benchmark'
+    with app.app_context():
+        if not db.session.execute(db.select(func.count(Book.id))).scalar():
+            start = time.perf_counter()
+            with db.engine.begin() as connection:
+                generate_catalog(connection, books=books, users=users, seed=seed)
+            print(f"Generated {books} books and {users} users in {time.perf_counter() - start:.1f}s",
+                  file=sys.stderr)
+        counter = QueryCounter(db.engine)
+    client = app.test_client()
+    recorder = Recorder(client, counter)
+    app.config['EXPORT_ADMINS'] = [f'user{BENCHMARK_USER_ID:06d}']
+    login(recorder)
+    recorder.enabled = False
+    run_scenarios(app, recorder, warmup)
+    recorder.enabled = True
+    recorder.samples.clear()
+    run_scenarios(app, recorder, iterations)
+    return {'books': books, 'users': users, 'iterations': iterations, 'seed': seed,
+            'results': summarize(recorder.samples, recorder.errors)}
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Compare a report with a baseline report.
+
+    :param tolerance: allowed relative p95 latency increase
+    :return: list of regression descriptions
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms > baseline {base['p95_ms']}ms")
+        if result['queries_per_request'] > base['queries_per_request']:
+            regressions.append(f"{name}: {result['queries_per_request']} queries per request > "
+                               f"baseline {base['queries_per_request']}")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'route':<20} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, result in report['results'].items():
+        print(f"{name:<20} {result['requests']:>8} {result['errors']:>6} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['queries_per_request']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='Database URI, defaults to a new SQLite file in a temporary directory.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=50, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per route before measuring.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results with this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p95 latency increase.')
+    args = parser.parse_args(argv)
+
+    database_uri = args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    report = run_benchmarks(database_uri, books=args.books, users=args.users, iterations=args.iterations,
+                            warmup=args.warmup, seed=args.seed)
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(report, json.load(file), tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,110 @@
-class TestConfig:
+class Config:
+    """Default configuration for Flask."""
+    LOG_FILE = 'book_lending.log'
+    LOG_LEVEL = 'INFO'
+    LOG_QUEUE_SIZE = 10000
+    LOG_QUEUE_POLICY = 'drop'
+    LOG_QUEUE_TIMEOUT = 0.1
+    LOG_ROTATION = 'size'
+    LOG_MAX_BYTES = 10 * 2 ** 20
+    LOG_BACKUP_COUNT = 5
+    LOG_ROTATE_WHEN = 'midnight'
+    BOOKS_PER_PAGE = 24
+    MAX_BOOKS_PER_PAGE = 100
+    SEARCH_RESULTS_PER_PAGE = 20
+    ASYNC_COVER_VALIDATION = False
+    COVER_VALIDATION_WORKERS = 2
+    COVER_VALIDATION_QUEUE_SIZE = 100
+    COVER_VALIDATION_MAX_ATTEMPTS = 3
+    COVER_VALIDATION_BACKOFF = 1.0
+    USER_CACHE_TTL = 0
+    USER_CACHE_SIZE = 10000
+    REMINDER_SINK = 'jsonl'
+    REMINDER_FILE = 'reminders.jsonl'
+    REMINDER_CHECKPOINT = 'reminders.checkpoint.json'
+    REMINDER_DUE_SOON_DAYS = 3
+    REMINDER_BATCH_SIZE = 1000
+    REMINDER_SENDER = 'books@localhost'
+    SMTP_HOST = 'localhost'
+    SMTP_PORT = 25
+    LENDING_EVENTS_FILE = 'lending_events.jsonl'
+    LENDING_EVENTS_BUFFER_SIZE = 100
+    LENDING_EVENTS_FLUSH_INTERVAL = 5.0
+    INSTRUMENTATION = False
+    N_PLUS_ONE_THRESHOLD = 5
+    SQLITE_PRAGMAS = {}
+    SQLALCHEMY_REPLICA_URIS = []
+    REPLICA_CHECK_INTERVAL = 10.0
+    REPLICA_STICKY_SECONDS = 10
+    PAGE_CACHE_BACKEND = 'local'
+    PAGE_CACHE_URL = 'redis://localhost:6379/0'
+    PAGE_CACHE_TTL = 300
+    PAGE_CACHE_SIZE = 2048
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE_SIZE = 16
+    PASSWORD_HASH_TIMEOUT = 10.0
+    RATE_LIMIT_BACKEND = 'local'
+    RATE_LIMIT_URL = 'redis://localhost:6379/0'
+    RATE_LIMIT_MAX_KEYS = 100000
+    # Number of reverse proxies in front of the app that append to X-Forwarded-For. Rate limits are applied to the
+    # client address they report, with 0 to the address of the connection.
+    TRUSTED_PROXIES = 0
+    RATE_LIMITS = {'login': {'ip': '20/minute', 'user': '5/minute'},
+                   'register': {'ip': '5/hour'},
+                   'searchbar': {'ip': '60/minute', 'user': '60/minute'},
+                   'reserve_book': {'ip': '30/minute', 'user': '20/minute'}}
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_COVER_WORKERS = 8
+    IMPORT_MAX_REPORTED_ERRORS = 1000
+    EXPORT_ADMINS = []
+    EXPORT_BATCH_SIZE = 1000
+    BULK_ACTION_MAX_BOOKS = 500
+
+
+class SQLiteProductionConfig(Config):
+    """
+    File SQLite tuned for concurrent requests. WAL lets readers run while a write is in progress, synchronous=NORMAL
+    only syncs at checkpoints and busy_timeout makes writers wait for the lock instead of failing at once.
+    """
+    SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000,
+                      'mmap_size': 256 * 2 ** 20, 'cache_size': -20000}
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 10, 'max_overflow': 10}
+
+
+class PostgresProductionConfig(Config):
+    """Postgres with a bounded connection pool and per statement and lock timeouts."""
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 1800,
+                                 'pool_pre_ping': True,
+                                 'connect_args': {'options': '-c statement_timeout=5000 -c lock_timeout=3000'}}
+
+
+DATABASE_PROFILES = {'sqlite': SQLiteProductionConfig, 'postgres': PostgresProductionConfig}
+
+
+class TestConfig(Config):
     """Test configuration for Flask."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     LOGIN_DISABLED = False
     SESSION_PROTECTION = None
+    LOG_FILE = 'test_book_lending.log'
+    LOG_LEVEL = 'DEBUG'
+    LENDING_EVENTS_FILE = 'test_lending_events.jsonl'
+    PAGE_CACHE_BACKEND = None
+    RATE_LIMIT_BACKEND = None
+    # The production cost would make every login and registration of the test suite take a fraction of a second.
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+class BenchmarkConfig(Config):
+    """Configuration for the route benchmarks. Covers are never fetched, added books stay pending."""
+    WTF_CSRF_ENABLED = False
+    LOG_FILE = 'benchmark.log'
+    LENDING_EVENTS_FILE = 'benchmark_lending_events.jsonl'
+    ASYNC_COVER_VALIDATION = True
+    COVER_VALIDATION_WORKERS = 0
+    # Nothing takes books off the queue, the bound keeps long runs from growing it without limit.
+    COVER_VALIDATION_QUEUE_SIZE = 1000
+    RATE_LIMIT_BACKEND = None
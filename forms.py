@@ -28,3 +28,7 @@ class NewBookForm(FlaskForm):
     author = StringField('Author', validators=[DataRequired(), Length(min=4)])
     image_url = StringField('Image URL', validators=[DataRequired()])
     submit = SubmitField('Add Book')
+
+
+class BulkActionForm(FlaskForm):
+    """CSRF protection of the My Books bulk form, the action and book ids are read from the request."""
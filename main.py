@@ -1,23 +1,51 @@
-from datetime import datetime, timedelta
+import functools
+import json
+import logging
+import os
+import time
+from datetime import date, timezone
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
+import click
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, abort, Response, session,
+                   make_response, stream_with_context)
 from flask_bootstrap import Bootstrap5
 from flask_login import login_required, LoginManager, current_user, login_user, logout_user
-from sqlalchemy import or_
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-import os
-import logging
+from markupsafe import Markup
 
-from forms import LoginForm, RegistrationForm, NewBookForm
-from models.database import db
+from api.v1 import api_v1
+from configuration.config import Config, DATABASE_PROFILES
+from forms import BulkActionForm, LoginForm, RegistrationForm, NewBookForm
+from models.database import db, ReplicaRouter, apply_sqlite_pragmas
 from models.user import User
-from models.book import Book
+from models.book import Book, normalize_book_key, record_deletion
+from models import queries
+from models.migrations import upgrade_schema
+from utilities import lending
+from utilities.book_import import BookImporter, ErrorReport, detect_format, read_rows
+from utilities.events import aggregate_events, create_event_log, read_events
+from utilities.export import FORMATS as EXPORT_FORMATS, SCOPES as EXPORT_SCOPES, export_chunks
+from utilities.instrumentation import Instrumentation
+from utilities.logging_setup import configure_logging
+from utilities.page_cache import catalog_changed, create_page_cache
+from utilities.pagination import InvalidCursor, keyset_page
+from utilities.passwords import PasswordHashingBusy, calibrate, create_password_policy
+from utilities.query_plans import check_query_plans
+from utilities.rate_limit import create_rate_limiter
+from utilities.reminders import Checkpoint, create_sink, sweep_reminders
+from utilities.search import init_search, rebuild_search_index, search_books
 from utilities.service import check_image_url
+from utilities.user_cache import UserCache
+from utilities.validation_queue import CoverValidationQueue, validate_pending_books
 
 load_dotenv()
 
 DATABASE = os.environ.get('DATABASE')
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE')
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
 
@@ -25,23 +53,32 @@ def create_app(config_class=None):
     """Create and configure Flask application."""
 
     app = Flask(__name__)
+    app.config.from_object(Config)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     logger = logging.getLogger(__name__)
-    handler = logging.FileHandler("book_lending.log")
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
     if config_class:
         app.config.from_object(config_class)
-        handler = logging.FileHandler("test_book_lending.log", mode="w")
-        logger.setLevel(logging.DEBUG)
     else:
         app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE
-        logger.setLevel(logging.INFO)
+        if DATABASE_PROFILE:
+            app.config.from_object(DATABASE_PROFILES[DATABASE_PROFILE])
 
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    configure_logging(app.config, [__name__, 'utilities', 'models'])
+    if app.config['TRUSTED_PROXIES']:
+        # request.remote_addr becomes the client address the proxies put in X-Forwarded-For.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
 
     db.init_app(app)
+    replicas = ReplicaRouter([create_engine(uri, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+                              for uri in app.config['SQLALCHEMY_REPLICA_URIS']],
+                             check_interval=app.config['REPLICA_CHECK_INTERVAL'])
+    app.extensions['replicas'] = replicas
+    if app.config['SQLITE_PRAGMAS']:
+        with app.app_context():
+            for engine in [*db.engines.values(), *replicas.engines]:
+                if engine.dialect.name == 'sqlite':
+                    apply_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
 
     app.config['SECRET_KEY'] = SECRET_KEY
     Bootstrap5(app)
@@ -50,41 +87,210 @@ def create_app(config_class=None):
     login_manager.init_app(app)
 
     with app.app_context():
-        db.create_all()
+        upgrade_schema(db.engine)
+        if app.config['INSTRUMENTATION']:
+            engines = {'primary': db.engine,
+                       **{f'replica-{number}': engine for number, engine in enumerate(replicas.engines)}}
+            app.extensions['instrumentation'] = Instrumentation(app, engines,
+                                                                n_plus_one_threshold=app.config['N_PLUS_ONE_THRESHOLD'])
+    init_search(app)
+
+    cover_validation = CoverValidationQueue(app,
+                                            workers=app.config['COVER_VALIDATION_WORKERS'],
+                                            max_size=app.config['COVER_VALIDATION_QUEUE_SIZE'],
+                                            max_attempts=app.config['COVER_VALIDATION_MAX_ATTEMPTS'],
+                                            backoff=app.config['COVER_VALIDATION_BACKOFF'])
+    app.extensions['cover_validation'] = cover_validation
+    if app.config['ASYNC_COVER_VALIDATION']:
+        cover_validation.start()
+
+    user_cache = UserCache(ttl=app.config['USER_CACHE_TTL'], max_size=app.config['USER_CACHE_SIZE'])
+    app.extensions['user_cache'] = user_cache
+
+    lending_events = create_event_log(app.config)
+    app.extensions['lending_events'] = lending_events
+
+    page_cache = create_page_cache(app.config)
+    app.extensions['page_cache'] = page_cache
+
+    passwords = create_password_policy(app.config)
+    app.extensions['passwords'] = passwords
+
+    rate_limiter = create_rate_limiter(app.config)
+    app.extensions['rate_limiter'] = rate_limiter
 
     @login_manager.user_loader
     def load_user(user_id):
-        return db.get_or_404(User, user_id)
+        return user_cache.load(int(user_id))
+
+    @app.after_request
+    def stick_to_primary_after_write(response):
+        """Keep a user who has just written on the primary until the replicas have caught up."""
+        if db.session.info.pop('wrote', False) and replicas.engines:
+            session['primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+    def read_only(view):
+        """Run a view that only reads against a read replica, unless the user has written recently."""
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if replicas.engines and session.get('primary_until', 0) < time.time():
+                db.session.info['replica'] = replicas.choose()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                db.session.info.pop('replica', None)
+
+        return wrapper
+
+    def conditional_page(view):
+        """
+        Answer If-None-Match and If-Modified-Since with 304 Not Modified while the catalog has not changed.
+
+        The ETag combines the last catalog change with the user id, because logged-in users see their own buttons.
+        Last-Modified is only sent to anonymous users for the same reason. It has a resolution of one second, so it is
+        only sent once the second of the last change has passed: a later change then falls into a later second and
+        If-Modified-Since cannot hide it. Apply inside read_only, the validator must come from the database that
+        renders the page.
+        """
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+            last_modified = max(filter(None, db.session.execute(queries.catalog_last_modified()).one()),
+                                default=None)
+            if last_modified is None:
+                return view(*args, **kwargs)
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+            user_id = current_user.id if current_user.is_authenticated else 0
+            etag = f"{int(last_modified.timestamp() * 1000)}-{user_id}"
+            send_last_modified = not user_id and time.time() >= int(last_modified.timestamp()) + 1
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (send_last_modified and request.if_modified_since is not None
+                                and last_modified.replace(microsecond=0) <= request.if_modified_since)
+            response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            if send_last_modified:
+                response.last_modified = last_modified
+            response.vary.add('Cookie')
+            return response
+
+        return wrapper
+
+    def rate_limited(rule, methods=None):
+        """
+        Count requests against the per IP and per user buckets of a RATE_LIMITS rule and answer 429 when one is empty.
+
+        The user is the logged-in user or, on the login form, the username being tried.
+        """
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if rate_limiter is not None and (methods is None or request.method in methods):
+                    user = current_user.id if current_user.is_authenticated else request.form.get('username')
+                    retry_after = rate_limiter.hit(rule, ip=request.remote_addr, user=user)
+                    if retry_after:
+                        logger.warning("Rate limit %s exceeded by IP: %s user: %s", rule, request.remote_addr, user)
+                        raise TooManyRequests(retry_after=max(int(retry_after + 0.999), 1))
+                return view(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def cache_anonymous_page(view):
+        """
+        Serve pages shown to anonymous users from the page cache until the catalog changes.
+
+        Pages are rendered from the primary for the cache: a replica that has not caught up with the change that
+        bumped the catalog version would store the old catalog under the new version.
+        """
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if (page_cache is None or request.method != 'GET' or current_user.is_authenticated
+                    or '_flashes' in session):
+                return view(*args, **kwargs)
+
+            def render():
+                replica = db.session.info.pop('replica', None)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    if replica is not None:
+                        db.session.info['replica'] = replica
+
+            return page_cache.get_or_render(f"page:{request.full_path}", render)
+
+        return wrapper
+
+    @app.template_global()
+    def book_card(book, show_reserve, current_page=None, style=None):
+        """
+        Render the catalog card of a book, cached per page and reserve button state.
+
+        Cards of books read from a replica are rendered but not stored, they may be older than the catalog version.
+        """
+
+        def render():
+            return render_template('book_card.html', book=book, show_reserve=show_reserve,
+                                   current_page=current_page, style=style)
+
+        if page_cache is None:
+            return Markup(render())
+        return Markup(page_cache.get_or_render(f"card:{request.endpoint}:{book.id}:{int(bool(show_reserve))}",
+                                               render, store='replica' not in db.session.info))
+
+    def catalog_page(stmt):
+        """Return one page of books ordered by author and title using the cursors from the query string."""
+        per_page = request.args.get('per_page', default=app.config['BOOKS_PER_PAGE'], type=int)
+        per_page = max(1, min(per_page, app.config['MAX_BOOKS_PER_PAGE']))
+        try:
+            return keyset_page(stmt, queries.CATALOG_ORDER,
+                               after=request.args.get('after'),
+                               before=request.args.get('before'),
+                               per_page=per_page)
+        except InvalidCursor:
+            logger.warning("Invalid page cursor after: %s before: %s", request.args.get('after'),
+                           request.args.get('before'))
+            return abort(400)
 
     @app.route('/')
+    @read_only
+    @conditional_page
+    @cache_anonymous_page
     def home():
         """
         Main Page.
 
-        Show all the books in the database.
+        Show the books in the database one page at a time.
         """
-        logger.info(f"User went to Home Page")
-        result = db.session.execute(db.select(Book).where(Book.available_for_lending == True))
-        all_books = result.scalars().all()
-        sorted_books = list(sorted(all_books, key=lambda book: (book.author, book.title)))
-        return render_template("index.html", all_books=sorted_books, user=current_user)
+        logger.info("User went to Home Page")
+        page = catalog_page(queries.catalog_books())
+        return render_template("index.html", all_books=page.items, page=page, user=current_user)
 
     @app.route('/change_duration/<int:user_id>', methods=['POST'])
     @login_required
     def change_duration(user_id):
-        user = db.get_or_404(User, user_id)
         duration = request.form.get('duration')
         if not duration or not duration.isdigit() or not (1 <= int(duration) <= 100):
             flash('Invalid duration value')
-            logger.error(f'User id: {current_user.id} is trying to set invalid duration: {duration}')
+            logger.error("User id: %s is trying to set invalid duration: %s", current_user.id, duration)
             return redirect(url_for('my_books'))
-        if current_user.id != user.id:
-            logger.warning(f"Unauthorized user (id: {current_user.id}) is trying to change lending duration for user "
-                           f"id: {user_id}")
+        if current_user.id != user_id:
+            logger.warning("Unauthorized user (id: %s) is trying to change lending duration for user id: %s",
+                           current_user.id, user_id)
             return abort(401)
+        user = current_user
         user.duration = int(duration)
         db.session.commit()
-        logger.info(f'User id {user.id} changed lending duration to {user.duration}')
+        user_cache.invalidate(user.id)
+        logger.info("User id %s changed lending duration to %s", user.id, user.duration)
         flash("You have successfully changed lending duration")
         return redirect(url_for('my_books'))
 
@@ -99,39 +305,88 @@ def create_app(config_class=None):
         :param book_id: Book id
         :return: redirect to home page.
         """
-        book = db.get_or_404(Book, book_id)
         current_page = request.args.get('current_page', default='home')
-        if not book:
-            flash('Book not found')
-            logger.warning(f"Book id: {book.id} you are trying to return not found")
-            return redirect(url_for(current_page))
-        validate_user = current_user.id == book.owner_id or current_user.id == book.lender_id
-        if not validate_user:
-            logger.info(f'Unauthorized user id:{current_user.id} is trying to return the book id: {book.id}')
+        title = lending.return_book(book_id, current_user.id)
+        if title is None:
+            book = db.get_or_404(Book, book_id)
+            if current_user.id in (book.owner_id, book.lender_id):
+                logger.info("User id: %s tried to return book id: %s that is not lent out", current_user.id, book.id)
+                flash(f'Book "{book.title}" is not lent out', category='danger')
+                return abort(400)
+            logger.info("Unauthorized user id:%s is trying to return the book id: %s", current_user.id, book.id)
             flash("There is no such book you have borrowed!", category='danger')
             return abort(401)
-        book.return_date = None
-        book.reserved = False
-        book.lender_id = None
-        book.lent_out = False
-        db.session.commit()
-        logger.info(f'User id: {current_user.id} returned book id: {book.id} successfully.')
-        flash(f'You have returned book "{book.title}" successfully')
+        logger.info("User id: %s returned book id: %s successfully.", current_user.id, book_id)
+        catalog_changed()
+        lending_events.emit('return', book_id, current_user.id, title=title)
+        flash(f'You have returned book "{title}" successfully')
         return redirect(url_for(current_page))
 
     @app.route('/my_books')
     @login_required
+    @read_only
     def my_books():
         """Filter your own added books and direct to my_books page."""
-        logger.info(f"User id: {current_user.id} entered to My Books page")
-        books = db.session.execute(db.select(Book).where(Book.owner_id == current_user.id)).scalars().all()
-        due_books = [book for book in books if book.return_date is not None
-                     and book.return_date < datetime.now().date()]
-
+        logger.info("User id: %s entered to My Books page", current_user.id)
+        books = db.session.execute(queries.owner_books(current_user.id, date.today())).all()
         if not books:
-            logger.info(f"User id: {current_user.id} has no books to show in My Books page")
+            logger.info("User id: %s has no books to show in My Books page", current_user.id)
             flash("You haven't added any books yet")
-        return render_template("my_books.html", user=current_user, books=books, due_books=due_books)
+        return render_template("my_books.html", user=current_user, books=books, bulk_form=BulkActionForm())
+
+    @app.route('/my_books/bulk', methods=['POST'])
+    @login_required
+    def bulk_my_books():
+        """
+        Activate, deactivate, return or remove many books at once.
+
+        Takes the action and the book ids from the My Books form or from a JSON body {"action": ..., "book_ids": [...]}.
+        JSON requests get the outcome of every book, form posts are redirected back to My Books with a summary.
+        Form posts need the CSRF token of the form. JSON bodies cannot be sent cross-site without a CORS preflight.
+        """
+        if request.is_json:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict) or not isinstance(data.get('book_ids'), list):
+                return abort(400)
+            action, raw_ids = data.get('action'), data['book_ids']
+            # bool is an int subclass, true would otherwise act on book 1.
+            if not all(type(book_id) is int for book_id in raw_ids):
+                return abort(400)
+            book_ids = list(dict.fromkeys(raw_ids))
+        else:
+            if not BulkActionForm().validate_on_submit():
+                logger.warning("User id: %s sent a bulk action without a valid CSRF token", current_user.id)
+                return abort(400)
+            action, raw_ids = request.form.get('action'), request.form.getlist('book_ids')
+            try:
+                book_ids = list(dict.fromkeys(int(book_id) for book_id in raw_ids))
+            except ValueError:
+                return abort(400)
+        if action not in lending.BULK_ACTIONS or not book_ids or len(book_ids) > app.config['BULK_ACTION_MAX_BOOKS']:
+            logger.warning("User id: %s sent an invalid bulk action %s for %s books", current_user.id, action,
+                           len(book_ids))
+            return abort(400)
+        changed, failed = lending.bulk_action(action, book_ids, current_user.id)
+        logger.info("User id: %s bulk %s changed %s books, skipped %s", current_user.id, action, len(changed),
+                    len(failed))
+        if changed:
+            catalog_changed()
+        if action in ('return', 'remove'):
+            for book_id, title in changed.items():
+                lending_events.emit(action, book_id, current_user.id, title=title)
+        if request.is_json:
+            return jsonify(action=action,
+                           results=[{'id': book_id, 'success': True, 'title': changed[book_id]} if book_id in changed
+                                    else {'id': book_id, 'success': False, 'error': failed[book_id]}
+                                    for book_id in book_ids])
+        past_tense = {'activate': 'activated for lending', 'deactivate': 'set to unavailable for lending',
+                      'return': 'marked as returned', 'remove': 'removed'}
+        if changed:
+            flash(f"{len(changed)} book{'s' if len(changed) != 1 else ''} {past_tense[action]}.")
+        if failed:
+            flash(f"Skipped {len(failed)} book{'s' if len(failed) != 1 else ''}: "
+                  + ', '.join(f"{book_id} ({reason})" for book_id, reason in failed.items()))
+        return redirect(url_for('my_books'))
 
     @app.route('/activate_to_borrow/<int:book_id>')
     @login_required
@@ -146,27 +401,28 @@ def create_app(config_class=None):
                 book.available_for_lending = True
                 message = f"Book {book.title} is set to available for lending."
             db.session.commit()
-            logger.info(f"(Book id: {book.id}){message}")
+            catalog_changed()
+            logger.info("(Book id: %s)%s", book.id, message)
             return jsonify(success=True, message=message)
         else:
-            logger.warning(f'Unauthorized user trying to (de)activate book {book.title}!')
+            logger.warning("Unauthorized user trying to (de)activate book %s!", book.title)
             return jsonify(success=False, error="You are not authorized to do that action."), 401
 
     @app.route('/my_reserved_books')
     @login_required
+    @read_only
     def my_reserved_books():
         """Find books that you have reserved and direct the user to the my_reserved_books page."""
-        logger.info(f"User id: {current_user.id} entered reserved books page.")
-        books = db.session.execute(db.select(Book).where(Book.book_lender == current_user)
-                                   .order_by(Book.id)).scalars().all()
-        due_books = [book for book in books if book.return_date is not None and book.return_date < datetime.now()]
+        logger.info("User id: %s entered reserved books page.", current_user.id)
+        books = db.session.execute(queries.lender_books(current_user.id, date.today())).all()
         if not books:
-            logger.info(f"User id: {current_user.id} has no reserved books.")
+            logger.info("User id: %s has no reserved books.", current_user.id)
             flash("You have no books reserved.")
-        return render_template("my_reserved_books.html", my_books=books, user=current_user, due_books=due_books)
+        return render_template("my_reserved_books.html", my_books=books, user=current_user)
 
     @app.route('/reserve_book/<int:book_id>', methods=['GET', 'POST'])
     @login_required
+    @rate_limited('reserve_book')
     def reserve_book(book_id):
         """
         Reserve book if it's not reserved yet.
@@ -174,23 +430,27 @@ def create_app(config_class=None):
         :param book_id: Book.id
         :return: redirect to home page
         """
-        book = db.get_or_404(Book, book_id)
         current_page = request.args.get('current_page', default='home')
+        title = lending.reserve_book(book_id, current_user.id)
+        if title is not None:
+            logger.info('Book id"%s" has been reserved for user id: %s', book_id, current_user.id)
+            catalog_changed()
+            lending_events.emit('reserve', book_id, current_user.id, title=title)
+            flash(f'Book "{title}" is reserved for You')
+            return redirect(url_for(current_page))
+        book = db.session.get(Book, book_id)
         if not book:
-            logger.warning(f"User id: {current_user.id} tried to reserve book with id {book_id}. Book not found.")
+            logger.warning("User id: %s tried to reserve book with id %s. Book not found.", current_user.id, book_id)
             return abort(404)
         if book.owner_id == current_user.id:
             flash('You cannot reserve your own book!')
-            logger.debug(f"Book owner (user id: {current_user.id}) tries to reserve his own book!")
-            return redirect(url_for(current_page))
-        if not book.reserved:
-            book.reserved = True
-            book.lender_id = current_user.id
-            db.session.commit()
-            logger.info(f'Book id"{book.id}" has been reserved for user id: {book.lender_id}')
-            flash(f'Book "{book.title}" is reserved for You')
+            logger.debug("Book owner (user id: %s) tries to reserve his own book!", current_user.id)
+        elif book.pending_validation or not book.available_for_lending:
+            logger.warning("User id: %s tried to reserve book id: %s that is not available for lending",
+                           current_user.id, book.id)
+            flash(f'Book "{book.title}" is not available for lending')
         else:
-            logger.warning(f'Book id:{book.id} is already reserved for user id: {book.lender_id}')
+            logger.warning("Book id:%s is already reserved for user id: %s", book.id, book.lender_id)
             flash(f'Book "{book.title}" is already reserved')
         return redirect(url_for(current_page))
 
@@ -203,101 +463,104 @@ def create_app(config_class=None):
         :param book_id: Book.id
         :return: redirect to my_reserved_books page
         """
-        book = db.get_or_404(Book, book_id)
         current_page = request.args.get('current_page', default='home')
-        if book and not book.lent_out:
-            if book.book_lender == current_user or book.book_owner == current_user:
-                user = db.get_or_404(User, current_user.id)
-                current_date = datetime.now().date()
-                new_date = current_date + timedelta(days=user.duration)
-                book.return_date = new_date
-                book.lent_out = True
-                db.session.commit()
-                logger.info(f'Lender id: {current_user.id} received the book id: "{book.id}"')
-                flash(f'Book "{book.title}" is handed over to lender.')
-            else:
-                logger.info(f"User id: {current_user.id} tried to receive book id: {book_id} that doesn't exists.")
-                flash("You are not allowed to make these changes!")
-                return abort(401)
+        title = lending.receive_book(book_id, current_user.id, current_user.duration)
+        if title is not None:
+            logger.info('Lender id: %s received the book id: "%s"', current_user.id, book_id)
+            lending_events.emit('receive', book_id, current_user.id, title=title, duration=current_user.duration)
+            flash(f'Book "{title}" is handed over to lender.')
             return redirect(url_for(current_page, user=current_user))
-        else:
-            logger.warning(f"User id: {current_user.id} tried to receive book id: {book_id}. Book already received.")
+        book = db.get_or_404(Book, book_id)
+        if book.lent_out or not book.reserved:
+            logger.warning("User id: %s tried to receive book id: %s. Book already received or not reserved.",
+                           current_user.id, book_id)
             return abort(400)
+        logger.info("User id: %s tried to receive book id: %s that doesn't exists.", current_user.id, book_id)
+        flash("You are not allowed to make these changes!")
+        return abort(401)
 
     @app.route('/cancel_reservation/<int:book_id>', methods=['GET', 'POST'])
     @login_required
     def cancel_reservation(book_id):
         """Validate that current user is book lender or book owner and cancel the reservation."""
-        book = db.get_or_404(Book, book_id)
         current_page = request.args.get('current_page', default='home')
-        if not book:
-            logger.warning(f"User id: {current_user.id} is trying to cancel the reservation of the"
-                           f" book id: {book.id} that doesn't exist.")
+        title = lending.cancel_reservation(book_id, current_user.id)
+        if title is not None:
+            logger.info("Book id: %s reservation has been cancelled successfully by user id: %s",
+                        book_id, current_user.id)
+            lending_events.emit('cancel', book_id, current_user.id, title=title)
+            catalog_changed()
+            flash(f'Book "{title}" reservation is successfully cancelled')
             return redirect(url_for(current_page))
-        if book.owner_id == current_user.id or book.book_lender == current_user:
-            if not book.reserved:
-                logger.warning(f"User id: {current_user.id} is trying to cancel the book id: {book.id}"
-                               f" reservation while book is not reserved.")
-                return abort(404)
-            book.reserved = False
-            book.book_lender = None
-            db.session.commit()
-            logger.info(f"Book id: {book.id} reservation has been cancelled successfully by user id: {current_user.id}")
-            flash(f'Book "{book.title}" reservation is successfully cancelled')
-        else:
-            logger.warning(f"User id: {current_user.id} is trying to cancel the reservation of the book id: {book.id}")
+        book = db.get_or_404(Book, book_id)
+        if book.owner_id != current_user.id and book.lender_id != current_user.id:
+            logger.warning("User id: %s is trying to cancel the reservation of the book id: %s",
+                           current_user.id, book.id)
             return abort(401)
-        return redirect(url_for(current_page))
+        if book.lent_out:
+            logger.warning("User id: %s is trying to cancel the book id: %s reservation while book is lent out.",
+                           current_user.id, book.id)
+            return abort(400)
+        logger.warning("User id: %s is trying to cancel the book id: %s reservation while book is not reserved.",
+                       current_user.id, book.id)
+        return abort(404)
 
     @app.route('/available_books', methods=['GET', 'POST'])
+    @read_only
+    @conditional_page
+    @cache_anonymous_page
     def available_books():
         """Return a list of available books that not reserved and direct to available books page."""
-        books = (db.session.execute(db.select(Book).where(Book.reserved == False, Book.available_for_lending == True))
-                 .scalars().all())
-        sorted_books = list(sorted(books, key=lambda book: (book.author, book.title)))
-        logger.info(f"User went to page: Available books")
-        if not books:
+        page = catalog_page(queries.available_books())
+        logger.info("User went to page: Available books")
+        if not page.items:
             logger.debug("There's no available books. Returning empty list")
-        return render_template("available_books.html", available_books=sorted_books, user=current_user)
+        return render_template("available_books.html", available_books=page.items, page=page, user=current_user)
 
     @app.route('/searchbar/', methods=['GET'])
+    @rate_limited('searchbar')
+    @read_only
+    @conditional_page
     def searchbar():
         """
         Return a list of books that books author or title contains a search query and redirect to searchbar result page.
         """
         query = request.args.get('query')
+        page = max(request.args.get('page', default=1, type=int), 1)
+        has_next = False
         if query and len(query) > 0 and not query.isspace():
-            query_books = db.session.execute(db.select(Book)
-                                             .where(or_(Book.title.like(f"%{query}%"),
-                                                        Book.author.like(f"%{query}%")))
-                                             .order_by(Book.title)).scalars().all()
+            query_books, has_next = search_books(query, page=page, per_page=app.config['SEARCH_RESULTS_PER_PAGE'])
         else:
             query_books = []
             flash("Wrong input")
         if current_user.is_authenticated:
-            logger.info(f"User id: {current_user.id} search query: {query}")
+            logger.info("User id: %s search query: %s", current_user.id, query)
         else:
-            logger.info(f"Not authenticated user search query: {query}")
-        return render_template("searchbar.html", query_books=query_books, user=current_user, query=query)
+            logger.info("Not authenticated user search query: %s", query)
+        return render_template("searchbar.html", query_books=query_books, user=current_user, query=query,
+                               page=page, has_next=has_next)
 
     @app.route('/remove_book/<int:book_id>')
     @login_required
     def remove_book(book_id):
         """Remove a book from the database. Validate that book is not lent out and user is the owner of the book."""
-        logger.info(f"User id: {current_user.id} entered remove_book with Book id: {book_id}")
+        logger.info("User id: %s entered remove_book with Book id: %s", current_user.id, book_id)
         book = db.get_or_404(Book, book_id)
         current_page = request.args.get('current_page', default='home')
         if current_user.id != book.owner_id:
-            logger.error(f"User id: {current_user.id} failed to remove book id: {book_id}. User is not the owner of "
-                         f"the book")
+            logger.error("User id: %s failed to remove book id: %s. User is not the owner of the book",
+                         current_user.id, book_id)
             return abort(401)
         if book.lent_out or book.reserved:
-            logger.error(f"User id: {current_user.id} is unable to remove book id: {book_id}. Book is lent out.")
+            logger.error("User id: %s is unable to remove book id: %s. Book is lent out.", current_user.id, book_id)
             return abort(400)
         db.session.delete(book)
+        record_deletion()
         db.session.commit()
+        catalog_changed()
+        lending_events.emit('remove', book_id, current_user.id, title=book.title)
         flash(f"Book {book.title} has been removed successfully")
-        logger.info(f"User id: {current_user.id} removed successfully his own book id: {book_id}.")
+        logger.info("User id: %s removed successfully his own book id: %s.", current_user.id, book_id)
         return redirect(url_for(current_page))
 
     @app.route('/add_book', methods=['GET', 'POST'])
@@ -305,23 +568,25 @@ def create_app(config_class=None):
     def add_book():
         """Create and add a new book to the lending environment. Validate and direct user to the book adding page."""
         form = NewBookForm()
-        user = db.get_or_404(User, current_user.id)
-        logger.info(f"User id: {current_user.id} went to add a new book page")
-        if user and form.validate_on_submit():
+        user = current_user
+        logger.info("User id: %s went to add a new book page", current_user.id)
+        if form.validate_on_submit():
             title = form.title.data
             author = form.author.data.title()
             image_url = form.image_url.data
-            if not check_image_url(image_url):
-                flash("Image URL is not valid. Please try again.")
-                logger.error(f"User id: {current_user.id} failed to add book cover Image URL: {image_url} is not valid")
-                return render_template('add_book.html', form=form, user=current_user)
-            all_db_books = Book.query.all()
-            existing_book = [book for book in all_db_books if title.lower() == book.title.lower() and author.lower() ==
-                             book.author.lower()]
+            existing_book = db.session.execute(db.select(Book.id)
+                                               .where(Book.normalized_key == normalize_book_key(title, author))
+                                               ).first()
             if existing_book:
-                logger.warning(f"User id: {current_user.id} failed to add book that already exists: {title}")
+                logger.warning("User id: %s failed to add book that already exists: %s", current_user.id, title)
                 flash("A book with this title already exists.", "danger")
                 return redirect(url_for('add_book'))
+            validate_later = app.config['ASYNC_COVER_VALIDATION']
+            if not validate_later and not check_image_url(image_url):
+                flash("Image URL is not valid. Please try again.")
+                logger.error("User id: %s failed to add book cover Image URL: %s is not valid",
+                             current_user.id, image_url)
+                return render_template('add_book.html', form=form, user=current_user)
             new_book = Book(title=title,
                             author=author,
                             image_url=image_url,
@@ -329,16 +594,58 @@ def create_app(config_class=None):
                             reserved=False,
                             lent_out=False,
                             owner_id=user.id,
-                            available_for_lending=True)
+                            available_for_lending=True,
+                            pending_validation=validate_later)
             db.session.add(new_book)
-            db.session.commit()
-            flash("Book added successfully")
-            logger.info(f"User id: {current_user.id} created new book and added book into database: {new_book.title}, "
-                        f"id: {new_book.id}")
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                logger.warning("User id: %s failed to add book that was added concurrently: %s", current_user.id, title)
+                flash("A book with this title already exists.", "danger")
+                return redirect(url_for('add_book'))
+            catalog_changed()
+            if validate_later:
+                cover_validation.submit(new_book.id, image_url)
+                flash("Book added successfully. It will be shown to others once its cover image is checked.")
+            else:
+                flash("Book added successfully")
+            logger.info("User id: %s created new book and added book into database: %s, id: %s",
+                        current_user.id, new_book.title, new_book.id)
+            lending_events.emit('add', new_book.id, current_user.id, title=new_book.title)
             return redirect(url_for('home'))
         return render_template("add_book.html", form=form, user=current_user)
 
+    @app.route('/export/<scope>')
+    @login_required
+    def export_books(scope):
+        """
+        Stream the user's books, the user's reservations or, for EXPORT_ADMINS, every book as a CSV or JSON lines file.
+        """
+        file_format = request.args.get('format', default='csv')
+        if scope not in EXPORT_SCOPES or file_format not in EXPORT_FORMATS:
+            return abort(404)
+        if scope == 'catalog' and current_user.username not in app.config['EXPORT_ADMINS']:
+            logger.warning("User id: %s is trying to export the whole catalog", current_user.id)
+            return abort(401)
+        logger.info("User id: %s exports %s as %s", current_user.id, scope, file_format)
+        chunks = export_chunks(scope, file_format, user_id=current_user.id, batch_size=app.config['EXPORT_BATCH_SIZE'])
+        return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[file_format],
+                        headers={'Content-Disposition': f'attachment; filename={scope}.{file_format}'})
+
+    app.register_blueprint(api_v1)
+
+    if 'instrumentation' in app.extensions:
+        @app.route('/metrics')
+        def metrics():
+            """Return request, SQL, cover validation and rate limiter statistics in the Prometheus text format."""
+            body = app.extensions['instrumentation'].render() + cover_validation.render()
+            if rate_limiter is not None:
+                body += rate_limiter.render()
+            return Response(body, mimetype='text/plain; version=0.0.4')
+
     @app.route('/register', methods=['GET', 'POST'])
+    @rate_limited('register', methods=('POST',))
     def register():
         """
         Register new user to environment.
@@ -351,21 +658,22 @@ def create_app(config_class=None):
             last_name = form.last_name.data
             email = form.email.data
             username = form.username.data
-            password = generate_password_hash(
-                form.password.data,
-                method='pbkdf2:sha256',
-                salt_length=8
-            )
             existing_mail = db.session.execute(db.select(User).where(User.email == email)).scalar()
             if existing_mail:
-                logger.warning(f"User failed to create new user. Email: {email} address already exists.")
+                logger.warning("User failed to create new user. Email: %s address already exists.", email)
                 flash('This email address already exists. Try to login instead.')
                 return redirect(url_for('login'))
             existing_username = db.session.execute(db.select(User).where(User.username == username)).scalar()
             if existing_username:
-                logger.warning(f"User failed to register with username: {username}. Username already exists.")
+                logger.warning("User failed to register with username: %s. Username already exists.", username)
                 flash('This username already exists.')
                 return render_template('register.html', form=form, user=current_user)
+            try:
+                password = passwords.hash(form.password.data)
+            except PasswordHashingBusy:
+                logger.warning("Registration of username: %s rejected, password hashing is overloaded.", username)
+                flash('The server is busy. Please try again in a moment.')
+                return render_template('register.html', form=form, user=current_user), 503
             new_user = User(first_name=first_name.title(),
                             last_name=last_name.title(),
                             email=email,
@@ -375,12 +683,13 @@ def create_app(config_class=None):
             db.session.commit()
             login_user(new_user)
             flash('Your account has been created successfully.')
-            logger.info(f"Created new user:\nFirst name: {new_user.first_name}\nLast name: {new_user.last_name}"
-                        f"\nemail: {new_user.email}\nUsername: {new_user.username}")
+            logger.info("Created new user:\nFirst name: %s\nLast name: %s\nemail: %s\nUsername: %s",
+                        new_user.first_name, new_user.last_name, new_user.email, new_user.username)
             return redirect(url_for('home'))
         return render_template("register.html", form=form, user=current_user)
 
     @app.route('/login', methods=['GET', 'POST'])
+    @rate_limited('login', methods=('POST',))
     def login():
         """Validate user username and password to log user in."""
         form = LoginForm()
@@ -390,15 +699,33 @@ def create_app(config_class=None):
             user = db.session.execute(db.select(User).where(User.username == username)).scalar()
             if not user:
                 flash('Invalid Username. Please try again')
-                logger.debug(f"Failed as inserted username: {username} that not exists.")
+                logger.debug("Failed as inserted username: %s that not exists.", username)
                 return redirect(url_for('login'))
-            if not check_password_hash(user.password, password):
+            try:
+                valid = passwords.verify(user.password, password)
+            except PasswordHashingBusy:
+                logger.warning("Login of username: %s rejected, password hashing is overloaded.", username)
+                flash('The server is busy. Please try again in a moment.')
+                return render_template('login.html', form=form, user=current_user), 503
+            if not valid:
                 flash('Invalid password. Please try again')
-                logger.debug(f" Username: {username} failed as inserted wrong password")
+                logger.debug(" Username: %s failed as inserted wrong password", username)
                 return render_template('login.html', form=form, user=current_user)
+            if passwords.needs_rehash(user.password):
+                # The upgrade is best effort, the password was verified and the next login tries again.
+                try:
+                    user.password = passwords.hash(password)
+                    db.session.commit()
+                except PasswordHashingBusy:
+                    db.session.rollback()
+                    logger.warning("Password hash of user id: %s not upgraded, password hashing is overloaded.",
+                                   user.id)
+                else:
+                    user_cache.invalidate(user.id)
+                    logger.info("Password hash of user id: %s upgraded to %s", user.id, passwords.method)
             flash(f"Logged in successfully as {user.first_name}.")
             login_user(user, remember=form.remember_me.data)
-            logger.info(f"User id: {current_user.id} and username: {username} logged in.")
+            logger.info("User id: %s and username: %s logged in.", current_user.id, username)
             return redirect(url_for('home'))
         return render_template("login.html", form=form, user=current_user)
 
@@ -408,10 +735,118 @@ def create_app(config_class=None):
         """Logout current user and redirect to home page."""
         user_id = current_user.id
         logout_user()
-        logger.info(f"User id: {user_id} logged out.")
+        user_cache.invalidate(user_id)
+        logger.info("User id: %s logged out.", user_id)
         flash("You have been logged out. Hopefully we'll see you soon.")
         return redirect(url_for('home'))
 
+    @app.cli.command('validate-covers')
+    def validate_covers_command():
+        """Validate cover images of all books that are waiting for validation."""
+        processed = validate_pending_books(cover_validation)
+        print(f"Validated {processed} pending books. {cover_validation.stats()}")
+
+    @app.cli.command('send-reminders')
+    @click.option('--date', 'run_date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='Run date, defaults to today.')
+    @click.option('--every', type=int, default=0, help='Keep running and sweep every N seconds.')
+    def send_reminders_command(run_date, every):
+        """Send reminders about overdue and soon due books to lenders and owners."""
+        while True:
+            loans, reminders = sweep_reminders(create_sink(app.config),
+                                               today=run_date.date() if run_date else None,
+                                               due_soon_days=app.config['REMINDER_DUE_SOON_DAYS'],
+                                               batch_size=app.config['REMINDER_BATCH_SIZE'],
+                                               checkpoint=Checkpoint(app.config['REMINDER_CHECKPOINT']))
+            print(f"Sent {reminders} reminders for {loans} loans.")
+            if not every:
+                return
+            time.sleep(every)
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Create the database or apply pending schema migrations."""
+        applied = upgrade_schema(db.engine)
+        print(f"Applied migrations: {applied}" if applied else "Database schema is up to date.")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Verify that every listing route query reads the books table through an index."""
+        with db.engine.begin() as connection:
+            results = check_query_plans(connection)
+        for name, (indexed, plan) in results.items():
+            print(f"{'OK  ' if indexed else 'SCAN'} {name}: {'; '.join(plan)}")
+        if not all(indexed for indexed, _ in results.values()):
+            raise SystemExit(1)
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from the books table."""
+        with db.engine.begin() as connection:
+            rebuild_search_index(connection)
+        print(f"Search index rebuilt ({app.extensions['book_search']}).")
+
+    @app.cli.command('calibrate-password-hash')
+    @click.option('--algorithm', type=click.Choice(['pbkdf2', 'scrypt', 'argon2']), default='pbkdf2')
+    @click.option('--target-ms', type=float, default=250.0, help='Time one hash should take on this machine.')
+    def calibrate_password_hash_command(algorithm, target_ms):
+        """Find the hashing cost that takes about the target time and print it as PASSWORD_HASH_METHOD."""
+        method, elapsed = calibrate(algorithm, target_ms)
+        print(f"PASSWORD_HASH_METHOD = '{method}'  # {elapsed:.0f} ms per hash, "
+              f"current: '{passwords.method}' ({app.config['PASSWORD_HASH_WORKERS']} hashing workers)")
+
+    @app.cli.command('import-books')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--owner', required=True, help='Username of the user who lends the imported books.')
+    @click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None,
+                  help='File format, defaults to the one of the file extension.')
+    @click.option('--errors', 'errors_path', default='import_errors.csv', help='Report of the rejected rows.')
+    @click.option('--batch-size', type=int, default=None, help='Rows per INSERT, defaults to IMPORT_BATCH_SIZE.')
+    @click.option('--skip-cover-check', is_flag=True,
+                  help='Store the books as pending, validate-covers publishes them later.')
+    def import_books_command(path, owner, file_format, errors_path, batch_size, skip_cover_check):
+        """Import books from a CSV or JSON lines file with the columns title, author and image_url."""
+        owner_id = db.session.execute(db.select(User.id).where(User.username == owner)).scalar()
+        if owner_id is None:
+            raise click.BadParameter(f"No user with username '{owner}'", param_hint='--owner')
+        with open(path, newline='', encoding='utf-8-sig') as file, ErrorReport(errors_path) as error_report:
+            importer = BookImporter(owner_id,
+                                    batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'],
+                                    check_covers=not skip_cover_check,
+                                    cover_workers=app.config['IMPORT_COVER_WORKERS'],
+                                    events=lending_events,
+                                    on_error=error_report.write)
+            report = importer.run(read_rows(file, file_format or detect_format(path)))
+        print(f"Imported {report.imported} books, rejected {report.rejected} rows.")
+        if report.rejected:
+            print(f"Rejected rows are listed in {errors_path}")
+
+    @app.cli.command('export-books')
+    @click.option('--scope', type=click.Choice(EXPORT_SCOPES), default='catalog')
+    @click.option('--user', 'username', default=None, help='Username whose books or reservations are exported.')
+    @click.option('--format', 'file_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+    @click.option('--output', type=click.File('wb'), default='-', help='Output file, defaults to stdout.')
+    def export_books_command(scope, username, file_format, output):
+        """Export the books of a user, the reservations of a user or the whole catalog."""
+        user_id = None
+        if scope != 'catalog':
+            if not username:
+                raise click.UsageError(f"--user is required to export {scope}")
+            user_id = db.session.execute(db.select(User.id).where(User.username == username)).scalar()
+            if user_id is None:
+                raise click.BadParameter(f"No user with username '{username}'", param_hint='--user')
+        for chunk in export_chunks(scope, file_format, user_id=user_id, batch_size=app.config['EXPORT_BATCH_SIZE']):
+            output.write(chunk)
+
+    @app.cli.command('lending-stats')
+    @click.option('--file', 'path', default=None, help='Event file, defaults to LENDING_EVENTS_FILE.')
+    @click.option('--top', type=int, default=10, help='Number of most lent books to show.')
+    def lending_stats_command(path, top):
+        """Print loans per day, mean loan duration and the most lent books from the lending event log."""
+        lending_events.flush()
+        summary = aggregate_events(read_events(path or app.config['LENDING_EVENTS_FILE']), top=top)
+        print(json.dumps(summary, indent=2))
+
     return app
 
 
@@ -1,22 +1,71 @@
-from datetime import date
+from datetime import date, datetime, timezone
 
-from sqlalchemy import Integer, String, Date, Boolean
+from sqlalchemy import Integer, String, Date, DateTime, Boolean, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, Relationship
 
 from models.database import db
 
 
+def normalize_book_key(title, author):
+    """Return case-folded and whitespace collapsed title and author that identify the same book."""
+    return f"{' '.join(title.casefold().split())}|{' '.join(author.casefold().split())}"
+
+
+def utcnow():
+    """Current UTC time without time zone, as stored in DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def default_normalized_key(context):
+    parameters = context.get_current_parameters()
+    return normalize_book_key(parameters['title'], parameters['author'])
+
+
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        Index('ix_books_catalog', 'author', 'title', 'id',
+              sqlite_where=text('available_for_lending = 1 AND pending_validation = 0'),
+              postgresql_where=text('available_for_lending AND NOT pending_validation')),
+        Index('ix_books_available', 'author', 'title', 'id',
+              sqlite_where=text('reserved = 0 AND available_for_lending = 1 AND pending_validation = 0'),
+              postgresql_where=text('NOT reserved AND available_for_lending AND NOT pending_validation')),
+        Index('ix_books_return_date', 'return_date', 'id',
+              sqlite_where=text('return_date IS NOT NULL'),
+              postgresql_where=text('return_date IS NOT NULL')),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[String] = mapped_column(String(250), nullable=False, unique=True)
     author: Mapped[String] = mapped_column(String(250), nullable=False)
+    normalized_key: Mapped[String] = mapped_column(String(510), nullable=False, unique=True, index=True,
+                                                   default=default_normalized_key)
     image_url: Mapped[String] = mapped_column(String(250), nullable=False)
     return_date: Mapped[date] = mapped_column(Date, nullable=True, default=None)
     reserved: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     lent_out: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     available_for_lending: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
-    owner_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("users.id"), nullable=False)
+    pending_validation: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True)
+    owner_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     book_owner = Relationship('User', foreign_keys=[owner_id], back_populates='my_books')
-    lender_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("users.id"), nullable=True)
+    lender_id: Mapped[int] = mapped_column(Integer, db.ForeignKey("users.id"), nullable=True, index=True)
     book_lender = Relationship('User', foreign_keys=[lender_id], back_populates='reserved_books')
+
+
+class CatalogState(db.Model):
+    """
+    Single row holding the time of the last book deletion.
+
+    Together with the newest Book.updated_at it tells when the catalog last changed; a deleted book leaves no
+    updated_at behind.
+    """
+    __tablename__ = 'catalog_state'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=utcnow)
+
+
+def record_deletion():
+    """Remember that books were deleted. Runs in the caller's transaction."""
+    updated = db.session.execute(db.update(CatalogState).where(CatalogState.id == 1).values(deleted_at=utcnow()))
+    if not updated.rowcount:
+        db.session.add(CatalogState(id=1))
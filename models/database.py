@@ -1,9 +1,95 @@
+import itertools
+import logging
+import threading
+import time
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import DeclarativeBase
 
+logger = logging.getLogger(__name__)
+
 
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+class RoutingSession(Session):
+    """
+    Session that reads from a replica engine while one is set in info['replica'].
+
+    Only SELECT statements go to the replica; flushes, INSERT, UPDATE and DELETE always use the primary. A write sets
+    info['wrote'] so the caller can keep the user on the primary while the replicas catch up.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self._flushing and isinstance(clause, Select):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def remember_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
+
+
+class ReplicaRouter:
+    """
+    Pick read replicas round-robin, skipping replicas that failed their last health check.
+
+    A replica is checked with SELECT 1 when it is picked and its last check is older than check_interval seconds.
+    """
+
+    def __init__(self, engines, check_interval=10.0):
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(range(len(self.engines)))
+        self._checked = [0.0] * len(self.engines)
+        self._healthy = [True] * len(self.engines)
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """Return a healthy replica engine or None if there is none."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                index = next(self._cycle)
+            if self._is_healthy(index):
+                return self.engines[index]
+        return None
+
+    def _is_healthy(self, index):
+        if time.monotonic() - self._checked[index] < self.check_interval:
+            return self._healthy[index]
+        try:
+            with self.engines[index].connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except DBAPIError:
+            logger.warning("Read replica %s failed its health check", self.engines[index].url)
+            healthy = False
+        self._checked[index] = time.monotonic()
+        self._healthy[index] = healthy
+        return healthy
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the PRAGMA statements on every new connection of a SQLite engine."""
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
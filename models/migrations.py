@@ -0,0 +1,149 @@
+"""
+Versioned schema migrations.
+
+A fresh database is created from the models and stamped with the latest version. An existing database is upgraded
+by running every migration newer than the version stored in the schema_version table, each in its own transaction.
+Migrations are written so that running them against a schema that already has the change is harmless.
+"""
+import logging
+
+from sqlalchemy import inspect, text, bindparam
+
+from models.book import normalize_book_key, utcnow
+from models.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def book_columns(connection):
+    return {column['name'] for column in inspect(connection).get_columns('books')}
+
+
+def add_normalized_keys(connection, batch_size=1000):
+    """
+    Add and backfill books.normalized_key on databases created before the column existed.
+
+    Rows are backfilled in batches. If old data already contains the same book twice, the later copies get the book
+    id appended to their key so that the unique index can still be created.
+
+    :param connection: SQLAlchemy connection inside a transaction
+    :param batch_size: number of rows updated per statement
+    """
+    if 'normalized_key' not in book_columns(connection):
+        connection.execute(text("ALTER TABLE books ADD COLUMN normalized_key VARCHAR(510)"))
+        logger.info("Added column books.normalized_key")
+    update = text("UPDATE books SET normalized_key = :key WHERE id = :book_id")
+    existing = text("SELECT normalized_key FROM books WHERE normalized_key IN :keys").bindparams(
+        bindparam('keys', expanding=True))
+    backfilled = 0
+    while True:
+        rows = connection.execute(text("SELECT id, title, author FROM books WHERE normalized_key IS NULL "
+                                       "ORDER BY id LIMIT :limit"), {'limit': batch_size}).all()
+        if not rows:
+            break
+        keys = {row.id: normalize_book_key(row.title, row.author) for row in rows}
+        taken = set(connection.execute(existing, {'keys': list(set(keys.values()))}).scalars())
+        parameters = []
+        for book_id, key in keys.items():
+            if key in taken:
+                logger.warning("Book id: %s duplicates an existing book, storing it under a unique key", book_id)
+                key = f"{key}|{book_id}"
+            taken.add(key)
+            parameters.append({'key': key, 'book_id': book_id})
+        connection.execute(update, parameters)
+        backfilled += len(parameters)
+    if backfilled:
+        logger.info("Backfilled normalized_key for %s books", backfilled)
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_books_normalized_key ON books (normalized_key)"))
+
+
+def add_pending_validation(connection):
+    """Add books.pending_validation. Existing books have already been validated."""
+    if 'pending_validation' not in book_columns(connection):
+        connection.execute(text("ALTER TABLE books ADD COLUMN pending_validation BOOLEAN NOT NULL DEFAULT false"))
+        logger.info("Added column books.pending_validation")
+
+
+# (name, columns, SQLite condition, Postgres condition) as of migration 3. Later index changes need a new migration,
+# this list must not follow the models.
+LOOKUP_INDEXES = (
+    ('ix_books_catalog', 'author, title, id', 'available_for_lending = 1 AND pending_validation = 0',
+     'available_for_lending AND NOT pending_validation'),
+    ('ix_books_available', 'author, title, id',
+     'reserved = 0 AND available_for_lending = 1 AND pending_validation = 0',
+     'NOT reserved AND available_for_lending AND NOT pending_validation'),
+    ('ix_books_return_date', 'return_date, id', 'return_date IS NOT NULL', 'return_date IS NOT NULL'),
+    ('ix_books_owner_id', 'owner_id', None, None),
+    ('ix_books_lender_id', 'lender_id', None, None),
+)
+
+
+def add_lookup_indexes(connection):
+    """Create the indexes used by the catalog, My Books, Reserved Books and the overdue queries."""
+    for name, columns, sqlite_where, postgresql_where in LOOKUP_INDEXES:
+        where = sqlite_where if connection.dialect.name == 'sqlite' else postgresql_where
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON books ({columns})"
+                                + (f" WHERE {where}" if where else '')))
+
+
+def add_updated_at(connection):
+    """Add books.updated_at, set it to the migration time for existing books and index it."""
+    if 'updated_at' not in book_columns(connection):
+        connection.execute(text("ALTER TABLE books ADD COLUMN updated_at TIMESTAMP"))
+        logger.info("Added column books.updated_at")
+    connection.execute(text("UPDATE books SET updated_at = :now WHERE updated_at IS NULL"), {'now': utcnow()})
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_books_updated_at ON books (updated_at)"))
+
+
+MIGRATIONS = [
+    (1, "Add normalized book key", add_normalized_keys),
+    (2, "Add pending cover validation state", add_pending_validation),
+    (3, "Add lookup indexes for hot queries", add_lookup_indexes),
+    (4, "Add book modification time", add_updated_at),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection):
+    create_version_table(connection)
+    return connection.execute(text("SELECT max(version) FROM schema_version")).scalar() or 0
+
+
+def create_version_table(connection):
+    connection.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+
+
+def set_schema_version(connection, version):
+    create_version_table(connection)
+    connection.execute(text("DELETE FROM schema_version"))
+    connection.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {'version': version})
+
+
+def upgrade_schema(engine):
+    """
+    Create or upgrade the database schema.
+
+    :param engine: SQLAlchemy engine
+    :return: list of applied migration versions
+    """
+    with engine.begin() as connection:
+        fresh = not inspect(connection).has_table('books')
+        if fresh:
+            db.metadata.create_all(connection)
+            set_schema_version(connection, LATEST_VERSION)
+            logger.info("Created database schema version %s", LATEST_VERSION)
+            return []
+        version = get_schema_version(connection)
+        # Tables added to the models after the database was created
+        db.metadata.create_all(connection)
+    applied = []
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            set_schema_version(connection, migration_version)
+        logger.info("Applied migration %s: %s", migration_version, description)
+        applied.append(migration_version)
+    return applied
@@ -0,0 +1,45 @@
+from sqlalchemy import and_, func
+
+from models.book import Book, CatalogState
+from models.database import db
+
+CATALOG_ORDER = (Book.author, Book.title, Book.id)
+
+
+def catalog_books():
+    """Books shown on the home page."""
+    return db.select(Book).where(Book.available_for_lending == True, Book.pending_validation == False)
+
+
+def available_books():
+    """Books that can be reserved right now."""
+    return db.select(Book).where(Book.reserved == False, Book.available_for_lending == True,
+                                 Book.pending_validation == False)
+
+
+def overdue(today):
+    """True for books that should have been returned before today."""
+    return and_(Book.return_date.is_not(None), Book.return_date < today).label('overdue')
+
+
+def owner_books(user_id, today):
+    """Books added by the user as (book, overdue) rows."""
+    return db.select(Book, overdue(today)).where(Book.owner_id == user_id)
+
+
+def lender_books(user_id, today):
+    """Books reserved or borrowed by the user as (book, overdue) rows."""
+    return db.select(Book, overdue(today)).where(Book.lender_id == user_id).order_by(Book.id)
+
+
+def overdue_books(today):
+    """All books that should have been returned before today, oldest loans first."""
+    return (db.select(Book)
+            .where(Book.return_date.is_not(None), Book.return_date < today)
+            .order_by(Book.return_date, Book.id))
+
+
+def catalog_last_modified():
+    """Time of the newest book change and of the last book deletion."""
+    return db.select(db.select(func.max(Book.updated_at)).scalar_subquery(),
+                     db.select(CatalogState.deleted_at).where(CatalogState.id == 1).scalar_subquery())
@@ -4,11 +4,46 @@ from werkzeug.security import generate_password_hash
 from configuration.config import TestConfig
 from main import db, create_app, User, Book
 from authentication import logout
+from utilities.events import shutdown_event_logs
 
 app = create_app(config_class=TestConfig)
 app.config['WTF_CSRF_ENABLED'] = False
 
 
+@pytest.fixture
+def make_app():
+    """
+    Return a function that creates a separate app for the test: TestConfig without CSRF, updated with the keyword
+    arguments as config overrides, an empty schema and, unless add_user is False, the user juhanv with id 1. The apps
+    are shut down with their engines, password hashing workers and event logs after the test.
+    """
+    apps = []
+
+    def factory(config_class=TestConfig, add_user=True, **overrides):
+        config = type('Config', (config_class,), {'WTF_CSRF_ENABLED': False, **overrides})
+        new_app = create_app(config_class=config)
+        new_app.config['SECRET_KEY'] = 'test-secret-key'
+        apps.append(new_app)
+        with new_app.app_context():
+            db.create_all()
+            if add_user:
+                db.session.add(User(first_name='Juhan', last_name='Viik', email='juhan@example.com',
+                                    username='juhanv',
+                                    password=generate_password_hash('123456', method='pbkdf2:sha256:1000',
+                                                                    salt_length=8)))
+                db.session.commit()
+        return new_app
+
+    yield factory
+    for new_app in apps:
+        with new_app.app_context():
+            db.drop_all()
+            for engine in [db.engine, *new_app.extensions['replicas'].engines]:
+                engine.dispose()
+        new_app.extensions['passwords'].shutdown()
+    shutdown_event_logs()
+
+
 @pytest.fixture
 def client():
     with app.app_context():
@@ -26,7 +61,7 @@ def first_user_with_books(client):
                         last_name='viik',
                         email='juhan.viik@gmail.com',
                         username='juhanv',
-                        password=generate_password_hash('123456', method='pbkdf2:sha256', salt_length=8)
+                        password=generate_password_hash('123456', method='pbkdf2:sha256:1000', salt_length=8)
                         )
         db.session.add(new_user)
         db.session.commit()
@@ -53,7 +88,7 @@ def second_user_with_books(client):
                         last_name='pätt',
                         email='priit.patt@gmail.com',
                         username='priitp',
-                        password=generate_password_hash('123456', method='pbkdf2:sha256', salt_length=8)
+                        password=generate_password_hash('123456', method='pbkdf2:sha256:1000', salt_length=8)
                         )
         db.session.add(new_user)
         db.session.commit()
@@ -82,7 +117,7 @@ def add_third_user(client):
             last_name='Kruus',
             email='toomas.kruus@gmail.com',
             username='toomask',
-            password=generate_password_hash('123456', method='pbkdf2:sha256', salt_length=8),
+            password=generate_password_hash('123456', method='pbkdf2:sha256:1000', salt_length=8),
             duration=28
         )
         db.session.add(new_user)
@@ -1,4 +1,5 @@
 from main import db, User, Book
+from models.book import normalize_book_key
 from setup_users_and_books import client, first_user_with_books, second_user_with_books
 from authentication import login
 
@@ -107,3 +108,22 @@ def test_add_book_wrong_url(client, first_user_with_books):
     }, follow_redirects=True)
     assert b"Image URL is not valid. Please try again."
     assert response.request.path == '/add_book'
+
+
+def test_book_normalized_key(client, first_user_with_books):
+    book = db.get_or_404(Book, 1)
+    assert book.normalized_key == 'rich dad poor dad|robert kiyosaki'
+    assert normalize_book_key('  Rich   DAD poor Dad ', 'ROBERT\tKiyosaki') == book.normalized_key
+
+
+def test_add_book_duplicate_with_extra_whitespace(client, first_user_with_books):
+    login(client, 'juhanv')
+    response = client.post('/add_book', data={
+        'title': 'Rich  Dad Poor   Dad ',
+        'author': ' Robert Kiyosaki',
+        'image_url': 'https://upload.wikimedia.org/wikipedia/en/thumb/b/b9/Rich_Dad_Poor_Dad.jpg/220px'
+                     '-Rich_Dad_Poor_Dad.jpg'
+    }, follow_redirects=True)
+    assert b"A book with this title already exists." in response.data
+    assert response.request.path == '/add_book'
+    assert Book.query.count() == 2
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+
+from authentication import login
+from main import db, Book
+from setup_users_and_books import app, client, first_user_with_books, second_user_with_books, make_app
+
+
+def test_books_returns_selected_fields(client, first_user_with_books, second_user_with_books):
+    response = client.get('/api/v1/books?fields=id,title')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    books = response.get_json()['books']
+    assert len(books) == 4
+    assert all(set(book) == {'id', 'title'} for book in books)
+    # Ordered by author, then title
+    assert [book['title'] for book in books][:2] == ['Harry Potter and the Chamber of Secrets',
+                                                     "Harry Potter and the Sorcerer's Stone"]
+
+
+def test_books_rejects_unknown_fields(client, first_user_with_books):
+    response = client.get('/api/v1/books?fields=id,password')
+    assert response.status_code == 400
+    assert 'password' in response.get_json()['error']
+
+
+def test_books_cursor_pagination_and_filters(client, first_user_with_books, second_user_with_books):
+    first = client.get('/api/v1/books?per_page=3&fields=id').get_json()
+    assert len(first['books']) == 3 and first['next']
+    second = client.get(f"/api/v1/books?per_page=3&fields=id&after={first['next']}").get_json()
+    assert len(second['books']) == 1 and second['next'] is None
+    by_author = client.get('/api/v1/books?author=Robert Kiyosaki&fields=title').get_json()['books']
+    assert {book['title'] for book in by_author} == {'Rich Dad Poor Dad', 'Before You Quit Your Job'}
+
+
+def test_search(client, first_user_with_books, second_user_with_books):
+    response = client.get('/api/v1/search?query=potter&fields=title,author')
+    data = response.get_json()
+    assert {book['title'] for book in data['books']} == {"Harry Potter and the Sorcerer's Stone",
+                                                         'Harry Potter and the Chamber of Secrets'}
+    assert data['has_next'] is False
+    assert client.get('/api/v1/search?query=').status_code == 400
+
+
+def test_my_books_requires_login(client, first_user_with_books):
+    response = client.get('/api/v1/my/books')
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Authentication required'}
+
+
+def test_reserve_and_return(client, first_user_with_books, second_user_with_books):
+    login(client, 'priitp')
+    response = client.post('/api/v1/books/1/reserve')
+    assert response.status_code == 200
+    assert response.get_json() == {'id': 1, 'title': 'Rich Dad Poor Dad', 'reserved': True}
+    assert db.session.get(Book, 1).lender_id == 2
+    assert client.post('/api/v1/books/1/reserve').status_code == 409
+    assert client.post('/api/v1/books/3/reserve').status_code == 403
+    assert client.post('/api/v1/books/99/reserve').status_code == 404
+    reserved = client.get('/api/v1/my/reserved?fields=id,reserved').get_json()['books']
+    assert reserved == [{'id': 1, 'reserved': True, 'overdue': False}]
+    assert client.post('/api/v1/books/1/return').get_json()['reserved'] is False
+    assert client.get('/api/v1/my/reserved').get_json()['books'] == []
+    assert client.post('/api/v1/books/1/return').status_code == 403
+    login(client, 'juhanv')
+    assert client.post('/api/v1/books/1/return').status_code == 409
+
+
+def test_my_books(client, first_user_with_books, second_user_with_books):
+    login(client, 'juhanv')
+    books = client.get('/api/v1/my/books?fields=title').get_json()['books']
+    assert books == [{'title': 'Rich Dad Poor Dad', 'overdue': False},
+                     {'title': 'Before You Quit Your Job', 'overdue': False}]
+
+
+@pytest.mark.parametrize('path, status', [
+    ('/api/v1/books/1/reserve', 403),
+    ('/api/v1/books/1/return', 409),
+    ('/api/v1/books/import', 200),
+])
+def test_post_requests_need_csrf_token(make_app, path, status):
+    csrf_app = make_app(WTF_CSRF_ENABLED=True)
+    with csrf_app.app_context():
+        db.session.add(Book(title='Some Book', author='Some Author', image_url='https://example.com/cover.jpg',
+                            owner_id=1))
+        db.session.commit()
+    client = csrf_app.test_client()
+    login_form = client.get('/login').get_data(as_text=True)
+    form_token = login_form.split('name="csrf_token" type="hidden" value="')[1].split('"')[0]
+    client.post('/login', data={'username': 'juhanv', 'password': '123456', 'csrf_token': form_token})
+
+    def post(headers=None):
+        data = {'file': (io.BytesIO(b'title,author,image_url\n'), 'books.csv')} if path.endswith('import') else None
+        return client.post(path, data=data, headers=headers)
+
+    response = post()
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'The CSRF token is missing.'}
+    assert post({'X-CSRFToken': 'forged'}).status_code == 400
+    token = client.get('/api/v1/csrf-token').get_json()['csrf_token']
+    # Past the CSRF check, juhanv cannot reserve an own book or return one that is not lent out
+    assert post({'X-CSRFToken': token}).status_code == status
@@ -0,0 +1,63 @@
+from datetime import date
+
+from benchmarks.catalog import generate_catalog
+from benchmarks.load import Results
+from benchmarks.run import compare, percentile
+from main import db, Book, User
+from setup_users_and_books import client
+
+TODAY = date(2026, 10, 17)
+
+
+def test_generate_catalog(client):
+    with db.engine.begin() as connection:
+        generate_catalog(connection, books=1000, users=50, batch_size=300, today=TODAY)
+    assert db.session.execute(db.select(db.func.count(User.id))).scalar() == 50
+    books = db.session.execute(db.select(Book)).scalars().all()
+    assert len(books) == 1000
+    lent_out = [book for book in books if book.lent_out]
+    assert lent_out and all(book.reserved and book.lender_id != book.owner_id for book in lent_out)
+    assert any(book.return_date < TODAY for book in lent_out)
+    assert any(book.reserved and not book.lent_out for book in books)
+    assert any(not book.available_for_lending for book in books)
+
+
+def test_generate_catalog_is_reproducible(client):
+    with db.engine.begin() as connection:
+        generate_catalog(connection, books=100, users=10, seed=7, today=TODAY)
+    first = db.session.execute(db.select(Book.title, Book.owner_id, Book.return_date).order_by(Book.id)).all()
+    db.drop_all()
+    db.create_all()
+    with db.engine.begin() as connection:
+        generate_catalog(connection, books=100, users=10, seed=7, today=TODAY)
+    assert db.session.execute(db.select(Book.title, Book.owner_id, Book.return_date).order_by(Book.id)).all() == first
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    assert percentile([7], 99) == 7
+
+
+def test_compare_reports_regressions():
+    baseline = {'results': {'home': {'p95_ms': 10.0, 'queries_per_request': 2.0},
+                            'search': {'p95_ms': 10.0, 'queries_per_request': 2.0}}}
+    report = {'results': {'home': {'p95_ms': 11.0, 'queries_per_request': 2.0},
+                          'search': {'p95_ms': 13.0, 'queries_per_request': 3.0},
+                          'my_books': {'p95_ms': 100.0, 'queries_per_request': 9.0}}}
+    assert compare(report, baseline, tolerance=0.2) == ['search: p95 13.0ms > baseline 10.0ms',
+                                                        'search: 3.0 queries per request > baseline 2.0']
+
+
+def test_load_test_summary():
+    results = Results()
+    for elapsed, outcome in ((0.01, 'ok'), (0.02, 'conflict'), (0.03, 'lock_timeout'), (0.04, 'ok')):
+        results.record('reserve', elapsed, outcome)
+    results.record('home', 0.005, 'error')
+    summary = results.summary(duration=2.0)
+    assert summary['requests'] == 5
+    assert summary['throughput_rps'] == 2.5
+    assert summary['error_rate'] == 0.4
+    assert summary['lock_timeouts'] == 1
+    assert summary['reservation_conflicts'] == 1
+    assert summary['actions']['reserve']['p50_ms'] == 20.0
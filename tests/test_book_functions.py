@@ -1,4 +1,7 @@
+from datetime import date, timedelta
+
 from main import db, User, Book
+from models import queries
 from setup_users_and_books import client, first_user_with_books, second_user_with_books, add_third_user
 from authentication import login, logout
 
@@ -200,3 +203,40 @@ def test_remove_book_unauthorized_user(client, first_user_with_books, add_third_
     login(client, 'toomask')
     response = client.get('/remove_book/1', first_user_with_books)
     assert response.status_code == 401
+
+
+#  OVERDUE BOOKS
+def lend_book_until(return_date):
+    book = db.get_or_404(Book, 1)
+    book.reserved = True
+    book.lent_out = True
+    book.lender_id = 2
+    book.return_date = return_date
+    db.session.commit()
+
+
+def test_overdue_book_marked_past_due(client, first_user_with_books, add_third_user):
+    lend_book_until(date.today() - timedelta(days=1))
+    login(client, 'juhanv')
+    response = client.get('/my_books')
+    assert response.data.count(b"Past Due") == 1
+    logout(client)
+    login(client, 'toomask')
+    response = client.get('/my_reserved_books')
+    assert response.data.count(b"Past Due") == 1
+
+
+def test_book_due_today_not_past_due(client, first_user_with_books, add_third_user):
+    lend_book_until(date.today())
+    login(client, 'juhanv')
+    assert b"Past Due" not in client.get('/my_books').data
+    logout(client)
+    login(client, 'toomask')
+    assert b"Past Due" not in client.get('/my_reserved_books').data
+
+
+def test_overdue_books_query(client, first_user_with_books, add_third_user):
+    lend_book_until(date.today() - timedelta(days=3))
+    overdue = db.session.execute(queries.overdue_books(date.today())).scalars().all()
+    assert [book.id for book in overdue] == [1]
+    assert db.session.execute(queries.overdue_books(date.today() - timedelta(days=3))).scalars().all() == []
@@ -0,0 +1,145 @@
+import io
+import json
+
+import pytest
+
+from main import db, Book
+from setup_users_and_books import make_app
+from utilities.book_import import BookImporter, ErrorReport, detect_format, read_rows
+
+CSV = """title,author,image_url
+Rich Dad Poor Dad,robert kiyosaki,https://example.com/rich-dad.jpg
+Cashflow Quadrant,robert kiyosaki,https://example.com/cashflow.jpg
+rich dad poor dad,Robert Kiyosaki,https://example.com/rich-dad.jpg
+Existing Book,Some Author,https://example.com/existing.jpg
+No Cover,Some Author,https://example.com/broken.jpg
+Short Author,Ann,https://example.com/short.jpg
+,Some Author,https://example.com/untitled.jpg
+"""
+
+
+class FakeValidator:
+    def __init__(self, invalid=()):
+        self.invalid = set(invalid)
+        self.checked = []
+
+    def check(self, url, raise_errors=False):
+        self.checked.append(url)
+        return url not in self.invalid
+
+
+@pytest.fixture
+def import_app(make_app):
+    app = make_app()
+    with app.app_context():
+        db.session.add(Book(title='Existing Book', author='Some Author', image_url='https://example.com/existing.jpg',
+                            owner_id=1))
+        db.session.commit()
+    return app
+
+
+def test_detect_format():
+    assert detect_format('library.CSV') == 'csv'
+    assert detect_format('library.jsonl') == 'jsonl'
+    with pytest.raises(ValueError):
+        detect_format('library.xlsx')
+
+
+def test_read_jsonl_reports_broken_lines():
+    lines = io.StringIO('{"title": "A", "author": "B", "image_url": "C"}\n\nnot json\n[1, 2]\n')
+    rows = list(read_rows(lines, 'jsonl'))
+    assert rows[0] == (1, {'title': 'A', 'author': 'B', 'image_url': 'C'}, None)
+    assert rows[1][0] == 3 and rows[1][1] is None and rows[1][2].startswith('Invalid JSON')
+    assert rows[2] == (4, None, 'Line is not a JSON object')
+
+
+def test_csv_without_required_columns_is_rejected():
+    with pytest.raises(ValueError, match='image_url'):
+        list(read_rows(io.StringIO('title,author\nA,B\n'), 'csv'))
+
+
+def test_import_normalizes_dedupes_and_checks_covers(import_app, tmp_path):
+    validator = FakeValidator(invalid={'https://example.com/broken.jpg'})
+    errors = []
+    with import_app.app_context():
+        report = BookImporter(1, batch_size=3, validator=validator,
+                              on_error=errors.append).run(read_rows(io.StringIO(CSV), 'csv'))
+        books = db.session.execute(db.select(Book.title, Book.author, Book.pending_validation)
+                                   .where(Book.title != 'Existing Book').order_by(Book.title)).all()
+    assert report.summary() == {'imported': 2, 'rejected': 5}
+    assert books == [('Cashflow Quadrant', 'Robert Kiyosaki', False), ('Rich Dad Poor Dad', 'Robert Kiyosaki', False)]
+    assert [(error.line, error.error) for error in errors] == [
+        (4, 'Duplicate of line 2'),
+        (5, 'A book with this title already exists'),
+        (6, 'Image URL is not valid'),
+        (7, 'Author must be at least 4 characters long'),
+        (8, 'Missing title'),
+    ]
+    # Rejected rows are not checked
+    assert 'https://example.com/existing.jpg' not in validator.checked
+
+
+def test_rejected_rows_are_written_to_the_error_report(import_app, tmp_path):
+    path = tmp_path / 'errors.csv'
+    with import_app.app_context(), ErrorReport(path) as error_report:
+        report = BookImporter(1, batch_size=2, validator=FakeValidator(),
+                              on_error=error_report.write).run(read_rows(io.StringIO(CSV), 'csv'))
+    # In line order. A repeat of a row of an earlier batch is rejected as an existing book.
+    assert path.read_text(encoding='utf-8').splitlines() == [
+        'line,title,error', '4,rich dad poor dad,A book with this title already exists',
+        '5,Existing Book,A book with this title already exists',
+        '7,Short Author,Author must be at least 4 characters long', '8,,Missing title']
+    assert error_report.count == report.rejected == 4
+    with import_app.app_context(), ErrorReport(tmp_path / 'none.csv') as error_report:
+        BookImporter(1, validator=FakeValidator(), on_error=error_report.write).run(iter([]))
+    assert not (tmp_path / 'none.csv').exists()
+
+
+def test_imported_books_are_searchable(import_app):
+    with import_app.app_context():
+        BookImporter(1, validator=FakeValidator()).run(read_rows(io.StringIO(CSV), 'csv'))
+    response = import_app.test_client().get('/searchbar/?query=cashflow')
+    assert b'Cashflow Quadrant' in response.data
+
+
+def test_pending_books_are_handed_over_after_their_batch(import_app):
+    pending = []
+
+    def on_pending(book_id, image_url):
+        # The batch is committed before its books are handed over
+        assert db.session.execute(db.select(Book.title).where(Book.id == book_id)).scalar()
+        pending.append((book_id, image_url))
+
+    with import_app.app_context():
+        report = BookImporter(1, batch_size=1, check_covers=False,
+                              on_pending=on_pending).run(read_rows(io.StringIO(CSV), 'csv'))
+    assert report.pending == report.imported == 3
+    assert [image_url for _, image_url in pending] == ['https://example.com/rich-dad.jpg',
+                                                       'https://example.com/cashflow.jpg',
+                                                       'https://example.com/broken.jpg']
+
+
+def test_upload_endpoint_stores_pending_books(import_app):
+    import_app.config['ASYNC_COVER_VALIDATION'] = True
+    client = import_app.test_client()
+    assert client.post('/api/v1/books/import').status_code == 401
+    client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    lines = [json.dumps({'title': 'Uploaded Book', 'author': 'Some Author', 'image_url': 'https://example.com/u.jpg'}),
+             json.dumps({'title': 'Existing Book', 'author': 'Some Author', 'image_url': 'https://example.com/e.jpg'})]
+    response = client.post('/api/v1/books/import',
+                           data={'file': (io.BytesIO('\n'.join(lines).encode('utf-8')), 'books.jsonl')})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['imported'] == 1 and data['pending'] == 1 and data['rejected'] == 1
+    assert data['errors'] == [{'line': 2, 'title': 'Existing Book', 'error': 'A book with this title already exists'}]
+    assert import_app.extensions['cover_validation'].stats()['depth'] == 1
+    with import_app.app_context():
+        assert db.session.execute(db.select(Book.pending_validation)
+                                  .where(Book.title == 'Uploaded Book')).scalar() is True
+
+
+def test_upload_endpoint_rejects_unknown_format(import_app):
+    client = import_app.test_client()
+    client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    response = client.post('/api/v1/books/import', data={'file': (io.BytesIO(b'x'), 'books.xlsx')})
+    assert response.status_code == 400
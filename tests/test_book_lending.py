@@ -2,10 +2,12 @@ from datetime import datetime, timedelta
 import logging
 
 from flask_login import current_user
+from sqlalchemy import event
 
 from main import db, Book, User
 from setup_users_and_books import client, first_user_with_books, second_user_with_books, add_third_user
 from authentication import login, logout
+from utilities import lending
 
 
 # RESERVATION
@@ -55,6 +57,19 @@ def test_reserve_book_reserve_own_book(client, first_user_with_books):
     assert not updated_book.reserved
 
 
+def test_reserve_book_not_available_for_lending(client, first_user_with_books, second_user_with_books):
+    db.session.execute(db.update(Book).where(Book.id == 1).values(available_for_lending=False))
+    db.session.execute(db.update(Book).where(Book.id == 2).values(pending_validation=True))
+    db.session.commit()
+    login(client, 'priitp')
+    response = client.get('/reserve_book/1', follow_redirects=True)
+    assert b'Book "Rich Dad Poor Dad" is not available for lending' in response.data
+    response = client.post('/api/v1/books/2/reserve')
+    assert response.status_code == 409
+    assert response.get_json() == {'error': 'Book is not available for lending'}
+    assert db.session.execute(db.select(Book.reserved).where(Book.id.in_([1, 2]))).scalars().all() == [False, False]
+
+
 #  BOOK CANCELLATION
 def test_cancel_reservation_by_owner(client, first_user_with_books, add_third_user):
     login(client, 'toomask')
@@ -241,4 +256,57 @@ def test_return_book_user_not_authorized(client, first_user_with_books, second_u
     assert response.status_code == 401
 
 
+def test_return_book_not_lent_out(client, first_user_with_books, add_third_user):
+    login(client, 'juhanv')
+    response = client.get('/return_book/1')
+    assert response.status_code == 400
+    assert lending.return_book(1, 1) is None
+    assert lending.return_book(1, 3) is None
+    book = db.get_or_404(Book, 1)
+    assert not book.reserved and book.owner_id == 1
+
+
+
+
+
+#  ATOMIC TRANSITIONS
+def test_second_reservation_loses_race(client, first_user_with_books, second_user_with_books, add_third_user):
+    assert lending.reserve_book(1, 2) == 'Rich Dad Poor Dad'
+    assert lending.reserve_book(1, 3) is None
+    book = db.get_or_404(Book, 1)
+    assert book.lender_id == 2
+
+
+def test_transitions_issue_one_statement(client, first_user_with_books, add_third_user):
+    statements = []
 
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        lending.reserve_book(1, 2)
+        lending.receive_book(1, 2, duration=14)
+        lending.return_book(1, 2)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert len(statements) == 3
+    assert all(statement.startswith('UPDATE books') for statement in statements)
+
+
+def test_receive_book_not_reserved(client, first_user_with_books):
+    login(client, 'juhanv')
+    response = client.get('/receive_book/1', follow_redirects=True)
+    assert response.status_code == 400
+    assert not db.get_or_404(Book, 1).lent_out
+
+
+def test_cancel_reservation_while_lent_out(client, first_user_with_books, add_third_user):
+    login(client, 'toomask')
+    client.get('/reserve_book/1', follow_redirects=True)
+    client.get('/receive_book/1', follow_redirects=True)
+    response = client.get('/cancel_reservation/1', follow_redirects=True)
+    assert response.status_code == 400
+    book = db.get_or_404(Book, 1)
+    assert book.reserved
+    assert book.lent_out
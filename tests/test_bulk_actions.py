@@ -0,0 +1,93 @@
+import re
+
+from sqlalchemy import event
+
+from authentication import login, logout
+from main import db, Book
+from setup_users_and_books import app, client, first_user_with_books, second_user_with_books, add_third_user
+
+
+def test_bulk_deactivate_from_my_books_form(client, first_user_with_books):
+    login(client, 'juhanv')
+    assert b'name="book_ids" value="1"' in client.get('/my_books').data
+    response = client.post('/my_books/bulk', data={'action': 'deactivate', 'book_ids': ['1', '2']},
+                           follow_redirects=True)
+    assert b"2 books set to unavailable for lending." in response.data
+    available = db.session.execute(db.select(Book.available_for_lending).order_by(Book.id)).scalars().all()
+    assert available == [False, False]
+
+
+def test_bulk_remove_uses_one_statement_and_reports_each_book(client, first_user_with_books, second_user_with_books):
+    login(client, 'priitp')
+    client.get('/reserve_book/2')
+    logout(client)
+    login(client, 'juhanv')
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith(('UPDATE books', 'DELETE FROM books')):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': [1, 2, 3, 99]})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert response.get_json() == {'action': 'remove', 'results': [
+        {'id': 1, 'success': True, 'title': 'Rich Dad Poor Dad'},
+        {'id': 2, 'success': False, 'error': 'reserved'},
+        {'id': 3, 'success': False, 'error': 'not allowed'},
+        {'id': 99, 'success': False, 'error': 'not found'},
+    ]}
+    assert len(statements) == 1
+    assert db.session.execute(db.select(Book.id).order_by(Book.id)).scalars().all() == [2, 3, 4]
+
+
+def test_bulk_return_by_owner(client, first_user_with_books, second_user_with_books, add_third_user):
+    login(client, 'priitp')
+    client.get('/reserve_book/1')
+    logout(client)
+    login(client, 'toomask')
+    client.get('/reserve_book/2')
+    client.get('/receive_book/2')
+    logout(client)
+    login(client, 'juhanv')
+    response = client.post('/my_books/bulk', json={'action': 'return', 'book_ids': [1, 2]})
+    assert [result['success'] for result in response.get_json()['results']] == [True, True]
+    books = db.session.execute(db.select(Book.reserved, Book.lent_out, Book.lender_id)
+                               .where(Book.id.in_([1, 2]))).all()
+    assert books == [(False, False, None), (False, False, None)]
+    response = client.post('/my_books/bulk', json={'action': 'return', 'book_ids': [1, 3]})
+    assert response.get_json()['results'][0]['error'] == 'not reserved'
+    assert response.get_json()['results'][1]['error'] == 'not allowed'
+
+
+def test_bulk_action_rejects_invalid_requests(client, first_user_with_books):
+    login(client, 'juhanv')
+    assert client.post('/my_books/bulk', json={'action': 'burn', 'book_ids': [1]}).status_code == 400
+    assert client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': []}).status_code == 400
+    assert client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': ['x']}).status_code == 400
+    assert client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': ['1']}).status_code == 400
+    assert client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': [True]}).status_code == 400
+    assert client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': [1.0]}).status_code == 400
+    assert client.post('/my_books/bulk', json=[1, 2]).status_code == 400
+    app.config['BULK_ACTION_MAX_BOOKS'] = 1
+    try:
+        assert client.post('/my_books/bulk', data={'action': 'remove', 'book_ids': ['1', '2']}).status_code == 400
+    finally:
+        app.config['BULK_ACTION_MAX_BOOKS'] = 500
+
+
+def test_bulk_form_needs_csrf_token(client, first_user_with_books):
+    login(client, 'juhanv')
+    app.config['WTF_CSRF_ENABLED'] = True
+    try:
+        token = re.search(rb'name="csrf_token" type="hidden" value="([^"]+)"', client.get('/my_books').data).group(1)
+        data = {'action': 'deactivate', 'book_ids': ['1']}
+        assert client.post('/my_books/bulk', data=data).status_code == 400
+        assert client.post('/my_books/bulk', data=dict(data, csrf_token='forged')).status_code == 400
+        response = client.post('/my_books/bulk', data=dict(data, csrf_token=token.decode()), follow_redirects=True)
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = False
+    assert b"1 book set to unavailable for lending." in response.data
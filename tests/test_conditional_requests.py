@@ -0,0 +1,65 @@
+import time
+from datetime import datetime, timezone
+
+from werkzeug.http import http_date
+
+from main import db, Book
+from setup_users_and_books import client, first_user_with_books, second_user_with_books
+from authentication import login, logout
+
+
+def test_unchanged_catalog_returns_not_modified(client, first_user_with_books):
+    # Last-Modified is only sent once the second of the last change has passed
+    db.session.execute(db.update(Book).values(updated_at=datetime(2026, 10, 1, 12, 0, 0, 500000)))
+    db.session.commit()
+    response = client.get('/')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+    repeated = client.get('/', headers={'If-None-Match': etag})
+    assert repeated.status_code == 304
+    assert repeated.data == b''
+    assert client.get('/', headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+
+
+def test_change_within_the_second_of_last_modified_is_not_hidden(client, first_user_with_books):
+    response = client.get('/')
+    assert 'Last-Modified' not in response.headers
+    updated_at = db.session.get(Book, 1).updated_at.replace(tzinfo=timezone.utc)
+    assert client.get('/', headers={'If-Modified-Since': http_date(updated_at)}).status_code == 200
+
+
+def test_catalog_change_changes_etag(client, first_user_with_books, second_user_with_books):
+    etag = client.get('/available_books').headers['ETag']
+    updated_at = db.session.get(Book, 3).updated_at
+    time.sleep(0.01)
+    login(client, 'juhanv')
+    client.get('/reserve_book/3')
+    logout(client)
+    assert db.session.get(Book, 3).updated_at > updated_at
+    response = client.get('/available_books', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_deleting_a_book_changes_etag(client, first_user_with_books):
+    etag = client.get('/searchbar/?query=dad').headers['ETag']
+    time.sleep(0.01)
+    login(client, 'juhanv')
+    client.get('/remove_book/1')
+    logout(client)
+    response = client.get('/searchbar/?query=dad', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Rich Dad Poor Dad' not in response.data
+
+
+def test_etag_depends_on_user(client, first_user_with_books):
+    db.session.execute(db.update(Book).values(updated_at=datetime(2026, 10, 1, 12, 0)))
+    db.session.commit()
+    anonymous = client.get('/')
+    login(client, 'juhanv')
+    response = client.get('/', headers={'If-None-Match': anonymous.headers['ETag'],
+                                        'If-Modified-Since': anonymous.headers['Last-Modified']})
+    assert response.status_code == 200
+    assert 'Last-Modified' not in response.headers
+    assert 'Cookie' in response.headers['Vary']
@@ -0,0 +1,117 @@
+import pytest
+import requests
+
+from main import db, Book
+from setup_users_and_books import app, client, first_user_with_books
+from authentication import login
+from utilities.validation_queue import CoverValidationQueue, validate_pending_books
+
+
+class FakeValidator:
+    def __init__(self, *verdicts):
+        self.verdicts = list(verdicts)
+        self.calls = 0
+
+    def check(self, url, raise_errors=False):
+        self.calls += 1
+        verdict = self.verdicts.pop(0)
+        if isinstance(verdict, Exception):
+            raise verdict
+        return verdict
+
+
+@pytest.fixture
+def async_validation():
+    app.config['ASYNC_COVER_VALIDATION'] = True
+    yield app.extensions['cover_validation']
+    app.config['ASYNC_COVER_VALIDATION'] = False
+    while not app.extensions['cover_validation'].queue.empty():
+        app.extensions['cover_validation'].queue.get_nowait()
+
+
+def add_pending_book(client):
+    login(client, 'juhanv')
+    response = client.post('/add_book', data={
+        'title': 'Cashflow Quadrant',
+        'author': 'Robert Kiyosaki',
+        'image_url': 'https://example.com/cashflow.jpg'
+    }, follow_redirects=True)
+    assert b"It will be shown to others once its cover image is checked." in response.data
+    return db.session.execute(db.select(Book).where(Book.title == 'Cashflow Quadrant')).scalar()
+
+
+def test_async_add_book_is_hidden_until_validated(client, first_user_with_books, async_validation):
+    book = add_pending_book(client)
+    assert book.pending_validation
+    assert async_validation.stats()['depth'] == 1
+    assert b"Cashflow Quadrant" not in client.get('/').data
+    assert b"Cashflow Quadrant" not in client.get('/available_books').data
+    assert b"Cashflow Quadrant" not in client.get('/searchbar/?query=cashflow').data
+    assert b"Waiting for cover check" in client.get('/my_books').data
+
+    book_id, image_url = async_validation.queue.get_nowait()
+    assert CoverValidationQueue(app, validator=FakeValidator(True)).process(book_id, image_url) is True
+    book = db.get_or_404(Book, book_id)
+    assert not book.pending_validation
+    assert b"Cashflow Quadrant" in client.get('/').data
+
+
+def test_invalid_cover_removes_pending_book(client, first_user_with_books, async_validation):
+    book = add_pending_book(client)
+    book_id, image_url = async_validation.queue.get_nowait()
+    assert CoverValidationQueue(app, validator=FakeValidator(False)).process(book_id, image_url) is False
+    assert db.session.get(Book, book.id) is None
+
+
+def test_network_errors_are_retried(client, first_user_with_books):
+    book = db.get_or_404(Book, 1)
+    book.pending_validation = True
+    db.session.commit()
+    error = requests.exceptions.ConnectionError()
+    validator = FakeValidator(error, error, True)
+    validation_queue = CoverValidationQueue(app, max_attempts=3, backoff=0, validator=validator)
+    assert validation_queue.process(book.id, book.image_url) is True
+    assert validator.calls == 3
+    assert validation_queue.stats()['retried'] == 2
+    assert not db.get_or_404(Book, 1).pending_validation
+
+
+def test_gives_up_after_max_attempts(client, first_user_with_books):
+    book = db.get_or_404(Book, 1)
+    book.pending_validation = True
+    db.session.commit()
+    error = requests.exceptions.Timeout()
+    validation_queue = CoverValidationQueue(app, max_attempts=2, backoff=0, validator=FakeValidator(error, error))
+    assert validation_queue.process(book.id, book.image_url) is None
+    assert validation_queue.stats()['gave_up'] == 1
+    assert db.get_or_404(Book, 1).pending_validation
+
+
+def test_queue_is_bounded(client):
+    validation_queue = CoverValidationQueue(app, max_size=1)
+    assert validation_queue.submit(1, 'a')
+    assert not validation_queue.submit(2, 'b')
+    stats = validation_queue.stats()
+    assert stats['depth'] == 1
+    assert stats['rejected_full'] == 1
+
+
+def test_worker_threads_process_queue(client, first_user_with_books):
+    for book in Book.query.all():
+        book.pending_validation = True
+    db.session.commit()
+    validation_queue = CoverValidationQueue(app, workers=1, validator=FakeValidator(True, True))
+    validation_queue.start()
+    for book_id, image_url in db.session.execute(db.select(Book.id, Book.image_url)).all():
+        validation_queue.submit(book_id, image_url)
+    validation_queue.queue.join()
+    validation_queue.stop()
+    assert validation_queue.stats()['published'] == 2
+
+
+def test_validate_pending_books(client, first_user_with_books):
+    for book in Book.query.all():
+        book.pending_validation = True
+    db.session.commit()
+    assert validate_pending_books(CoverValidationQueue(app, validator=FakeValidator(True, False))) == 2
+    assert Book.query.filter_by(pending_validation=False).count() == 1
@@ -0,0 +1,23 @@
+from sqlalchemy import text
+
+from configuration.config import SQLiteProductionConfig, TestConfig
+from main import db
+from setup_users_and_books import make_app
+
+
+def test_sqlite_profile_applies_pragmas(make_app, tmp_path):
+    config = type('Config', (TestConfig, SQLiteProductionConfig), {})
+    app = make_app(config, add_user=False, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'books.db'}")
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert db.engine.pool.size() == 10
+
+
+def test_default_profile_keeps_sqlite_defaults(make_app, tmp_path):
+    app = make_app(add_user=False, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'books.db'}")
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'delete'
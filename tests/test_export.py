@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+from authentication import login
+from main import db, Book
+from setup_users_and_books import app, client, first_user_with_books, second_user_with_books
+from utilities.export import export_chunks
+
+
+def test_export_my_books_as_csv(client, first_user_with_books, second_user_with_books):
+    login(client, 'juhanv')
+    response = client.get('/export/books')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=books.csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['title'] for row in rows] == ['Rich Dad Poor Dad', 'Before You Quit Your Job']
+    assert rows[0]['owner_id'] == '1' and rows[0]['reserved'] == 'False'
+
+
+def test_export_reservations_as_jsonl(client, first_user_with_books, second_user_with_books):
+    login(client, 'priitp')
+    client.get('/reserve_book/2')
+    response = client.get('/export/reservations?format=jsonl')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 1
+    assert lines[0]['title'] == 'Before You Quit Your Job'
+    assert lines[0]['lender_id'] == 2 and lines[0]['reserved'] is True
+
+
+def test_catalog_export_needs_admin(client, first_user_with_books, second_user_with_books):
+    login(client, 'juhanv')
+    assert client.get('/export/catalog').status_code == 401
+    assert client.get('/export/everything').status_code == 404
+    app.config['EXPORT_ADMINS'] = ['juhanv']
+    try:
+        response = client.get('/export/catalog?format=jsonl')
+    finally:
+        app.config['EXPORT_ADMINS'] = []
+    assert len(response.get_data(as_text=True).splitlines()) == 4
+
+
+def test_export_is_sent_in_batches(client, first_user_with_books, second_user_with_books):
+    db.session.execute(db.update(Book).where(Book.id == 1).values(author='Author, With "Quotes"'))
+    db.session.commit()
+    chunks = list(export_chunks('catalog', 'csv', batch_size=3))
+    # Header, a full batch and the rest
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+    assert [row['id'] for row in rows] == ['1', '2', '3', '4']
+    assert rows[0]['author'] == 'Author, With "Quotes"'
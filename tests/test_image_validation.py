@@ -0,0 +1,114 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utilities.cache import TTLCache
+from utilities.service import ImageUrlValidator
+
+
+class StubImageHost(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, send_body):
+        self.requests_seen.append((self.command, self.path, self.headers.get('Range')))
+        if self.path == '/cover.jpg':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            if send_body:
+                self.wfile.write(b'x' * 1000)
+        elif self.path == '/no-head.png':
+            if self.command == 'HEAD':
+                self.send_response(405)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', '1')
+            self.end_headers()
+            self.wfile.write(b'x')
+        elif self.path == '/page.html':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/slow.jpg':
+            time.sleep(1)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.end_headers()
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+
+@pytest.fixture
+def image_host():
+    StubImageHost.requests_seen = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHost)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_valid_image_checked_with_head_only(image_host):
+    validator = ImageUrlValidator()
+    assert validator.check(f"{image_host}/cover.jpg")
+    assert StubImageHost.requests_seen == [('HEAD', '/cover.jpg', None)]
+
+
+def test_ranged_get_fallback_when_head_not_allowed(image_host):
+    validator = ImageUrlValidator()
+    assert validator.check(f"{image_host}/no-head.png")
+    assert StubImageHost.requests_seen == [('HEAD', '/no-head.png', None), ('GET', '/no-head.png', 'bytes=0-0')]
+
+
+def test_not_an_image_or_missing(image_host):
+    validator = ImageUrlValidator()
+    assert not validator.check(f"{image_host}/page.html")
+    assert not validator.check(f"{image_host}/missing.jpg")
+    assert ('GET', '/missing.jpg', 'bytes=0-0') not in StubImageHost.requests_seen
+
+
+def test_verdicts_are_cached(image_host):
+    validator = ImageUrlValidator()
+    for _ in range(3):
+        assert validator.check(f"{image_host}/cover.jpg")
+        assert not validator.check(f"{image_host}/page.html")
+    assert len(StubImageHost.requests_seen) == 3
+
+
+def test_slow_host_times_out(image_host):
+    validator = ImageUrlValidator(read_timeout=0.2)
+    started = time.monotonic()
+    assert not validator.check(f"{image_host}/slow.jpg")
+    assert time.monotonic() - started < 1
+    assert len(validator.cache) == 0
+
+
+def test_ttl_cache_expiry_and_lru_eviction():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set('a', True)
+    cache.set('b', True)
+    cache.get('a')
+    cache.set('c', False)
+    assert cache.get('a') is True
+    assert cache.get('b') is None
+    cache.set('d', True, ttl=-1)
+    assert cache.get('d') is None
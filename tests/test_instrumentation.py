@@ -0,0 +1,88 @@
+import logging
+
+import pytest
+
+from main import db, Book
+from setup_users_and_books import make_app
+from utilities.instrumentation import Histogram
+
+INSTRUMENTED = {'INSTRUMENTATION': True, 'N_PLUS_ONE_THRESHOLD': 3}
+
+
+@pytest.fixture
+def instrumented_app(make_app):
+    app = make_app(**INSTRUMENTED)
+    with app.app_context():
+        db.session.add_all(Book(title=f'Book {number}', author='Author', image_url='https://example.com/cover.jpg',
+                                owner_id=1) for number in range(3))
+        db.session.commit()
+        yield app
+
+
+def test_metrics_contain_request_histograms(instrumented_app):
+    client = instrumented_app.test_client()
+    client.get('/')
+    client.get('/')
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{endpoint="home"} 2' in metrics
+    assert 'http_request_duration_seconds_bucket{endpoint="home",le="+Inf"} 2' in metrics
+    assert 'sql_queries_per_request_count{endpoint="home"} 2' in metrics
+    assert 'sql_queries_total{endpoint="home",engine="primary"} 4' in metrics
+    assert 'sql_duration_seconds_total{endpoint="home",engine="primary"}' in metrics
+
+
+def test_replica_queries_are_counted(make_app, tmp_path):
+    app = make_app(add_user=False,
+                   SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+                   SQLALCHEMY_REPLICA_URIS=[f"sqlite:///{tmp_path / 'replica.db'}"], **INSTRUMENTED)
+    with app.app_context():
+        db.metadata.create_all(app.extensions['replicas'].engines[0])
+        client = app.test_client()
+        client.get('/')
+        metrics = client.get('/metrics').get_data(as_text=True)
+        assert 'sql_queries_total{endpoint="home",engine="primary"}' not in metrics
+        # The health check of the replica, the catalog last-modified lookup and the page query
+        assert 'sql_queries_total{endpoint="home",engine="replica-0"} 3' in metrics
+        assert 'sql_duration_seconds_total{endpoint="home",engine="replica-0"}' in metrics
+        assert 'sql_queries_per_request_count{endpoint="home"} 1' in metrics
+
+
+def test_stats_header_in_debug_mode(instrumented_app):
+    client = instrumented_app.test_client()
+    assert 'X-Request-Stats' not in client.get('/').headers
+    instrumented_app.debug = True
+    # The catalog last-modified lookup and the page query
+    assert 'queries=2;' in client.get('/').headers['X-Request-Stats']
+
+
+def test_repeated_statement_is_reported(instrumented_app, caplog):
+    @instrumented_app.route('/per_book_titles')
+    def per_book_titles():
+        return ','.join(db.session.execute(db.select(Book.title).where(Book.id == book_id)).scalar()
+                        for book_id in range(1, 4))
+
+    client = instrumented_app.test_client()
+    with caplog.at_level(logging.WARNING):
+        client.get('/per_book_titles')
+    assert "Possible N+1 query in per_book_titles: statement executed 3 times" in caplog.text
+    assert 'n_plus_one_requests_total{endpoint="per_book_titles"} 1' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_metrics_contain_cover_validation_queue(instrumented_app):
+    cover_validation = instrumented_app.extensions['cover_validation']
+    cover_validation.submit(1, 'https://example.com/cover.jpg')
+    cover_validation._count('gave_up')
+    metrics = instrumented_app.test_client().get('/metrics').get_data(as_text=True)
+    assert '# TYPE cover_validation_queue_depth gauge' in metrics
+    assert 'cover_validation_queue_depth 1' in metrics
+    assert 'cover_validation_queue_max_depth 1' in metrics
+    assert 'cover_validation_total{result="gave_up"} 1' in metrics
+    assert 'cover_validation_total{result="rejected_full"} 0' in metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert list(histogram.cumulative()) == [(1, 2), (5, 3), ('+Inf', 4)]
+    assert histogram.sum == 14.5
@@ -0,0 +1,95 @@
+import io
+
+import pytest
+
+from setup_users_and_books import app, client, first_user_with_books, add_third_user
+from authentication import login
+from utilities.book_import import BookImporter, read_rows
+from utilities.events import EventLog, aggregate_events, create_event_log, read_events
+
+
+@pytest.fixture
+def event_file(tmp_path):
+    lending_events = app.extensions['lending_events']
+    lending_events.flush()
+    original_path = lending_events.path
+    lending_events.path = tmp_path / 'events.jsonl'
+    yield lending_events.path
+    lending_events.flush()
+    lending_events.path = original_path
+
+
+def test_routes_emit_lending_events(client, first_user_with_books, add_third_user, event_file):
+    login(client, 'toomask')
+    client.get('/reserve_book/1', follow_redirects=True)
+    client.get('/receive_book/1', follow_redirects=True)
+    client.get('/return_book/1', follow_redirects=True)
+    client.get('/reserve_book/2', follow_redirects=True)
+    client.get('/cancel_reservation/2', follow_redirects=True)
+    app.extensions['lending_events'].flush()
+    events = [(event['event'], event['book_id'], event['user_id']) for event in read_events(event_file)]
+    assert events == [('reserve', 1, 2), ('receive', 1, 2), ('return', 1, 2), ('reserve', 2, 2), ('cancel', 2, 2)]
+
+
+def test_failed_transition_emits_no_event(client, first_user_with_books, event_file):
+    login(client, 'juhanv')
+    client.get('/reserve_book/1', follow_redirects=True)
+    app.extensions['lending_events'].flush()
+    assert not event_file.exists()
+
+
+def test_bulk_actions_and_imports_emit_events(client, first_user_with_books, add_third_user, event_file):
+    login(client, 'toomask')
+    client.get('/reserve_book/1', follow_redirects=True)
+    client.post('/my_books/bulk', json={'action': 'return', 'book_ids': [1]})
+    client.get('/logout')
+    login(client, 'juhanv')
+    client.post('/my_books/bulk', json={'action': 'remove', 'book_ids': [1, 2]})
+    lending_events = app.extensions['lending_events']
+    csv = "title,author,image_url\nImported Book,Some Author,https://example.com/cover.jpg\n"
+    BookImporter(1, check_covers=False, events=lending_events).run(read_rows(io.StringIO(csv), 'csv'))
+    lending_events.flush()
+    events = [(event['event'], event['book_id'], event['user_id']) for event in read_events(event_file)]
+    assert events[:4] == [('reserve', 1, 2), ('return', 1, 2), ('remove', 1, 1), ('remove', 2, 1)]
+    assert events[4][0] == 'add' and events[4][2] == 1
+
+
+def test_new_event_log_replaces_the_one_of_the_same_file(tmp_path):
+    config = {'LENDING_EVENTS_FILE': str(tmp_path / 'events.jsonl'), 'LENDING_EVENTS_BUFFER_SIZE': 100,
+              'LENDING_EVENTS_FLUSH_INTERVAL': 60}
+    first = create_event_log(config)
+    first.emit('reserve', 1, 2)
+    second = create_event_log(config)
+    assert first._thread is None and second._thread is not None
+    assert [event['event'] for event in read_events(config['LENDING_EVENTS_FILE'])] == ['reserve']
+    # The replaced log still writes, without buffering
+    first.emit('cancel', 1, 2)
+    assert [event['event'] for event in read_events(config['LENDING_EVENTS_FILE'])] == ['reserve', 'cancel']
+    second.stop()
+
+
+def test_events_are_buffered_until_full(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    event_log = EventLog(path, buffer_size=3)
+    event_log.emit('reserve', 1, 2)
+    event_log.emit('cancel', 1, 2)
+    assert not path.exists()
+    event_log.emit('reserve', 1, 3)
+    assert [event['event'] for event in read_events(path)] == ['reserve', 'cancel', 'reserve']
+
+
+def test_aggregate_events():
+    events = [
+        {'ts': '2026-10-01T10:00:00+00:00', 'event': 'reserve', 'book_id': 1, 'user_id': 2, 'title': 'A'},
+        {'ts': '2026-10-01T12:00:00+00:00', 'event': 'receive', 'book_id': 1, 'user_id': 2, 'title': 'A'},
+        {'ts': '2026-10-01T13:00:00+00:00', 'event': 'receive', 'book_id': 2, 'user_id': 3, 'title': 'B'},
+        {'ts': '2026-10-05T12:00:00+00:00', 'event': 'return', 'book_id': 1, 'user_id': 2, 'title': 'A'},
+        {'ts': '2026-10-06T12:00:00+00:00', 'event': 'receive', 'book_id': 1, 'user_id': 3, 'title': 'A'},
+        {'ts': '2026-10-08T12:00:00+00:00', 'event': 'return', 'book_id': 1, 'user_id': 3, 'title': 'A'},
+    ]
+    summary = aggregate_events(events, top=1)
+    assert summary['events'] == {'reserve': 1, 'receive': 3, 'return': 2}
+    assert summary['loans_per_day'] == {'2026-10-01': 2, '2026-10-06': 1}
+    assert summary['mean_loan_days'] == 3
+    assert summary['open_loans'] == 1
+    assert summary['top_books'] == [{'book_id': 1, 'title': 'A', 'loans': 2}]
@@ -0,0 +1,53 @@
+import logging
+
+from setup_users_and_books import app
+from utilities.logging_setup import LoggingPipeline, configure_logging
+
+
+def make_record(message, *args):
+    return logging.LogRecord('main', logging.INFO, __file__, 1, message, args, None)
+
+
+def test_configure_logging_is_idempotent():
+    first = configure_logging(app.config, ['main'])
+    second = configure_logging(app.config, ['main'])
+    assert first is second
+    assert logging.getLogger('main').handlers.count(first.handler) == 1
+
+
+def test_records_are_written_by_listener(tmp_path):
+    pipeline = LoggingPipeline(str(tmp_path / 'app.log'))
+    logger = logging.getLogger('test_logging.written')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(pipeline.handler)
+    pipeline.loggers.append(logger)
+    pipeline.start()
+    logger.info("User id: %s reserved book id: %s", 1, 2)
+    pipeline.stop()
+    assert "INFO - User id: 1 reserved book id: 2" in (tmp_path / 'app.log').read_text()
+
+
+def test_full_queue_drops_records(tmp_path):
+    pipeline = LoggingPipeline(str(tmp_path / 'app.log'), queue_size=2)
+    for number in range(5):
+        pipeline.handler.handle(make_record("record %s", number))
+    assert pipeline.stats() == {'depth': 2, 'dropped': 3}
+
+
+def test_arguments_are_merged_when_logged(tmp_path):
+    pipeline = LoggingPipeline(str(tmp_path / 'app.log'))
+    values = ['before']
+    pipeline.handler.handle(make_record("value: %s", values))
+    values[0] = 'after'
+    record = pipeline.queue.get_nowait()
+    assert record.getMessage() == "value: ['before']"
+
+
+def test_size_rotation(tmp_path):
+    pipeline = LoggingPipeline(str(tmp_path / 'app.log'), max_bytes=200, backup_count=2)
+    pipeline.start()
+    for number in range(20):
+        pipeline.handler.handle(make_record("a fairly long log line number %s", number))
+    pipeline.stop()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['app.log', 'app.log.1', 'app.log.2']
@@ -0,0 +1,90 @@
+from sqlalchemy import create_engine, text, inspect
+
+from main import db
+from models.migrations import upgrade_schema, get_schema_version, LATEST_VERSION
+from setup_users_and_books import app, client
+from utilities.query_plans import check_query_plans
+
+
+def create_old_database():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, first_name VARCHAR(250), "
+                                "last_name VARCHAR(250), email VARCHAR(250), username VARCHAR(250), "
+                                "password VARCHAR(250), duration INTEGER)"))
+        connection.execute(text("CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR(250) UNIQUE, "
+                                "author VARCHAR(250), image_url VARCHAR(250), return_date DATE, reserved BOOLEAN, "
+                                "lent_out BOOLEAN, available_for_lending BOOLEAN, owner_id INTEGER, "
+                                "lender_id INTEGER)"))
+        connection.execute(text("INSERT INTO books (id, title, author, image_url, owner_id) VALUES "
+                                "(1, 'Rich Dad Poor Dad', 'Robert Kiyosaki', 'x', 1), "
+                                "(2, 'rich dad  poor dad', 'Robert kiyosaki', 'x', 1), "
+                                "(3, 'Before You Quit Your Job', 'Robert Kiyosaki', 'x', 1)"))
+    return engine
+
+
+def index_columns(engine):
+    return {index['name']: index['column_names'] for index in inspect(engine).get_indexes('books')}
+
+
+def test_upgrade_backfills_normalized_keys():
+    engine = create_old_database()
+    upgrade_schema(engine)
+    with engine.connect() as connection:
+        keys = dict(connection.execute(text("SELECT id, normalized_key FROM books")).all())
+    assert keys[1] == 'rich dad poor dad|robert kiyosaki'
+    assert keys[2] == 'rich dad poor dad|robert kiyosaki|2'
+    assert keys[3] == 'before you quit your job|robert kiyosaki'
+    indexes = {index['name']: index for index in inspect(engine).get_indexes('books')}
+    assert indexes['ix_books_normalized_key']['unique']
+
+
+def test_upgrade_is_idempotent():
+    engine = create_old_database()
+    upgrade_schema(engine)
+    upgrade_schema(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM books WHERE normalized_key IS NULL")).scalar() == 0
+
+
+def test_upgrade_old_database_to_latest_version():
+    engine = create_old_database()
+    assert upgrade_schema(engine) == list(range(1, LATEST_VERSION + 1))
+    assert upgrade_schema(engine) == []
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == LATEST_VERSION
+    fresh = create_engine('sqlite://')
+    upgrade_schema(fresh)
+    # The migrations list their indexes, they have to end up with the ones of the models
+    assert index_columns(engine) == index_columns(fresh)
+    assert {'ix_books_catalog', 'ix_books_owner_id', 'ix_books_lender_id', 'ix_books_return_date'} <= set(
+        index_columns(engine))
+
+
+def test_fresh_database_is_created_at_latest_version():
+    engine = create_engine('sqlite://')
+    assert upgrade_schema(engine) == []
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == LATEST_VERSION
+    assert inspect(engine).has_table('books')
+
+
+def test_route_queries_use_indexes(client):
+    with db.engine.begin() as connection:
+        results = check_query_plans(connection)
+    for name, (indexed, plan) in results.items():
+        assert indexed, f"{name} does not use an index: {plan}"
+
+
+def test_check_query_plans_command(client):
+    result = app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0
+    assert 'SCAN books\n' not in result.output
+
+
+def test_upgrade_sets_updated_at():
+    engine = create_old_database()
+    upgrade_schema(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM books WHERE updated_at IS NULL")).scalar() == 0
+    assert 'ix_books_updated_at' in {index['name'] for index in inspect(engine).get_indexes('books')}
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import event
+
+from main import db, Book
+from setup_users_and_books import make_app
+from utilities.page_cache import LocalCacheBackend, PageCache
+
+
+@pytest.fixture
+def cached_app(make_app):
+    app = make_app(PAGE_CACHE_BACKEND='local')
+    with app.app_context():
+        db.session.add_all([Book(title='Cached Book', author='Some Author', image_url='https://example.com/1.jpg',
+                                 owner_id=1),
+                            Book(title='Other Book', author='Some Author', image_url='https://example.com/2.jpg',
+                                 owner_id=1)])
+        db.session.commit()
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    app.statements = statements
+    return app
+
+
+def test_anonymous_page_is_served_from_cache(cached_app):
+    client = cached_app.test_client()
+    first = client.get('/')
+    cached_app.statements.clear()
+    second = client.get('/')
+    assert second.data == first.data
+    assert b'Cached Book' in second.data
+    # Only the catalog last-modified lookup of the conditional response runs
+    assert len(cached_app.statements) == 1
+    assert 'max(books.updated_at)' in cached_app.statements[0]
+
+
+def test_catalog_change_invalidates_cached_page(cached_app):
+    client = cached_app.test_client()
+    assert b'Cached Book' in client.get('/available_books').data
+    client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    client.get('/activate_to_borrow/1')
+    client.get('/logout')
+    response = client.get('/available_books')
+    assert b'Cached Book' not in response.data
+    assert b'Other Book' in response.data
+
+
+def test_book_cards_are_cached_for_logged_in_users(cached_app):
+    client = cached_app.test_client()
+    client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    page_cache = cached_app.extensions['page_cache']
+    client.get('/')
+    hits = page_cache.hits
+    response = client.get('/')
+    assert page_cache.hits == hits + 2
+    assert b'/reserve_book/' not in response.data
+
+
+def test_search_results_use_cached_book_cards(cached_app):
+    client = cached_app.test_client()
+    client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    page_cache = cached_app.extensions['page_cache']
+    client.get('/searchbar/?query=book')
+    hits = page_cache.hits
+    response = client.get('/searchbar/?query=book')
+    assert page_cache.hits == hits + 2
+    assert response.data.count(b'class="card text-center"') == 2
+
+
+def test_bump_changes_keys():
+    page_cache = PageCache(LocalCacheBackend())
+    assert page_cache.get_or_render('page:/', lambda: 'first') == 'first'
+    assert page_cache.get_or_render('page:/', lambda: 'second') == 'first'
+    page_cache.bump()
+    assert page_cache.get_or_render('page:/', lambda: 'second') == 'second'
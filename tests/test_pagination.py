@@ -0,0 +1,75 @@
+import html
+import re
+
+from setup_users_and_books import app, client, first_user_with_books, second_user_with_books
+from utilities.pagination import encode_cursor, decode_cursor
+
+
+def page_link(response, label):
+    match = re.search(rf'href="([^"#]+)">{label}</a>', response.data.decode())
+    return html.unescape(match.group(1)) if match else None
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(['Robert Kiyosaki', 'Rich Dad Poor Dad', 1])
+    assert decode_cursor(cursor, 3) == ['Robert Kiyosaki', 'Rich Dad Poor Dad', 1]
+    assert decode_cursor('not a cursor', 3) is None
+    assert decode_cursor(cursor, 2) is None
+
+
+def test_home_first_page_sorted_by_author_and_title(client, first_user_with_books, second_user_with_books):
+    response = client.get('/?per_page=2')
+    assert response.status_code == 200
+    data = response.data.decode()
+    assert "Harry Potter and the Chamber of Secrets" in data
+    assert "Harry Potter and the Sorcerer&#39;s Stone" in data
+    assert "Rich Dad Poor Dad" not in data
+    assert data.index("Chamber of Secrets") < data.index("Sorcerer")
+    assert page_link(response, 'Previous') is None
+    assert page_link(response, 'Next') is not None
+
+
+def test_home_next_and_previous_page(client, first_user_with_books, second_user_with_books):
+    first_page = client.get('/?per_page=2')
+    second_page = client.get(page_link(first_page, 'Next'))
+    assert b"Before You Quit Your Job" in second_page.data
+    assert b"Rich Dad Poor Dad" in second_page.data
+    assert b"Harry Potter" not in second_page.data
+    assert page_link(second_page, 'Next') is None
+    back = client.get(page_link(second_page, 'Previous'))
+    assert b"Harry Potter and the Chamber of Secrets" in back.data
+    assert b"Rich Dad Poor Dad" not in back.data
+    assert page_link(back, 'Previous') is None
+
+
+def test_available_books_paginated(client, first_user_with_books, second_user_with_books):
+    response = client.get('/available_books?per_page=3')
+    assert response.data.count(b'class="card text-center"') == 3
+    response = client.get(page_link(response, 'Next'))
+    assert response.data.count(b'class="card text-center"') == 1
+    assert b"Rich Dad Poor Dad" in response.data
+
+
+def test_invalid_cursor_shows_first_page(client, first_user_with_books, second_user_with_books):
+    response = client.get('/?after=garbage&per_page=2')
+    assert response.status_code == 200
+    assert b"Harry Potter and the Chamber of Secrets" in response.data
+
+
+def test_cursor_with_wrong_value_types_is_rejected(client, first_user_with_books, second_user_with_books):
+    assert client.get(f"/?after={encode_cursor(['Robert Kiyosaki', 'Rich Dad Poor Dad', 'x'])}").status_code == 400
+    assert client.get(f"/available_books?before={encode_cursor([1, 2, 3])}").status_code == 400
+    response = client.get(f"/api/v1/books?after={encode_cursor(['Robert Kiyosaki', 'Rich Dad Poor Dad', True])}")
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor value for id'}
+
+
+def test_page_size_is_capped(client, first_user_with_books, second_user_with_books):
+    app.config['MAX_BOOKS_PER_PAGE'] = 2
+    try:
+        response = client.get('/?per_page=100000')
+        api_response = client.get('/api/v1/books?per_page=100000')
+    finally:
+        app.config['MAX_BOOKS_PER_PAGE'] = 100
+    assert response.data.count(b'class="card text-center"') == 2
+    assert len(api_response.get_json()['books']) == 2
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from main import db, User
+from setup_users_and_books import make_app
+from utilities.passwords import PasswordHashingBusy, PasswordPolicy, calibrate, normalize_method
+
+
+def test_normalize_method_fills_in_defaults():
+    assert normalize_method('pbkdf2') == 'pbkdf2:sha256:600000'
+    assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+    assert normalize_method('pbkdf2:sha512:1000') == 'pbkdf2:sha512:1000'
+    with pytest.raises(ValueError):
+        normalize_method('md5')
+
+
+def test_hash_verify_and_needs_rehash():
+    policy = PasswordPolicy('pbkdf2:sha256:1000', workers=1)
+    stored = policy.hash('secret')
+    assert stored.startswith('pbkdf2:sha256:1000$')
+    assert policy.verify(stored, 'secret')
+    assert not policy.verify(stored, 'wrong')
+    assert not policy.needs_rehash(stored)
+    assert policy.needs_rehash(generate_password_hash('secret', method='pbkdf2:sha256:2000'))
+    assert policy.needs_rehash(generate_password_hash('secret', method='scrypt:1024:8:1'))
+    # Hashes of other methods are still verified
+    assert policy.verify(generate_password_hash('secret', method='scrypt:1024:8:1'), 'secret')
+    policy.shutdown()
+
+
+def test_full_hashing_pool_rejects_callers():
+    policy = PasswordPolicy('pbkdf2:sha256:1000', workers=1, max_pending=0, timeout=0.05)
+    started = threading.Event()
+    release = threading.Event()
+    policy._hash = lambda password: started.set() or release.wait()
+    worker = threading.Thread(target=policy.hash, args=('secret',))
+    worker.start()
+    started.wait()
+    with pytest.raises(PasswordHashingBusy):
+        policy.hash('other')
+    release.set()
+    worker.join()
+    assert policy.verify(generate_password_hash('secret', method='pbkdf2:sha256:1000'), 'secret')
+    policy.shutdown()
+
+
+def test_calibrate_pbkdf2():
+    method, elapsed = calibrate('pbkdf2', 20)
+    assert method.startswith('pbkdf2:sha256:')
+    assert int(method.rsplit(':', 1)[1]) >= 10000
+    assert elapsed > 0
+
+
+@pytest.fixture
+def rehash_app(make_app):
+    app = make_app(PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.username == 'juhanv').values(
+            password=generate_password_hash('123456', method='pbkdf2:sha256:2000', salt_length=8)))
+        db.session.commit()
+    return app
+
+
+def test_login_upgrades_outdated_hash(rehash_app):
+    client = rehash_app.test_client()
+    response = client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    assert response.status_code == 302
+    with rehash_app.app_context():
+        stored = db.session.execute(db.select(User.password).where(User.username == 'juhanv')).scalar()
+    assert stored.startswith('pbkdf2:sha256:1000$')
+    client.get('/logout')
+    assert client.post('/login', data={'username': 'juhanv', 'password': '123456'}).status_code == 302
+
+
+def test_login_succeeds_when_hash_upgrade_is_busy(rehash_app):
+    def busy(password):
+        raise PasswordHashingBusy()
+
+    rehash_app.extensions['passwords'].hash = busy
+    client = rehash_app.test_client()
+    response = client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    assert response.status_code == 302
+    assert client.get('/my_books').status_code == 200
+    with rehash_app.app_context():
+        stored = db.session.execute(db.select(User.password).where(User.username == 'juhanv')).scalar()
+    assert stored.startswith('pbkdf2:sha256:2000$')
+
+
+def test_wrong_password_does_not_upgrade_hash(rehash_app):
+    client = rehash_app.test_client()
+    response = client.post('/login', data={'username': 'juhanv', 'password': 'wrong-password'})
+    assert b'Invalid password' in response.data
+    with rehash_app.app_context():
+        stored = db.session.execute(db.select(User.password).where(User.username == 'juhanv')).scalar()
+    assert stored.startswith('pbkdf2:sha256:2000$')
+
+
+def test_registration_uses_configured_method(rehash_app):
+    client = rehash_app.test_client()
+    client.post('/register', data={'first_name': 'Mari', 'last_name': 'Tamm', 'email': 'mari@example.com',
+                                   'username': 'maritamm', 'password': '123456', 'confirm_password': '123456'})
+    with rehash_app.app_context():
+        stored = db.session.execute(db.select(User.password).where(User.username == 'maritamm')).scalar()
+    assert stored.startswith('pbkdf2:sha256:1000$')
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from setup_users_and_books import make_app
+from utilities.rate_limit import LocalRateLimitBackend, RateLimiter, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit('10/minute') == (10, 10 / 60)
+    with pytest.raises(ValueError):
+        parse_limit('10/fortnight')
+
+
+def test_bucket_allows_burst_then_limits_and_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    limiter = RateLimiter(LocalRateLimitBackend(), {'search': {'ip': '3/minute'}})
+    assert [limiter.hit('search', ip='1.2.3.4') for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit('search', ip='1.2.3.4') == pytest.approx(20)
+    # Other clients have their own bucket
+    assert limiter.hit('search', ip='5.6.7.8') == 0
+    now[0] += 20
+    assert limiter.hit('search', ip='1.2.3.4') == 0
+    assert limiter.stats() == {'search': {'allowed': 5, 'limited': 1}}
+
+
+def test_user_bucket_limits_across_ips():
+    limiter = RateLimiter(LocalRateLimitBackend(), {'login': {'ip': '100/minute', 'user': '2/minute'}})
+    assert limiter.hit('login', ip='1.1.1.1', user='juhanv') == 0
+    assert limiter.hit('login', ip='2.2.2.2', user='juhanv') == 0
+    assert limiter.hit('login', ip='3.3.3.3', user='juhanv') > 0
+    assert limiter.hit('login', ip='3.3.3.3', user='priitp') == 0
+
+
+def test_refilled_buckets_are_expired(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    backend = LocalRateLimitBackend(max_keys=10)
+    limiter = RateLimiter(backend, {'search': {'ip': '60/minute'}})
+    for number in range(10):
+        limiter.hit('search', ip=f'10.0.0.{number}')
+    now[0] += 2
+    limiter.hit('search', ip='10.0.1.1')
+    assert len(backend) == 1
+
+
+@pytest.fixture
+def limited_app(make_app, request):
+    return make_app(RATE_LIMIT_BACKEND='local',
+                    RATE_LIMITS={'login': {'ip': '100/minute', 'user': '2/minute'}, 'searchbar': {'ip': '2/minute'}},
+                    **getattr(request, 'param', {}))
+
+
+@pytest.mark.parametrize('limited_app', [{'TRUSTED_PROXIES': 1}], indirect=True)
+def test_clients_behind_a_trusted_proxy_have_their_own_buckets(limited_app):
+    client = limited_app.test_client()
+    for _ in range(2):
+        response = client.get('/searchbar/?query=potter', headers={'X-Forwarded-For': '1.1.1.1'})
+        assert response.status_code == 200
+    assert client.get('/searchbar/?query=potter', headers={'X-Forwarded-For': '1.1.1.1'}).status_code == 429
+    # The proxy address of the connection is the same, the client address is not
+    assert client.get('/searchbar/?query=potter', headers={'X-Forwarded-For': '2.2.2.2'}).status_code == 200
+    # Only the address added by the trusted proxy counts, a spoofed one before it is ignored
+    response = client.get('/searchbar/?query=potter', headers={'X-Forwarded-For': '9.9.9.9, 1.1.1.1'})
+    assert response.status_code == 429
+
+
+def test_login_attempts_are_limited_per_username(limited_app):
+    client = limited_app.test_client()
+    for _ in range(2):
+        assert client.post('/login', data={'username': 'juhanv', 'password': 'wrong-password'}).status_code == 200
+    response = client.post('/login', data={'username': 'juhanv', 'password': '123456'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # Showing the login form is not counted
+    assert client.get('/login').status_code == 200
+
+
+def test_search_is_limited_per_ip(limited_app):
+    client = limited_app.test_client()
+    assert client.get('/searchbar/?query=potter').status_code == 200
+    assert client.get('/api/v1/search?query=potter').status_code == 200
+    response = client.get('/searchbar/?query=potter')
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    api_response = client.get('/api/v1/search?query=potter')
+    assert api_response.status_code == 429
+    assert api_response.get_json() == {'error': 'Too many requests'}
+    assert limited_app.extensions['rate_limiter'].stats()['searchbar'] == {'allowed': 2, 'limited': 2}
+
+
+def test_refused_request_takes_no_tokens():
+    limiter = RateLimiter(LocalRateLimitBackend(), {'login': {'ip': '2/minute', 'user': '3/minute'}})
+    # An attacker that is over its IP limit keeps naming the victim's username
+    for _ in range(10):
+        limiter.hit('login', ip='6.6.6.6', user='juhanv')
+    assert limiter.hit('login', ip='1.1.1.1', user='juhanv') == 0
+    # and a user that is over its limit does not use up the IP bucket
+    limiter.hit('login', ip='1.1.1.1', user='juhanv')
+    assert limiter.hit('login', ip='1.1.1.1', user='juhanv') > 0
+    assert limiter.hit('login', ip='1.1.1.1', user='priitp') == 0
@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from werkzeug.security import generate_password_hash
+
+from main import db, User, Book
+from models.database import ReplicaRouter
+from setup_users_and_books import make_app
+
+
+@pytest.fixture
+def replicated_app(make_app, tmp_path, request):
+    # The users are added to both databases with the same ids, the books differ.
+    app = make_app(add_user=False,
+                   SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+                   SQLALCHEMY_REPLICA_URIS=[f"sqlite:///{tmp_path / 'replica.db'}"],
+                   **getattr(request, 'param', {}))
+    with app.app_context():
+        replica = app.extensions['replicas'].engines[0]
+        db.metadata.create_all(replica)
+        password = generate_password_hash('123456', method='pbkdf2:sha256:1000', salt_length=8)
+        for engine, title in ((db.engine, 'Primary Book'), (replica, 'Replica Book')):
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert(), [
+                    {'first_name': 'Juhan', 'last_name': 'Viik', 'email': 'juhan@example.com', 'username': 'juhanv',
+                     'password': password},
+                    {'first_name': 'Priit', 'last_name': 'Pätt', 'email': 'priit@example.com', 'username': 'priitp',
+                     'password': password}])
+                connection.execute(Book.__table__.insert(), [
+                    {'title': title, 'author': 'Some Author', 'normalized_key': title.lower(),
+                     'image_url': 'https://example.com/cover.jpg', 'owner_id': 1}])
+    return app
+
+
+def test_read_only_routes_use_replica(replicated_app):
+    client = replicated_app.test_client()
+    response = client.get('/')
+    assert b'Replica Book' in response.data
+    assert b'Primary Book' not in response.data
+    assert b'Replica Book' in client.get('/searchbar/?query=book').data
+
+
+def test_write_routes_use_primary_and_reads_stick_to_primary(replicated_app):
+    client = replicated_app.test_client()
+    client.post('/login', data={'username': 'priitp', 'password': '123456'})
+    assert b'Replica Book' in client.get('/available_books').data
+    client.get('/reserve_book/1')
+    with replicated_app.app_context():
+        assert db.session.get(Book, 1).reserved
+        with replicated_app.extensions['replicas'].engines[0].connect() as connection:
+            assert not connection.execute(db.select(Book.reserved).where(Book.id == 1)).scalar()
+    response = client.get('/my_reserved_books')
+    assert b'Primary Book' in response.data
+
+
+def test_unhealthy_replica_is_skipped(tmp_path):
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    healthy = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    router = ReplicaRouter([broken, healthy], check_interval=60)
+    assert [router.choose() for _ in range(3)] == [healthy, healthy, healthy]
+    assert ReplicaRouter([broken]).choose() is None
+
+
+def test_validator_comes_from_the_database_that_renders_the_page(replicated_app):
+    with replicated_app.app_context():
+        replica = replicated_app.extensions['replicas'].engines[0]
+        with replica.begin() as connection:
+            connection.execute(db.update(Book).values(updated_at=datetime(2026, 10, 1, 12, 0)))
+        db.session.execute(db.update(Book).values(updated_at=datetime(2026, 10, 2, 12, 0)))
+        db.session.commit()
+    response = replicated_app.test_client().get('/')
+    assert b'Replica Book' in response.data
+    replica_ms = int(datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc).timestamp() * 1000)
+    assert response.headers['ETag'] == f'W/"{replica_ms}-0"'
+    assert response.headers['Last-Modified'] == 'Thu, 01 Oct 2026 12:00:00 GMT'
+
+
+@pytest.mark.parametrize('replicated_app', [{'PAGE_CACHE_BACKEND': 'local'}], indirect=True)
+def test_page_cache_is_not_filled_from_a_lagging_replica(replicated_app):
+    page_cache = replicated_app.extensions['page_cache']
+    client = replicated_app.test_client()
+    client.post('/login', data={'username': 'priitp', 'password': '123456'})
+    # The replica has not caught up, its cards are shown but not cached
+    assert b'Replica Book' in client.get('/').data
+    hits = page_cache.hits
+    assert b'Replica Book' in client.get('/').data
+    assert page_cache.hits == hits
+    client.get('/logout')
+    anonymous = replicated_app.test_client()
+    assert b'Primary Book' in anonymous.get('/').data
+    assert b'Primary Book' in anonymous.get('/').data
+    assert page_cache.hits == hits + 1
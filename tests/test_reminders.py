@@ -0,0 +1,123 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from main import db, Book, User
+from setup_users_and_books import app, client, first_user_with_books, second_user_with_books, add_third_user
+from utilities.reminders import Checkpoint, JsonLinesSink, sweep_reminders
+
+TODAY = date(2026, 10, 17)
+
+
+class FailingSink:
+    def __init__(self, fail_on_batch):
+        self.fail_on_batch = fail_on_batch
+        self.batches = []
+
+    def write(self, reminders):
+        if len(self.batches) + 1 == self.fail_on_batch:
+            raise ConnectionError("sink is down")
+        self.batches.append(reminders)
+
+
+@pytest.fixture
+def loans(client, first_user_with_books, second_user_with_books, add_third_user):
+    return_dates = {1: TODAY - timedelta(days=5), 2: TODAY + timedelta(days=1), 3: TODAY - timedelta(days=1),
+                    4: TODAY + timedelta(days=30)}
+    for book_id, return_date in return_dates.items():
+        book = db.get_or_404(Book, book_id)
+        book.reserved = True
+        book.lent_out = True
+        book.lender_id = 3
+        book.return_date = return_date
+    db.session.commit()
+
+
+def read_reminders(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_sweep_groups_reminders_per_recipient(loans, tmp_path):
+    path = tmp_path / 'reminders.jsonl'
+    assert sweep_reminders(JsonLinesSink(path), today=TODAY) == (3, 5)
+    reminders = {(reminder['username'], reminder['role'], reminder['kind']): [book['id'] for book in reminder['books']]
+                 for reminder in read_reminders(path)}
+    assert reminders == {
+        ('toomask', 'lender', 'overdue'): [1, 3],
+        ('toomask', 'lender', 'due_soon'): [2],
+        ('juhanv', 'owner', 'overdue'): [1],
+        ('juhanv', 'owner', 'due_soon'): [2],
+        ('priitp', 'owner', 'overdue'): [3],
+    }
+
+
+def test_sweep_sends_one_reminder_per_recipient_across_batches(loans, tmp_path):
+    book = db.get_or_404(Book, 4)
+    book.return_date = TODAY - timedelta(days=2)
+    db.session.commit()
+    path = tmp_path / 'reminders.jsonl'
+    # The owner batches are [1, 2, 4] and [3], the loans of priitp span both
+    assert sweep_reminders(JsonLinesSink(path), today=TODAY, batch_size=3) == (4, 5)
+    reminders = [(reminder['username'], reminder['role'], reminder['kind'], [book['id'] for book in reminder['books']])
+                 for reminder in read_reminders(path)]
+    assert reminders == [
+        ('toomask', 'lender', 'overdue', [1, 4, 3]),
+        ('toomask', 'lender', 'due_soon', [2]),
+        ('juhanv', 'owner', 'overdue', [1]),
+        ('juhanv', 'owner', 'due_soon', [2]),
+        ('priitp', 'owner', 'overdue', [4, 3]),
+    ]
+
+
+def test_recipient_with_more_loans_than_a_batch_is_sent_in_parts(loans, tmp_path):
+    db.session.add_all(Book(title=f'Book {number}', author='Some Author', image_url='https://example.com/cover.jpg',
+                            owner_id=1, reserved=True, lent_out=True, lender_id=3,
+                            return_date=TODAY - timedelta(days=number)) for number in range(1, 8))
+    db.session.commit()
+    path = tmp_path / 'reminders.jsonl'
+    assert sweep_reminders(JsonLinesSink(path), today=TODAY, batch_size=2)[0] == 10
+    owner_reminders = [[book['id'] for book in reminder['books']] for reminder in read_reminders(path)
+                       if reminder['username'] == 'juhanv' and reminder['kind'] == 'overdue']
+    assert len(owner_reminders) > 1
+    assert all(len(books) < 2 * 2 for books in owner_reminders)
+    assert sorted(book_id for books in owner_reminders for book_id in books) == [1, *range(5, 12)]
+
+
+def test_sweep_skips_users_without_email(loans, tmp_path, caplog):
+    db.session.execute(db.update(User).where(User.username == 'toomask').values(email=''))
+    db.session.commit()
+    path = tmp_path / 'reminders.jsonl'
+    assert sweep_reminders(JsonLinesSink(path), today=TODAY) == (3, 3)
+    assert {reminder['role'] for reminder in read_reminders(path)} == {'owner'}
+    assert "User id: 3 has no email address, skipping lender overdue reminder for 2 books" in caplog.text
+
+
+def test_sweep_resumes_after_crash(loans, tmp_path):
+    checkpoint = Checkpoint(tmp_path / 'checkpoint.json')
+    sink = FailingSink(fail_on_batch=2)
+    with pytest.raises(ConnectionError):
+        sweep_reminders(sink, today=TODAY, batch_size=2, checkpoint=checkpoint)
+    assert [(reminder['username'], reminder['kind']) for reminder in sink.batches[0]] == [('toomask', 'overdue')]
+    assert checkpoint.load(TODAY) == ('lender', (3, TODAY - timedelta(days=1), 3))
+    sink.fail_on_batch = None
+    assert sweep_reminders(sink, today=TODAY, batch_size=2, checkpoint=checkpoint) == (3, 4)
+    assert [(reminder['role'], reminder['kind']) for batch in sink.batches[1:] for reminder in batch] == [
+        ('lender', 'due_soon'), ('owner', 'overdue'), ('owner', 'due_soon'), ('owner', 'overdue')]
+    assert checkpoint.completed(TODAY)
+    assert sweep_reminders(sink, today=TODAY, batch_size=2, checkpoint=checkpoint) == (0, 0)
+    assert sweep_reminders(sink, today=TODAY + timedelta(days=1), batch_size=2, checkpoint=checkpoint) == (3, 5)
+
+
+def test_send_reminders_command(loans, tmp_path):
+    app.config['REMINDER_FILE'] = str(tmp_path / 'reminders.jsonl')
+    app.config['REMINDER_CHECKPOINT'] = str(tmp_path / 'checkpoint.json')
+    try:
+        result = app.test_cli_runner().invoke(args=['send-reminders', '--date', TODAY.isoformat()])
+    finally:
+        app.config['REMINDER_FILE'] = 'reminders.jsonl'
+        app.config['REMINDER_CHECKPOINT'] = 'reminders.checkpoint.json'
+    assert result.exit_code == 0
+    assert "Sent 5 reminders for 3 loans." in result.output
+    assert len(read_reminders(tmp_path / 'reminders.jsonl')) == 5
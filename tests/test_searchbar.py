@@ -1,4 +1,7 @@
-from setup_users_and_books import client, first_user_with_books, second_user_with_books
+from sqlalchemy import text
+
+from main import db, Book
+from setup_users_and_books import app, client, first_user_with_books, second_user_with_books
 
 
 def test_search_books_by_author(client, first_user_with_books, second_user_with_books):
@@ -6,14 +9,14 @@ def test_search_books_by_author(client, first_user_with_books, second_user_with_
     assert response.status_code == 200
     assert b"Rich Dad Poor Dad" in response.data
     assert b"Before You Quit Your Job" in response.data
-    assert b"Harry Potter and the Sorcerer's Stone" not in response.data
+    assert b"Harry Potter and the Sorcerer&#39;s Stone" not in response.data
     assert b"Harry Potter and the Chamber of Secrets" not in response.data
 
 
 def test_search_books_by_title(client, first_user_with_books, second_user_with_books):
     response = client.get('/searchbar/?query=potter', follow_redirects=True)
     assert response.status_code == 200
-    assert b"Harry Potter and the Sorcerer's Stone" in response.data
+    assert b"Harry Potter and the Sorcerer&#39;s Stone" in response.data
     assert b"Harry Potter and the Chamber of Secrets" in response.data
     assert b"Rich Dad Poor Dad" not in response.data
     assert b"Before You Quit Your Job" not in response.data
@@ -23,7 +26,56 @@ def test_search_books_blank_input(client, first_user_with_books, second_user_wit
     response = client.get('/searchbar/?query= ', follow_redirects=True)
     assert response.status_code == 200
     assert b"Wrong input" in response.data
-    assert b"Harry Potter and the Sorcerer's Stone" not in response.data
+    assert b"Harry Potter and the Sorcerer&#39;s Stone" not in response.data
     assert b"Harry Potter and the Chamber of Secrets" not in response.data
     assert b"Rich Dad Poor Dad" not in response.data
     assert b"Before You Quit Your Job" not in response.data
+
+
+def test_search_books_prefix_match(client, first_user_with_books, second_user_with_books):
+    response = client.get('/searchbar/?query=harr pot', follow_redirects=True)
+    assert b"Harry Potter and the Sorcerer&#39;s Stone" in response.data
+    assert b"Harry Potter and the Chamber of Secrets" in response.data
+    assert b"Rich Dad Poor Dad" not in response.data
+
+
+def test_search_books_by_title_word(client, first_user_with_books, second_user_with_books):
+    response = client.get('/searchbar/?query=rich', follow_redirects=True)
+    assert b"Rich Dad Poor Dad" in response.data
+    assert b"Before You Quit Your Job" not in response.data
+
+
+def test_search_index_follows_added_and_removed_books(client, first_user_with_books):
+    book = db.get_or_404(Book, 1)
+    db.session.delete(book)
+    db.session.commit()
+    response = client.get('/searchbar/?query=rich', follow_redirects=True)
+    assert b"Rich Dad Poor Dad" not in response.data
+    db.session.add(Book(title='The Richest Man in Babylon', author='George S. Clason', image_url='x', owner_id=1))
+    db.session.commit()
+    response = client.get('/searchbar/?query=rich', follow_redirects=True)
+    assert b"The Richest Man in Babylon" in response.data
+
+
+def test_search_books_paginated(client, first_user_with_books, second_user_with_books):
+    app.config['SEARCH_RESULTS_PER_PAGE'] = 1
+    try:
+        response = client.get('/searchbar/?query=potter', follow_redirects=True)
+        assert response.data.count(b'class="card text-center"') == 1
+        assert b'page=2' in response.data
+        response = client.get('/searchbar/?query=potter&page=2', follow_redirects=True)
+        assert response.data.count(b'class="card text-center"') == 1
+        assert b'page=3' not in response.data
+    finally:
+        app.config['SEARCH_RESULTS_PER_PAGE'] = 20
+
+
+def test_rebuild_search_index_command(client, first_user_with_books):
+    db.session.execute(text("INSERT INTO books_fts(books_fts) VALUES ('delete-all')"))
+    db.session.commit()
+    response = client.get('/searchbar/?query=kiyosaki', follow_redirects=True)
+    assert b"Rich Dad Poor Dad" not in response.data
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    assert result.exit_code == 0
+    response = client.get('/searchbar/?query=kiyosaki', follow_redirects=True)
+    assert b"Rich Dad Poor Dad" in response.data
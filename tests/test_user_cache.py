@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+
+import pytest
+from flask import g
+from sqlalchemy import event
+from werkzeug.security import check_password_hash
+
+from main import db, User
+from setup_users_and_books import app, client, first_user_with_books
+from authentication import login
+from utilities.user_cache import UserCache
+
+
+@contextmanager
+def user_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def new_request_user():
+    """The tests share one application context, make Flask-Login load the user again on the next request."""
+    g.pop('_login_user', None)
+
+
+@pytest.fixture
+def app_user_cache():
+    user_cache = app.extensions['user_cache']
+    user_cache.ttl = 60
+    yield user_cache
+    user_cache.ttl = 0
+    user_cache.cache.clear()
+
+
+def test_cache_disabled_loads_from_database(client, first_user_with_books):
+    user_cache = UserCache(ttl=0)
+    db.session.expunge_all()
+    with user_queries() as statements:
+        user_cache.load(1)
+        db.session.expunge_all()
+        user_cache.load(1)
+    assert len(statements) == 2
+
+
+def test_cached_user_loaded_without_query(client, first_user_with_books):
+    user_cache = UserCache(ttl=60)
+    db.session.expunge_all()
+    with user_queries() as statements:
+        user_cache.load(1)
+        db.session.expunge_all()
+        user = user_cache.load(1)
+        assert user.first_name == 'Juhan'
+        assert user.duration == 28
+    assert len(statements) == 1
+    assert check_password_hash(user.password, '123456')
+    assert user_cache.load(99) is None
+
+
+def test_cache_invalidation(client, first_user_with_books):
+    user_cache = UserCache(ttl=60)
+    db.session.expunge_all()
+    user_cache.load(1)
+    user_cache.invalidate(1)
+    db.session.expunge_all()
+    with user_queries() as statements:
+        user_cache.load(1)
+    assert len(statements) == 1
+
+
+def test_change_duration_invalidates_cached_user(client, first_user_with_books, app_user_cache):
+    login(client, 'juhanv')
+    new_request_user()
+    client.get('/my_books')
+    assert app_user_cache.cache.get(1) is not None
+    client.post('/change_duration/1', data={'duration': 12}, follow_redirects=False)
+    assert app_user_cache.cache.get(1) is None
+    new_request_user()
+    response = client.get('/my_books')
+    assert b"Current lending duration in days: 12" in response.data
+    assert app_user_cache.cache.get(1)['duration'] == 12
+
+
+def test_add_book_does_not_fetch_current_user_again(client, first_user_with_books):
+    login(client, 'juhanv')
+    new_request_user()
+    db.session.expunge_all()
+    with user_queries() as statements:
+        client.get('/add_book')
+    assert len(statements) == 1
@@ -0,0 +1,281 @@
+"""
+Bulk book import from CSV or JSON lines files.
+
+Rows are read one at a time from the open file and handled in batches: authors are title-cased like add_book does,
+duplicates within the file and against the catalog are rejected with one indexed lookup per batch, cover URLs of a
+batch are checked concurrently by a bounded thread pool and the accepted rows are inserted with one executemany
+INSERT. Rejected rows are handed to a callback with their line number and reason as soon as their batch is done, in
+line order, e.g. to an ErrorReport that writes them to a file. Books stored without a cover check are handed to
+another callback once their batch is committed, e.g. to the cover validation queue. Duplicates are looked up within
+the batch and in the catalog only, so a row repeating one of an earlier, already inserted batch is rejected as an
+existing book. The importer itself only keeps counts, its memory use does not grow with the size of the file.
+
+Both formats need the columns title, author and image_url:
+
+    title,author,image_url
+    Rich Dad Poor Dad,Robert Kiyosaki,https://example.com/rich-dad.jpg
+
+    {"title": "Rich Dad Poor Dad", "author": "Robert Kiyosaki", "image_url": "https://example.com/rich-dad.jpg"}
+"""
+import csv
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from models.book import Book, normalize_book_key
+from models.database import db
+from utilities.page_cache import catalog_changed
+from utilities.service import image_validator
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('title', 'author', 'image_url')
+MAX_LENGTH = 250
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+@dataclass
+class RowError:
+    line: int
+    title: str
+    error: str
+
+
+@dataclass
+class ImportReport:
+    """Outcome of an import. pending counts the books stored without a cover check."""
+    imported: int = 0
+    rejected: int = 0
+    pending: int = 0
+
+    def summary(self):
+        return {'imported': self.imported, 'rejected': self.rejected}
+
+
+class ErrorReport:
+    """CSV file with the columns line, title and error. The file is created when the first row is written."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, error):
+        if self._file is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(('line', 'title', 'error'))
+        self._writer.writerow((error.line, error.title, error.error))
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def detect_format(filename):
+    """Return 'csv' or 'jsonl' from the file name extension."""
+    for extension, file_format in FORMATS.items():
+        if filename.lower().endswith(extension):
+            return file_format
+    raise ValueError(f"Cannot tell the format of '{filename}', use a {', '.join(FORMATS)} file")
+
+
+def read_rows(lines, file_format):
+    """
+    Yield (line number, row, error) for every record of an open text file.
+
+    row is a dict with the FIELDS as strings, or None when the record cannot be read and error tells why.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        missing = [name for name in FIELDS if name not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"CSV header is missing the columns: {', '.join(missing)}")
+        for row in reader:
+            yield reader.line_num, {name: row[name] or '' for name in FIELDS}, None
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield line_number, None, f"Invalid JSON: {error}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Line is not a JSON object"
+                continue
+            yield line_number, {name: str(record.get(name) or '') for name in FIELDS}, None
+    else:
+        raise ValueError(f"Unknown import format '{file_format}'")
+
+
+def clean_row(row):
+    """Return the row as stored by add_book, or raise ValueError."""
+    title = row['title'].strip()
+    author = row['author'].strip().title()
+    image_url = row['image_url'].strip()
+    missing = [name for name, value in (('title', title), ('author', author), ('image_url', image_url)) if not value]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    if len(author) < 4:
+        raise ValueError("Author must be at least 4 characters long")
+    too_long = [name for name, value in (('title', title), ('author', author), ('image_url', image_url))
+                if len(value) > MAX_LENGTH]
+    if too_long:
+        raise ValueError(f"Longer than {MAX_LENGTH} characters: {', '.join(too_long)}")
+    return {'title': title, 'author': author, 'image_url': image_url,
+            'normalized_key': normalize_book_key(title, author)}
+
+
+class BookImporter:
+    """Import rows from read_rows for one owner."""
+
+    def __init__(self, owner_id, batch_size=1000, check_covers=True, cover_workers=8, validator=None, events=None,
+                 on_error=None, on_pending=None):
+        """
+        :param events: EventLog that gets an add event for every imported book
+        :param on_error: called with the RowError of every rejected row
+        :param on_pending: called with the id and image url of every book stored without a cover check
+        """
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.check_covers = check_covers
+        self.cover_workers = cover_workers
+        self.validator = validator or image_validator
+        self.events = events
+        self.on_error = on_error
+        self.on_pending = on_pending
+        self.report = ImportReport()
+        self._rejected = []
+
+    def run(self, rows):
+        """Import all rows and return the ImportReport. Must run inside an application context."""
+        with ThreadPoolExecutor(max_workers=self.cover_workers, thread_name_prefix='import-covers') as executor:
+            batch = []
+            for record in rows:
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    self._import_batch(batch, executor)
+                    batch = []
+            if batch:
+                self._import_batch(batch, executor)
+        if self.report.imported:
+            catalog_changed()
+        logger.info("Imported %s books for user id: %s, rejected %s rows", self.report.imported, self.owner_id,
+                    self.report.rejected)
+        return self.report
+
+    def _reject(self, line, title, error):
+        self._rejected.append(RowError(line, title, error))
+
+    def _import_batch(self, batch, executor):
+        accepted = []
+        seen_keys = {}
+        seen_titles = {}
+        for line, row, error in batch:
+            if error:
+                self._reject(line, '', error)
+                continue
+            try:
+                book = clean_row(row)
+            except ValueError as error:
+                self._reject(line, row['title'], str(error))
+                continue
+            earlier = seen_keys.get(book['normalized_key']) or seen_titles.get(book['title'])
+            if earlier:
+                self._reject(line, book['title'], f"Duplicate of line {earlier}")
+                continue
+            seen_keys[book['normalized_key']] = line
+            seen_titles[book['title']] = line
+            accepted.append((line, book))
+        accepted = self._drop_existing(accepted)
+        if self.check_covers:
+            accepted = self._drop_invalid_covers(accepted, executor)
+        self._insert(accepted)
+        self._rejected.sort(key=lambda error: error.line)
+        self.report.rejected += len(self._rejected)
+        if self.on_error is not None:
+            for error in self._rejected:
+                self.on_error(error)
+        self._rejected = []
+
+    def _drop_existing(self, accepted):
+        if not accepted:
+            return accepted
+        keys = [book['normalized_key'] for _, book in accepted]
+        titles = [book['title'] for _, book in accepted]
+        existing = db.session.execute(db.select(Book.normalized_key, Book.title)
+                                      .where(or_(Book.normalized_key.in_(keys), Book.title.in_(titles)))).all()
+        existing_keys = {key for key, _ in existing}
+        existing_titles = {title for _, title in existing}
+        kept = []
+        for line, book in accepted:
+            if book['normalized_key'] in existing_keys or book['title'] in existing_titles:
+                self._reject(line, book['title'], "A book with this title already exists")
+            else:
+                kept.append((line, book))
+        return kept
+
+    def _drop_invalid_covers(self, accepted, executor):
+        urls = list(dict.fromkeys(book['image_url'] for _, book in accepted))
+        verdicts = dict(zip(urls, executor.map(self.validator.check, urls)))
+        kept = []
+        for line, book in accepted:
+            if verdicts[book['image_url']]:
+                kept.append((line, book))
+            else:
+                self._reject(line, book['title'], "Image URL is not valid")
+        return kept
+
+    def _insert(self, accepted):
+        if not accepted:
+            return
+        rows = [dict(book, owner_id=self.owner_id, pending_validation=not self.check_covers) for _, book in accepted]
+        columns = Book.__table__.c
+        stmt = Book.__table__.insert().returning(columns.id, columns.title, columns.image_url,
+                                                 sort_by_parameter_order=True)
+        try:
+            inserted = db.session.execute(stmt, rows).all()
+            db.session.commit()
+        except IntegrityError:
+            # A book was added while the batch was checked, insert one at a time to find it.
+            db.session.rollback()
+            for line, book in accepted:
+                self._insert_one(line, book)
+            return
+        self.report.imported += len(rows)
+        for book_id, title, image_url in inserted:
+            self._added(book_id, title, image_url)
+
+    def _insert_one(self, line, book):
+        new_book = Book(**book, owner_id=self.owner_id, pending_validation=not self.check_covers)
+        db.session.add(new_book)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            self._reject(line, book['title'], "A book with this title already exists")
+            return
+        self.report.imported += 1
+        self._added(new_book.id, new_book.title, new_book.image_url)
+
+    def _added(self, book_id, title, image_url):
+        if not self.check_covers:
+            self.report.pending += 1
+            if self.on_pending is not None:
+                self.on_pending(book_id, image_url)
+        if self.events is not None:
+            self.events.emit('add', book_id, self.owner_id, title=title)
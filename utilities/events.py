@@ -0,0 +1,152 @@
+"""
+Structured lending events.
+
+Every change in the lending lifecycle (add, remove, reserve, receive, return, cancel) is appended as one JSON object
+per line to an event file. Events are buffered in memory and written in one call when the buffer is full or when the
+flush thread wakes up, so a request only pays for appending to a list. Events still buffered when the process is
+killed are lost; a clean shutdown writes them out. One flush thread runs per event file: creating a new log for a
+file stops the previous one, which from then on writes every event at once.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    """Buffered writer of lending events to a JSON lines file."""
+
+    def __init__(self, path, buffer_size=100, flush_interval=5.0):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.written = 0
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='lending-events', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write out buffered events. Later events are written immediately."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def emit(self, event, book_id, user_id, **fields):
+        """Buffer one event. Written immediately when the buffer is full or the log has been stopped."""
+        record = {'ts': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'event': event,
+                  'book_id': book_id, 'user_id': user_id}
+        record.update(fields)
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.buffer_size or self._stopped.is_set()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        lines = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+        try:
+            with self._write_lock, open(self.path, 'a', encoding='utf-8') as file:
+                file.write(lines)
+        except OSError:
+            logger.exception("Failed to write %s lending events to %s", len(records), self.path)
+            return
+        self.written += len(records)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+
+def read_events(path):
+    """Yield events from a JSON lines file, skipping lines that cannot be parsed."""
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, start=1):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning("Skipping malformed lending event on line %s of %s", number, path)
+
+
+def aggregate_events(events, top=10):
+    """
+    Summarize lending events.
+
+    A loan starts with a receive event and ends with the next return event of the same book.
+
+    :param events: iterable of event dicts in the order they were written
+    :param top: number of most lent books to return
+    :return: dict with event counts, loans per day, mean loan duration in days and top books
+    """
+    counts = Counter()
+    loans_per_day = Counter()
+    loans_per_book = Counter()
+    titles = {}
+    open_loans = {}
+    durations = []
+    for event in events:
+        kind = event.get('event')
+        book_id = event.get('book_id')
+        counts[kind] += 1
+        if event.get('title'):
+            titles[book_id] = event['title']
+        timestamp = datetime.fromisoformat(event['ts'])
+        if kind == 'receive':
+            loans_per_day[timestamp.date().isoformat()] += 1
+            loans_per_book[book_id] += 1
+            open_loans[book_id] = timestamp
+        elif kind == 'return' and book_id in open_loans:
+            durations.append((timestamp - open_loans.pop(book_id)).total_seconds() / 86400)
+    return {
+        'events': dict(counts),
+        'loans_per_day': dict(sorted(loans_per_day.items())),
+        'mean_loan_days': sum(durations) / len(durations) if durations else None,
+        'open_loans': len(open_loans),
+        'top_books': [{'book_id': book_id, 'title': titles.get(book_id), 'loans': loans}
+                      for book_id, loans in loans_per_book.most_common(top)],
+    }
+
+
+_event_logs = {}
+_event_logs_lock = threading.Lock()
+
+
+@atexit.register
+def shutdown_event_logs():
+    with _event_logs_lock:
+        event_logs = list(_event_logs.values())
+        _event_logs.clear()
+    for event_log in event_logs:
+        event_log.stop()
+
+
+def create_event_log(config):
+    """Create and start the event log configured by LENDING_EVENTS_FILE, stopping an earlier one of the same file."""
+    event_log = EventLog(config['LENDING_EVENTS_FILE'],
+                         buffer_size=config['LENDING_EVENTS_BUFFER_SIZE'],
+                         flush_interval=config['LENDING_EVENTS_FLUSH_INTERVAL'])
+    with _event_logs_lock:
+        key = os.path.abspath(event_log.path)
+        previous = _event_logs.pop(key, None)
+        _event_logs[key] = event_log
+    if previous is not None:
+        previous.stop()
+    event_log.start()
+    return event_log
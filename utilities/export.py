@@ -0,0 +1,52 @@
+"""
+Streaming book export.
+
+Rows are fetched with yield_per, so the driver hands them over batch_size at a time (Postgres through a server side
+cursor), and every batch is encoded and yielded before the next one is fetched. Memory use does not grow with the
+number of exported rows and the header is sent before the query runs.
+"""
+import csv
+import io
+
+from models.book import Book
+from models.database import db
+from utilities.serialization import dumps
+
+EXPORT_COLUMNS = (Book.id, Book.title, Book.author, Book.image_url, Book.available_for_lending,
+                  Book.pending_validation, Book.reserved, Book.lent_out, Book.return_date, Book.owner_id,
+                  Book.lender_id)
+SCOPES = ('books', 'reservations', 'catalog')
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def export_statement(scope, user_id=None):
+    """Books added by the user, books reserved or borrowed by the user, or every book, in id order."""
+    stmt = db.select(*EXPORT_COLUMNS).order_by(Book.id)
+    if scope == 'books':
+        return stmt.where(Book.owner_id == user_id)
+    if scope == 'reservations':
+        return stmt.where(Book.lender_id == user_id)
+    if scope == 'catalog':
+        return stmt
+    raise ValueError(f"Unknown export scope '{scope}'")
+
+
+def export_chunks(scope, file_format, user_id=None, batch_size=1000):
+    """Yield the export as encoded chunks of at most batch_size rows. Must run inside an application context."""
+    names = [column.key for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(names)
+        yield buffer.getvalue().encode('utf-8')
+    elif file_format != 'jsonl':
+        raise ValueError(f"Unknown export format '{file_format}'")
+    result = db.session.execute(export_statement(scope, user_id).execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        if file_format == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue().encode('utf-8')
+        else:
+            yield b''.join(dumps(dict(zip(names, row))) + b'\n' for row in rows)
@@ -0,0 +1,150 @@
+"""
+Per-request timing and SQL query instrumentation.
+
+Flask before/after request hooks time every request, SQLAlchemy cursor events of the primary and of every read replica
+engine count the statements it executes and the time spent in them, per engine. In debug mode the numbers of each
+request are returned in the X-Request-Stats header. Totals are kept per endpoint as Prometheus style histograms and
+counters and are rendered in the Prometheus text format by the /metrics route. A request that executes the same
+statement n_plus_one_threshold times or more is logged and counted as a probable N+1 query pattern.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_queries = Counter()
+        self.sql_seconds = Counter()
+        self.n_plus_one = 0
+
+
+class Instrumentation:
+    """Collect request latency and SQL statistics of one application."""
+
+    def __init__(self, app, engines, n_plus_one_threshold=5):
+        """
+        :param app: Flask application
+        :param engines: dict of engine label to engine, e.g. {'primary': db.engine, 'replica-0': replica}
+        :param n_plus_one_threshold: repetitions of one statement in a request that are reported
+        """
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        for name, engine in engines.items():
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', functools.partial(self._after_cursor_execute, name))
+
+    @staticmethod
+    def _before_request():
+        g.instrumentation_start = time.perf_counter()
+        g.sql_statements = Counter()
+        g.sql_engine_queries = Counter()
+        g.sql_engine_seconds = Counter()
+
+    def _after_request(self, response):
+        if 'instrumentation_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.instrumentation_start
+        statements = g.pop('sql_statements')
+        engine_queries = g.pop('sql_engine_queries')
+        engine_seconds = g.pop('sql_engine_seconds')
+        queries = sum(statements.values())
+        sql_seconds = sum(engine_seconds.values())
+        endpoint = request.endpoint or 'unknown'
+        repeated = [(statement, count) for statement, count in statements.items()
+                    if count >= self.n_plus_one_threshold]
+        for statement, count in repeated:
+            logger.warning("Possible N+1 query in %s: statement executed %s times: %s", endpoint, count, statement)
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            stats.latency.observe(elapsed)
+            stats.queries.observe(queries)
+            stats.sql_queries.update(engine_queries)
+            stats.sql_seconds.update(engine_seconds)
+            stats.n_plus_one += bool(repeated)
+        if current_app.debug:
+            response.headers['X-Request-Stats'] = (f"total={elapsed * 1000:.1f}ms; queries={queries}; "
+                                                   f"sql={sql_seconds * 1000:.1f}ms")
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_statements' in g:
+            conn.info.setdefault('instrumentation_query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(engine, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_statements' in g and conn.info.get('instrumentation_query_start'):
+            g.sql_engine_seconds[engine] += time.perf_counter() - conn.info['instrumentation_query_start'].pop()
+            g.sql_engine_queries[engine] += 1
+            g.sql_statements[statement] += 1
+
+    def render(self):
+        """Return all statistics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            self._render_histogram(lines, 'http_request_duration_seconds', 'Request latency in seconds.',
+                                   [(name, stats.latency) for name, stats in endpoints])
+            self._render_histogram(lines, 'sql_queries_per_request', 'SQL statements executed per request.',
+                                   [(name, stats.queries) for name, stats in endpoints])
+            lines.append('# HELP sql_queries_total SQL statements executed, per database engine.')
+            lines.append('# TYPE sql_queries_total counter')
+            lines.extend(f'sql_queries_total{{endpoint="{name}",engine="{engine}"}} {count}'
+                         for name, stats in endpoints for engine, count in sorted(stats.sql_queries.items()))
+            lines.append('# HELP sql_duration_seconds_total Time spent executing SQL statements, per database engine.')
+            lines.append('# TYPE sql_duration_seconds_total counter')
+            lines.extend(f'sql_duration_seconds_total{{endpoint="{name}",engine="{engine}"}} {seconds}'
+                         for name, stats in endpoints for engine, seconds in sorted(stats.sql_seconds.items()))
+            lines.append('# HELP n_plus_one_requests_total Requests that repeated one SQL statement too often.')
+            lines.append('# TYPE n_plus_one_requests_total counter')
+            lines.extend(f'n_plus_one_requests_total{{endpoint="{name}"}} {stats.n_plus_one}'
+                         for name, stats in endpoints)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(lines, metric, description, histograms):
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for name, histogram in histograms:
+            for bound, count in histogram.cumulative():
+                lines.append(f'{metric}_bucket{{endpoint="{name}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_sum{{endpoint="{name}"}} {histogram.sum}')
+            lines.append(f'{metric}_count{{endpoint="{name}"}} {histogram.count}')
@@ -0,0 +1,106 @@
+"""
+Lending state transitions.
+
+Every transition is a single conditional UPDATE whose WHERE clause contains both the permission check and the
+expected current state of the book. Two concurrent requests can therefore never both win: the second UPDATE matches
+no rows. Each function returns the title of the updated book or None if nothing was updated; callers load the book
+only in that case to find out why.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import or_
+
+from models.book import Book, record_deletion
+from models.database import db
+
+
+def _transition(conditions, values):
+    result = db.session.execute(db.update(Book).where(*conditions).values(**values).returning(Book.title))
+    title = result.scalar()
+    db.session.commit()
+    return title
+
+
+def reserve_book(book_id, user_id):
+    """Reserve a book that is available for lending and not reserved yet for a user who does not own it."""
+    return _transition((Book.id == book_id, Book.reserved == False, Book.owner_id != user_id,
+                        Book.pending_validation == False, Book.available_for_lending == True),
+                       dict(reserved=True, lender_id=user_id))
+
+
+def receive_book(book_id, user_id, duration, today=None):
+    """Mark a reserved book as handed over. Allowed for the book owner and the lender."""
+    today = today or date.today()
+    return _transition((Book.id == book_id, Book.reserved == True, Book.lent_out == False,
+                        or_(Book.owner_id == user_id, Book.lender_id == user_id)),
+                       dict(lent_out=True, return_date=today + timedelta(days=duration)))
+
+
+def return_book(book_id, user_id):
+    """Return a reserved or lent out book to the lending environment. Allowed for the book owner and the lender."""
+    return _transition((Book.id == book_id, Book.reserved == True,
+                        or_(Book.owner_id == user_id, Book.lender_id == user_id)),
+                       dict(return_date=None, reserved=False, lender_id=None, lent_out=False))
+
+
+def cancel_reservation(book_id, user_id):
+    """Cancel a reservation of a book that is not handed over yet. Allowed for the book owner and the lender."""
+    return _transition((Book.id == book_id, Book.reserved == True, Book.lent_out == False,
+                        or_(Book.owner_id == user_id, Book.lender_id == user_id)),
+                       dict(reserved=False, lender_id=None))
+
+
+BULK_ACTIONS = ('activate', 'deactivate', 'return', 'remove')
+
+
+def bulk_action(action, book_ids, user_id):
+    """
+    Apply an action to many books with one UPDATE or DELETE and one commit.
+
+    activate and deactivate change the lending availability of the user's books that are not lent out, return
+    returns reserved or borrowed books of which the user is the owner or the lender, remove deletes the user's books
+    that are not reserved.
+
+    :return: tuple of (dict of changed book id to title, dict of unchanged book id to the reason)
+    """
+    if action in ('activate', 'deactivate'):
+        stmt = (db.update(Book)
+                .where(Book.id.in_(book_ids), Book.owner_id == user_id, Book.lent_out == False)
+                .values(available_for_lending=action == 'activate'))
+    elif action == 'return':
+        stmt = (db.update(Book)
+                .where(Book.id.in_(book_ids), Book.reserved == True,
+                       or_(Book.owner_id == user_id, Book.lender_id == user_id))
+                .values(return_date=None, reserved=False, lender_id=None, lent_out=False))
+    elif action == 'remove':
+        stmt = db.delete(Book).where(Book.id.in_(book_ids), Book.owner_id == user_id, Book.reserved == False,
+                                     Book.lent_out == False)
+    else:
+        raise ValueError(f"Unknown bulk action '{action}'")
+    changed = dict(db.session.execute(stmt.returning(Book.id, Book.title)).all())
+    if changed and action == 'remove':
+        record_deletion()
+    db.session.commit()
+    unchanged = [book_id for book_id in book_ids if book_id not in changed]
+    return changed, bulk_failures(action, unchanged, user_id) if unchanged else {}
+
+
+def bulk_failures(action, book_ids, user_id):
+    """Reason why a bulk action did not change each of the books."""
+    books = {book.id: book for book in db.session.execute(
+        db.select(Book.id, Book.owner_id, Book.lender_id, Book.reserved, Book.lent_out)
+        .where(Book.id.in_(book_ids))).all()}
+    reasons = {}
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if book is None:
+            reasons[book_id] = 'not found'
+        elif action == 'return':
+            reasons[book_id] = 'not reserved' if user_id in (book.owner_id, book.lender_id) else 'not allowed'
+        elif book.owner_id != user_id:
+            reasons[book_id] = 'not allowed'
+        elif book.lent_out:
+            reasons[book_id] = 'lent out'
+        else:
+            reasons[book_id] = 'reserved'
+    return reasons
@@ -0,0 +1,123 @@
+"""
+Non-blocking application logging.
+
+Loggers get a QueueHandler that only puts records on a bounded in-memory queue. A QueueListener thread takes them off
+the queue and writes them to a rotating log file, so request threads never wait for disk I/O. When the queue is full
+records are dropped and counted (policy 'drop') or the caller waits up to LOG_QUEUE_TIMEOUT seconds before dropping
+(policy 'block').
+"""
+import atexit
+import copy
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_active = {}
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that never blocks longer than the configured timeout and counts dropped records."""
+
+    def __init__(self, log_queue, policy='drop', timeout=0.1):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.timeout = timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now, they may change after the call returns. Formatting the line is left to the
+        # listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """Queue, handler and listener thread writing one log file."""
+
+    def __init__(self, path, queue_size=10000, policy='drop', timeout=0.1, rotation='size', max_bytes=10 * 2 ** 20,
+                 backup_count=5, when='midnight'):
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = BoundedQueueHandler(self.queue, policy=policy, timeout=timeout)
+        if rotation == 'time':
+            self.file_handler = TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                         encoding='utf-8', delay=True)
+        else:
+            self.file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                    encoding='utf-8', delay=True)
+        self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.listener = QueueListener(self.queue, self.file_handler, respect_handler_level=True)
+        self.loggers = []
+
+    def start(self):
+        self.listener.start()
+
+    def stop(self):
+        """Write out every queued record and close the file."""
+        for logger in self.loggers:
+            logger.removeHandler(self.handler)
+        self.listener.stop()
+        self.file_handler.close()
+
+    def stats(self):
+        return {'depth': self.queue.qsize(), 'dropped': self.handler.dropped}
+
+
+def configure_logging(config, logger_names):
+    """
+    Attach the logging pipeline described by config to the named loggers.
+
+    Calling it again with the same log file reuses the running pipeline instead of adding another handler. A different
+    log file replaces the previous pipeline.
+
+    :param config: Flask config
+    :param logger_names: names of the loggers to attach to
+    :return: LoggingPipeline
+    """
+    path = config['LOG_FILE']
+    level = logging.getLevelName(config['LOG_LEVEL'])
+    with _lock:
+        pipeline = _active.get('pipeline')
+        if pipeline is None or pipeline.path != path:
+            if pipeline is not None:
+                pipeline.stop()
+            pipeline = LoggingPipeline(path,
+                                       queue_size=config['LOG_QUEUE_SIZE'],
+                                       policy=config['LOG_QUEUE_POLICY'],
+                                       timeout=config['LOG_QUEUE_TIMEOUT'],
+                                       rotation=config['LOG_ROTATION'],
+                                       max_bytes=config['LOG_MAX_BYTES'],
+                                       backup_count=config['LOG_BACKUP_COUNT'],
+                                       when=config['LOG_ROTATE_WHEN'])
+            pipeline.start()
+            _active['pipeline'] = pipeline
+        for name in logger_names:
+            logger = logging.getLogger(name)
+            logger.setLevel(level)
+            if pipeline.handler not in logger.handlers:
+                logger.addHandler(pipeline.handler)
+                pipeline.loggers.append(logger)
+        return pipeline
+
+
+@atexit.register
+def shutdown_logging():
+    with _lock:
+        pipeline = _active.pop('pipeline', None)
+        if pipeline is not None:
+            pipeline.stop()
@@ -0,0 +1,113 @@
+"""
+Rendered page and fragment cache for the public catalog.
+
+Cache keys contain a catalog version number. Every change to the catalog bumps the version, so entries of older
+versions are never read again and age out of the LRU or expire, there is no need to find and delete them.
+
+The local backend keeps entries and the version in process memory; with several worker processes use the Redis
+backend so all workers see the same version.
+"""
+import threading
+
+from flask import current_app
+
+from utilities.cache import TTLCache
+
+VERSION_KEY = 'catalog_version'
+
+
+class LocalCacheBackend:
+    """In-process LRU backend."""
+
+    def __init__(self, max_size=2048, ttl=300):
+        self.entries = TTLCache(max_size=max_size, ttl=ttl)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries.set(key, value, ttl=ttl)
+
+    def get_version(self):
+        return self.version
+
+    def incr_version(self):
+        with self._lock:
+            self.version += 1
+            return self.version
+
+
+class RedisCacheBackend:
+    """Backend for Redis or a Redis compatible server. Needs the redis package."""
+
+    def __init__(self, url, prefix='book_lending:'):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("PAGE_CACHE_BACKEND 'redis' needs the redis package: pip install redis") from error
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=ttl)
+
+    def get_version(self):
+        return int(self.client.get(self.prefix + VERSION_KEY) or 0)
+
+    def incr_version(self):
+        return self.client.incr(self.prefix + VERSION_KEY)
+
+
+class PageCache:
+    """Cache rendered HTML under keys that include the current catalog version."""
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render, store=True):
+        """
+        Return the cached HTML for key or call render, cache its result and return it.
+
+        :param store: False renders without caching, for HTML made from data that may be older than the version
+        """
+        versioned_key = f"{self.backend.get_version()}:{key}"
+        value = self.backend.get(versioned_key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = render()
+        if store and isinstance(value, str):
+            self.backend.set(versioned_key, value, self.ttl)
+        return value
+
+    def bump(self):
+        """Invalidate every cached page and fragment."""
+        return self.backend.incr_version()
+
+
+def create_page_cache(config):
+    """Create the page cache selected by PAGE_CACHE_BACKEND, or None if caching is disabled."""
+    if config['PAGE_CACHE_BACKEND'] == 'redis':
+        backend = RedisCacheBackend(config['PAGE_CACHE_URL'])
+    elif config['PAGE_CACHE_BACKEND'] == 'local':
+        backend = LocalCacheBackend(max_size=config['PAGE_CACHE_SIZE'], ttl=config['PAGE_CACHE_TTL'])
+    else:
+        return None
+    return PageCache(backend, ttl=config['PAGE_CACHE_TTL'])
+
+
+def catalog_changed():
+    """Invalidate the page cache of the current application after a change to the catalog."""
+    page_cache = current_app.extensions.get('page_cache')
+    if page_cache is not None:
+        page_cache.bump()
@@ -0,0 +1,96 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+
+from sqlalchemy import tuple_
+
+from models.database import db
+
+
+@dataclass
+class Page:
+    """One page of a keyset paginated listing with cursors pointing to the neighbouring pages."""
+    items: list = field(default_factory=list)
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+
+class InvalidCursor(ValueError):
+    """A cursor that decodes but does not hold values of the listing's sort key types."""
+
+
+def encode_cursor(values):
+    """Encode sort key values into an url safe cursor string."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Decode cursor string back into sort key values. Return None if the cursor is malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def check_cursor_types(values, order_by):
+    """Raise InvalidCursor unless every cursor value has the Python type of its sort key column."""
+    if values is None:
+        return None
+    for value, column in zip(values, order_by):
+        expected = column.type.python_type
+        # bool is a subclass of int, but True is not a book id
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+            raise InvalidCursor(f"Invalid cursor value for {column.key}")
+    return values
+
+
+def keyset_page(stmt, order_by, after=None, before=None, per_page=24, scalars=True):
+    """
+    Execute a select statement and return one page of it using keyset (seek) pagination.
+
+    Rows are ordered by the given columns in the database and only per_page + 1 rows are fetched, so the cost of a
+    page does not depend on how deep into the listing it is. The last column of order_by must be unique.
+
+    :param stmt: select statement without ORDER BY and LIMIT
+    :param order_by: columns that define the listing order, e.g. (Book.author, Book.title, Book.id)
+    :param after: cursor of the last item of the previous page
+    :param before: cursor of the first item of the next page
+    :param per_page: page size
+    :param scalars: return ORM entities instead of rows
+    :return: Page
+    :raises InvalidCursor: if a cursor holds values of other types than the order_by columns
+    """
+    after_key = check_cursor_types(decode_cursor(after, len(order_by)), order_by)
+    before_key = check_cursor_types(decode_cursor(before, len(order_by)), order_by) if after_key is None else None
+    key = tuple_(*order_by)
+    if before_key is not None:
+        stmt = stmt.where(key < tuple_(*before_key)).order_by(*(column.desc() for column in order_by))
+    else:
+        if after_key is not None:
+            stmt = stmt.where(key > tuple_(*after_key))
+        stmt = stmt.order_by(*order_by)
+    result = db.session.execute(stmt.limit(per_page + 1))
+    rows = list(result.scalars() if scalars else result)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before_key is not None:
+        rows.reverse()
+
+    def cursor_for(item):
+        return encode_cursor(getattr(item, column.key) for column in order_by)
+
+    page = Page(items=rows)
+    if rows:
+        if has_more or before_key is not None:
+            page.next_cursor = cursor_for(rows[-1])
+        if after_key is not None or (before_key is not None and has_more):
+            page.prev_cursor = cursor_for(rows[0])
+    return page
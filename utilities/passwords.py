@@ -0,0 +1,162 @@
+"""
+Password hashing policy.
+
+The algorithm and its cost are set with PASSWORD_HASH_METHOD in werkzeug notation, extended with argon2:
+
+    pbkdf2:sha256:600000        pbkdf2 with sha256 and 600000 iterations
+    scrypt:32768:8:1            scrypt with n=32768, r=8, p=1
+    argon2:3:65536:4            argon2id with time cost 3, 64 MiB memory and 4 lanes, needs argon2-cffi
+
+Hashes stored with other parameters are still verified and are replaced with a hash of the current method the next
+time the user logs in. Hashing runs in a small thread pool: at most workers hashes are computed at the same time and
+at most max_pending callers wait for a slot, further callers fail with PasswordHashingBusy instead of piling up
+request threads behind a login or registration burst.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:
+    argon2 = None
+
+
+class PasswordHashingBusy(RuntimeError):
+    """All hashing workers are busy and the waiting list is full."""
+
+
+def normalize_method(method):
+    """Return the method with every default parameter filled in, as it is written into stored hashes."""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'argon2':
+        time_cost, memory_cost, parallelism = map(int, args) if args else (3, 65536, 4)
+        return f"argon2:{time_cost}:{memory_cost}:{parallelism}"
+    raise ValueError(f"Unknown password hash method '{method}'")
+
+
+class PasswordPolicy:
+    """Hash, verify and upgrade passwords with one configured method."""
+
+    def __init__(self, method='pbkdf2:sha256', salt_length=16, workers=2, max_pending=16, timeout=10.0):
+        self.method = normalize_method(method)
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._argon2 = None
+        if self.method.startswith('argon2:'):
+            if argon2 is None:
+                raise RuntimeError("PASSWORD_HASH_METHOD 'argon2' needs the argon2-cffi package: "
+                                   "pip install argon2-cffi")
+            time_cost, memory_cost, parallelism = map(int, self.method.split(':')[1:])
+            self._argon2 = argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                                                 parallelism=parallelism)
+        self._executor = None
+        self._slots = None
+        if workers:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def hash(self, password):
+        """Return a new salted hash of password."""
+        return self._run(self._hash, password)
+
+    def verify(self, stored, password):
+        """Check password against a stored hash of any supported method."""
+        return self._run(self._verify, stored, password)
+
+    def needs_rehash(self, stored):
+        """True if the stored hash was made with another method or other parameters than the current ones."""
+        if self._argon2 is not None:
+            return not stored.startswith('$argon2') or self._argon2.check_needs_rehash(stored)
+        return stored.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _hash(self, password):
+        if self._argon2 is not None:
+            return self._argon2.hash(password)
+        return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    @staticmethod
+    def _verify(stored, password):
+        if stored.startswith('$argon2'):
+            if argon2 is None:
+                raise RuntimeError("Verifying argon2 password hashes needs the argon2-cffi package")
+            try:
+                return argon2.PasswordHasher().verify(stored, password)
+            except argon2.exceptions.VerificationError:
+                return False
+        return check_password_hash(stored, password)
+
+    def _run(self, function, *args):
+        if self._executor is None:
+            return function(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashingBusy("Too many passwords are being hashed, try again later")
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+def create_password_policy(config):
+    """Create the password policy configured with the PASSWORD_HASH_* settings."""
+    return PasswordPolicy(method=config['PASSWORD_HASH_METHOD'],
+                          salt_length=config['PASSWORD_SALT_LENGTH'],
+                          workers=config['PASSWORD_HASH_WORKERS'],
+                          max_pending=config['PASSWORD_HASH_QUEUE_SIZE'],
+                          timeout=config['PASSWORD_HASH_TIMEOUT'])
+
+
+def time_method(method, rounds=3):
+    """Median time in seconds to hash a password with method."""
+    policy = PasswordPolicy(method, workers=0)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        policy.hash('calibration password')
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate(algorithm, target_ms):
+    """
+    Find the cost of algorithm that takes about target_ms milliseconds to hash one password on this machine.
+
+    pbkdf2 iterations are scaled linearly from a measurement, scrypt n is doubled and the argon2 time cost is raised
+    until a hash takes at least target_ms.
+
+    :return: tuple of (method, measured milliseconds)
+    """
+    target = target_ms / 1000
+    if algorithm == 'pbkdf2':
+        probe = 100000
+        iterations = max(round(probe * target / time_method(f'pbkdf2:sha256:{probe}') / 10000) * 10000, 10000)
+        method = f'pbkdf2:sha256:{iterations}'
+    elif algorithm == 'scrypt':
+        n = 2 ** 14
+        while time_method(f'scrypt:{n}:8:1') < target and n < 2 ** 20:
+            n *= 2
+        method = f'scrypt:{n}:8:1'
+    elif algorithm == 'argon2':
+        time_cost = 1
+        while time_method(f'argon2:{time_cost}:65536:4') < target and time_cost < 20:
+            time_cost += 1
+        method = f'argon2:{time_cost}:65536:4'
+    else:
+        raise ValueError(f"Unknown password hash algorithm '{algorithm}'")
+    return method, time_method(method) * 1000
@@ -0,0 +1,58 @@
+import re
+from datetime import date
+
+from sqlalchemy import tuple_
+
+from models import queries
+
+SQLITE_TABLE_SCAN = re.compile(r'^SCAN (TABLE )?books( AS \w+)?$')
+
+
+def route_queries(user_id=1, per_page=24):
+    """Return the statements issued by the listing routes, keyed by a descriptive name."""
+    cursor = tuple_('', '', 0)
+    order = queries.CATALOG_ORDER
+    return {
+        'home': queries.catalog_books().order_by(*order).limit(per_page + 1),
+        'home next page': queries.catalog_books().where(tuple_(*order) > cursor).order_by(*order).limit(per_page + 1),
+        'available_books': queries.available_books().order_by(*order).limit(per_page + 1),
+        'available_books next page': (queries.available_books().where(tuple_(*order) > cursor)
+                                      .order_by(*order).limit(per_page + 1)),
+        'my_books': queries.owner_books(user_id, date.today()),
+        'my_reserved_books': queries.lender_books(user_id, date.today()),
+        'overdue books': queries.overdue_books(date.today()).limit(per_page),
+        'catalog last modified': queries.catalog_last_modified(),
+    }
+
+
+def explain(connection, stmt):
+    """Return the query plan of a statement as a list of lines."""
+    dialect = connection.dialect.name
+    sql = str(stmt.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if dialect == 'sqlite':
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    if dialect == 'postgresql':
+        # Small tables are always scanned sequentially, ask whether an index could be used at all
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {sql}")]
+    raise NotImplementedError(f"Query plans are not supported for {dialect}")
+
+
+def uses_index(dialect, plan):
+    """Return False if the plan reads the books table without an index."""
+    if dialect == 'sqlite':
+        return not any(SQLITE_TABLE_SCAN.match(line.strip()) for line in plan)
+    return not any('Seq Scan on books' in line for line in plan)
+
+
+def check_query_plans(connection):
+    """
+    Explain every listing route query.
+
+    :return: dict of query name to tuple (uses index, plan lines)
+    """
+    results = {}
+    for name, stmt in route_queries().items():
+        plan = explain(connection, stmt)
+        results[name] = (uses_index(connection.dialect.name, plan), plan)
+    return results
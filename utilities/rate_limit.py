@@ -0,0 +1,177 @@
+"""
+Token bucket rate limiting.
+
+Every rule has buckets per client IP and per user. A bucket holds up to capacity tokens and refills at a steady rate,
+each request takes one token from every bucket of its rule and is refused while any of them is empty. A refused
+request takes no tokens at all, so requests of a client that is over its IP limit do not use up the user bucket of
+the username they name, and the other way round. Limits are written as "count/period", e.g.
+"10/minute" allows bursts of 10 requests and refills one token every 6 seconds.
+
+The local backend keeps buckets in process memory. A bucket that has refilled completely is the same as no bucket,
+so such entries are dropped, and the least recently used buckets are evicted beyond max_keys. With several worker
+processes use the Redis backend so all workers share the buckets.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+Limit = namedtuple('Limit', 'capacity rate')
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# ARGV holds the time followed by the capacity and rate of every key.
+REDIS_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed = 1
+local levels = {}
+for index, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[index * 2])
+    local rate = tonumber(ARGV[index * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    levels[index] = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    if levels[index] < 1 then
+        allowed = 0
+    end
+end
+for index, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[index * 2])
+    local rate = tonumber(ARGV[index * 2 + 1])
+    levels[index] = levels[index] - allowed
+    redis.call('HSET', key, 'tokens', tostring(levels[index]), 'updated', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil((capacity - levels[index]) / rate * 1000) + 1000)
+    levels[index] = tostring(levels[index])
+end
+return {allowed, levels}
+"""
+
+
+def parse_limit(value):
+    """Parse a "count/period" limit such as "10/minute"."""
+    count, period = value.split('/')
+    if period not in PERIODS:
+        raise ValueError(f"Unknown rate limit period '{period}', use one of {', '.join(PERIODS)}")
+    return Limit(capacity=int(count), rate=int(count) / PERIODS[period])
+
+
+class LocalRateLimitBackend:
+    """In-process bucket store."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """
+        Take a token from every bucket if all of them have one.
+
+        :param buckets: list of (key, Limit)
+        :return: (allowed, list of tokens left in each bucket)
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, limit in buckets:
+                tokens, updated, _ = self._buckets.pop(key, (limit.capacity, now, now))
+                levels.append(min(limit.capacity, tokens + (now - updated) * limit.rate))
+            allowed = all(tokens >= 1 for tokens in levels)
+            if allowed:
+                levels = [tokens - 1 for tokens in levels]
+            for (key, limit), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens, now, now + (limit.capacity - tokens) / limit.rate)
+            if len(self._buckets) > self.max_keys:
+                self._expire(now)
+            return allowed, levels
+
+    def _expire(self, now):
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+        # Leave some room so that the next requests do not scan all buckets again.
+        while len(self._buckets) > self.max_keys * 0.9:
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisRateLimitBackend:
+    """Backend for Redis or a Redis compatible server. Needs the redis package."""
+
+    def __init__(self, url, prefix='book_lending:rate:'):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("RATE_LIMIT_BACKEND 'redis' needs the redis package: pip install redis") from error
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(REDIS_TAKE_SCRIPT)
+
+    def take(self, buckets):
+        args = [time.time()]
+        for _, limit in buckets:
+            args.extend((limit.capacity, limit.rate))
+        allowed, levels = self._take(keys=[self.prefix + key for key, _ in buckets], args=args)
+        return bool(allowed), [float(tokens) for tokens in levels]
+
+
+class RateLimiter:
+    """Apply the limits of named rules and count allowed and limited requests per rule."""
+
+    def __init__(self, backend, rules):
+        """
+        :param backend: bucket store
+        :param rules: dict of rule name to a dict with 'ip' and/or 'user' limits, e.g. {'login': {'ip': '10/minute'}}
+        """
+        self.backend = backend
+        self.rules = {name: {scope: parse_limit(limit) for scope, limit in scopes.items()}
+                      for name, scopes in rules.items()}
+        self.counters = {name: {'allowed': 0, 'limited': 0} for name in self.rules}
+        self._lock = threading.Lock()
+
+    def hit(self, rule, ip=None, user=None):
+        """
+        Count a request against the buckets of rule.
+
+        :return: 0 if the request is allowed, otherwise the number of seconds until it would be
+        """
+        buckets = []
+        for scope, identity in (('ip', ip), ('user', user)):
+            limit = self.rules.get(rule, {}).get(scope)
+            if limit is not None and identity is not None:
+                buckets.append((f"{rule}:{scope}:{identity}", limit))
+        retry_after = 0
+        if buckets:
+            allowed, levels = self.backend.take(buckets)
+            if not allowed:
+                retry_after = max((1 - tokens) / limit.rate for (_, limit), tokens in zip(buckets, levels)
+                                  if tokens < 1)
+        if rule in self.counters:
+            with self._lock:
+                self.counters[rule]['limited' if retry_after else 'allowed'] += 1
+        return retry_after
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(counters) for name, counters in self.counters.items()}
+
+    def render(self):
+        """Return the counters in the Prometheus text exposition format."""
+        lines = ['# HELP rate_limit_requests_total Requests checked by the rate limiter.',
+                 '# TYPE rate_limit_requests_total counter']
+        for name, counters in sorted(self.stats().items()):
+            lines.extend(f'rate_limit_requests_total{{rule="{name}",result="{result}"}} {count}'
+                         for result, count in counters.items())
+        return '\n'.join(lines) + '\n'
+
+
+def create_rate_limiter(config):
+    """Create the rate limiter selected by RATE_LIMIT_BACKEND, or None if rate limiting is disabled."""
+    if config['RATE_LIMIT_BACKEND'] == 'redis':
+        backend = RedisRateLimitBackend(config['RATE_LIMIT_URL'])
+    elif config['RATE_LIMIT_BACKEND'] == 'local':
+        backend = LocalRateLimitBackend(max_keys=config['RATE_LIMIT_MAX_KEYS'])
+    else:
+        return None
+    return RateLimiter(backend, config['RATE_LIMITS'])
@@ -0,0 +1,217 @@
+"""
+Overdue and due soon reminders.
+
+The sweeper walks all loans that are overdue or due within a few days twice, once ordered by lender and once by owner,
+in batches ordered by (user id, return_date, id) using keyset pagination, so memory use does not depend on the number
+of loans. Loans of one recipient are next to each other, each recipient gets one reminder per kind even when the
+loans span several batches: the loans of the last recipient of a batch are held back until the next batch shows that
+there are no more of them. At most batch_size loans are held back, a recipient with more loans than that gets one
+reminder per kind for every batch_size or so of them. Reminders of the completed recipients are written to a sink in
+one call and the position after the last of them is saved to a checkpoint file, so a crashed run continues after the
+last written recipient. Reminders that were written but not checkpointed are sent again, delivery is at least once.
+Users without an email address are skipped.
+"""
+import json
+import logging
+import os
+import smtplib
+from collections import defaultdict
+from datetime import date, timedelta
+from email.message import EmailMessage
+
+from sqlalchemy import tuple_
+
+from models.book import Book
+from models.database import db
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class JsonLinesSink:
+    """Append reminders as JSON lines to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, reminders):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.writelines(json.dumps(reminder, default=str) + '\n' for reminder in reminders)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class SmtpSink:
+    """Send every reminder as an email over one SMTP connection per batch."""
+
+    def __init__(self, host='localhost', port=25, sender='books@localhost'):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def write(self, reminders):
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            for reminder in reminders:
+                smtp.send_message(self.message(reminder))
+
+    def message(self, reminder):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = reminder['email']
+        if reminder['kind'] == 'overdue':
+            message['Subject'] = "Book return is overdue"
+        else:
+            message['Subject'] = "Book return is due soon"
+        lines = [f"{book['title']} - return date {book['return_date']}" for book in reminder['books']]
+        message.set_content(f"Hello {reminder['username']},\n\n" + '\n'.join(lines))
+        return message
+
+
+class Checkpoint:
+    """Position after the last written recipient of a sweep run, stored in a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, run_date):
+        """Return (role, (user id, return_date, id)) after which the run for run_date has to continue, or None."""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as file:
+            state = json.load(file)
+        if state.get('run_date') != run_date.isoformat() or state.get('completed') or 'role' not in state:
+            return None
+        user_id, return_date, book_id = state['last']
+        return state['role'], (user_id, date.fromisoformat(return_date), book_id)
+
+    def completed(self, run_date):
+        """Return True if the run for run_date has already finished."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as file:
+            state = json.load(file)
+        return state.get('run_date') == run_date.isoformat() and state.get('completed', False)
+
+    def save(self, run_date, role=None, last=None, completed=False):
+        if not self.path:
+            return
+        state = {'run_date': run_date.isoformat(), 'completed': completed}
+        if last is not None:
+            state['role'] = role
+            state['last'] = [last[0], last[1].isoformat(), last[2]]
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+
+
+ROLES = (('lender', Book.lender_id), ('owner', Book.owner_id))
+
+
+def group_reminders(loans, role, users, today):
+    """
+    Group the loans of one role into one reminder per recipient and kind.
+
+    :param loans: rows with user_id, id, title and return_date, ordered by user_id
+    :param role: 'lender' or 'owner'
+    :param users: dict of user id to (username, email)
+    :param today: run date
+    :return: list of reminder dicts
+    """
+    grouped = defaultdict(list)
+    for loan in loans:
+        kind = 'overdue' if loan.return_date < today else 'due_soon'
+        grouped[(loan.user_id, kind)].append({'id': loan.id, 'title': loan.title,
+                                              'return_date': loan.return_date.isoformat()})
+    reminders = []
+    for (user_id, kind), books in grouped.items():
+        username, email = users.get(user_id, (None, None))
+        if not email:
+            logger.warning("User id: %s has no email address, skipping %s %s reminder for %s books", user_id, role,
+                           kind, len(books))
+            continue
+        reminders.append({'kind': kind, 'role': role, 'user_id': user_id, 'username': username, 'email': email,
+                          'date': today.isoformat(), 'books': books})
+    return reminders
+
+
+def sweep_reminders(sink, today=None, due_soon_days=3, batch_size=1000, checkpoint=None):
+    """
+    Send reminders for overdue loans and loans due within due_soon_days.
+
+    :param sink: object with a write(reminders) method
+    :param today: run date, defaults to today
+    :param due_soon_days: remind this many days before the return date
+    :param batch_size: loans read per query
+    :param checkpoint: Checkpoint used to resume an interrupted run
+    :return: tuple of (loans processed, reminders written)
+    """
+    today = today or date.today()
+    checkpoint = checkpoint or Checkpoint(None)
+    if checkpoint.completed(today):
+        logger.info("Reminders for %s have already been sent", today)
+        return 0, 0
+    resume = checkpoint.load(today)
+    if resume:
+        logger.info("Resuming %s reminders for %s after loan %s", resume[0], today, resume[1])
+    loans_processed = reminders_written = 0
+    for role, user_column in ROLES:
+        last = None
+        if resume:
+            if role != resume[0]:
+                continue
+            last, resume = resume[1], None
+        loans, reminders = sweep_role(sink, role, user_column, today, due_soon_days, batch_size, checkpoint, last)
+        # Every loan has an owner, the owner pass sees each loan once
+        if role == 'owner':
+            loans_processed += loans
+        reminders_written += reminders
+    checkpoint.save(today, completed=True)
+    logger.info("Sent %s reminders for %s loans", reminders_written, loans_processed)
+    return loans_processed, reminders_written
+
+
+def sweep_role(sink, role, user_column, today, due_soon_days, batch_size, checkpoint, last=None):
+    """Send the reminders of one role, continuing after the (user id, return_date, id) key last."""
+    key = tuple_(user_column, Book.return_date, Book.id)
+    loans_processed = reminders_written = 0
+    held_back = []
+    while True:
+        stmt = (db.select(user_column.label('user_id'), Book.id, Book.title, Book.return_date)
+                .where(user_column.is_not(None), Book.return_date.is_not(None),
+                       Book.return_date <= today + timedelta(days=due_soon_days))
+                .order_by(user_column, Book.return_date, Book.id)
+                .limit(batch_size))
+        if last:
+            stmt = stmt.where(key > tuple_(*last))
+        rows = db.session.execute(stmt).all()
+        loans = held_back + rows
+        if rows:
+            last = (rows[-1].user_id, rows[-1].return_date, rows[-1].id)
+            # The last recipient may have more loans in the next batch
+            split = len(loans)
+            while split and loans[split - 1].user_id == last[0]:
+                split -= 1
+            loans, held_back = loans[:split], loans[split:]
+            if len(held_back) >= batch_size:
+                loans, held_back = loans + held_back, []
+        if loans:
+            users = {row.id: (row.username, row.email) for row in db.session.execute(
+                db.select(User.id, User.username, User.email).where(User.id.in_({loan.user_id for loan in loans})))}
+            reminders = group_reminders(loans, role, users, today)
+            if reminders:
+                sink.write(reminders)
+            checkpoint.save(today, role, (loans[-1].user_id, loans[-1].return_date, loans[-1].id))
+            loans_processed += len(loans)
+            reminders_written += len(reminders)
+        if not rows:
+            return loans_processed, reminders_written
+
+
+def create_sink(config):
+    """Create the reminder sink selected by REMINDER_SINK."""
+    if config['REMINDER_SINK'] == 'smtp':
+        return SmtpSink(config['SMTP_HOST'], config['SMTP_PORT'], config['REMINDER_SENDER'])
+    return JsonLinesSink(config['REMINDER_FILE'])
@@ -0,0 +1,126 @@
+import re
+
+from flask import current_app
+from sqlalchemy import event, func, literal_column, or_, table, column, text
+from sqlalchemy.exc import OperationalError
+
+from models.book import Book
+from models.database import db
+
+SEARCH_TABLE = 'books_fts'
+
+SQLITE_INDEX_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"title, author, content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON books BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON books BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, author) "
+    f"VALUES ('delete', old.id, old.title, old.author); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF title, author ON books BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, author) "
+    f"VALUES ('delete', old.id, old.title, old.author); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+]
+
+POSTGRES_INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_books_search ON books "
+    "USING GIN (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, '')))",
+]
+
+fts_table = table(SEARCH_TABLE, column('rowid'))
+
+
+def search_terms(query):
+    """Split a search query into lower case word tokens."""
+    return re.findall(r'\w+', query.lower())
+
+
+def install_search_index(connection):
+    """
+    Create the full-text search index for books if it does not exist yet.
+
+    :param connection: SQLAlchemy connection inside a transaction
+    :return: name of the search backend ('fts5', 'tsvector' or 'like')
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                    {'name': SEARCH_TABLE}).first()
+        try:
+            for statement in SQLITE_INDEX_DDL:
+                connection.execute(text(statement))
+        except OperationalError:
+            # SQLite was compiled without FTS5
+            return 'like'
+        if not exists:
+            rebuild_search_index(connection)
+        return 'fts5'
+    if dialect == 'postgresql':
+        for statement in POSTGRES_INDEX_DDL:
+            connection.execute(text(statement))
+        return 'tsvector'
+    return 'like'
+
+
+def rebuild_search_index(connection):
+    """Rebuild the search index from the current content of the books table."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(text("REINDEX INDEX ix_books_search"))
+
+
+def init_search(app):
+    """Install the search index for the application database and remember which backend is in use."""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            app.extensions['book_search'] = install_search_index(connection)
+
+
+@event.listens_for(Book.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    install_search_index(connection)
+
+
+@event.listens_for(Book.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def search_books(query, page=1, per_page=20, columns=None):
+    """
+    Search books by title and author.
+
+    Every word of the query has to match the beginning of a word in the title or author. Results are ranked by
+    relevance when a full-text index is available.
+
+    :param query: search query
+    :param page: page number starting from 1
+    :param per_page: results per page
+    :param columns: select only these columns and return rows instead of books
+    :return: tuple of (list of books, True if there is a next page)
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+    backend = current_app.extensions.get('book_search', 'like')
+    stmt = db.select(*columns) if columns else db.select(Book)
+    stmt = stmt.where(Book.pending_validation == False)
+    if backend == 'fts5':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        stmt = (stmt.join(fts_table, fts_table.c.rowid == Book.id)
+                .where(literal_column(SEARCH_TABLE).op('MATCH')(match))
+                .order_by(func.bm25(literal_column(SEARCH_TABLE), 10.0, 5.0), Book.id))
+    elif backend == 'tsvector':
+        document = func.to_tsvector('simple', func.coalesce(Book.title, '') + ' ' + func.coalesce(Book.author, ''))
+        ts_query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        stmt = stmt.where(document.op('@@')(ts_query)).order_by(func.ts_rank(document, ts_query).desc(), Book.id)
+    else:
+        for term in terms:
+            stmt = stmt.where(or_(Book.title.ilike(f"%{term}%"), Book.author.ilike(f"%{term}%")))
+        stmt = stmt.order_by(Book.title, Book.id)
+    result = db.session.execute(stmt.limit(per_page + 1).offset((page - 1) * per_page))
+    books = result.all() if columns else result.scalars().all()
+    return books[:per_page], len(books) > per_page
@@ -0,0 +1,14 @@
+import json
+from datetime import date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(payload):
+    """Serialize payload to JSON bytes with orjson if it is installed, dates are written in ISO format."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), default=date.isoformat).encode('utf-8')
@@ -1,14 +1,74 @@
+import logging
+
 import requests
+from requests.adapters import HTTPAdapter
 
+from utilities.cache import TTLCache
 
-def check_image_url(url):
-    """Check image url and return True if it exists and image file is correct and undamaged."""
-    try:
-        response = requests.get(url)
-        if response.status_code == 200 and 'image' in response.headers['Content-Type']:
-            return True
-        else:
+logger = logging.getLogger(__name__)
+
+
+class ImageUrlValidator:
+    """
+    Validate that an URL points to an image without downloading the image.
+
+    A HEAD request is tried first. If the host does not answer HEAD properly, a GET for the first byte of the file is
+    made and the connection is closed without reading the body. All requests share one pooled session and have
+    connect and read timeouts. Verdicts are cached per URL, negative verdicts for a shorter time.
+    """
+
+    def __init__(self, session=None, connect_timeout=3.05, read_timeout=5, cache_size=1024, cache_ttl=3600,
+                 negative_cache_ttl=300):
+        self.session = session or self.create_session()
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self.negative_cache_ttl = negative_cache_ttl
+
+    @staticmethod
+    def create_session(pool_size=20):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @staticmethod
+    def is_image(response):
+        return response.status_code in (200, 206) and 'image' in response.headers.get('Content-Type', '')
+
+    def check(self, url, raise_errors=False):
+        """
+        Return True if url exists and serves an image.
+
+        :param url: image url
+        :param raise_errors: raise requests.exceptions.RequestException on network errors instead of returning False
+        """
+        verdict = self.cache.get(url)
+        if verdict is not None:
+            return verdict
+        try:
+            verdict = self.fetch_verdict(url)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Error checking URL: %s", e)
+            if raise_errors:
+                raise
             return False
-    except requests.exceptions.RequestException as e:
-        print(f"Error checking URL: {e}")
-        return False
+        self.cache.set(url, verdict, ttl=None if verdict else self.negative_cache_ttl)
+        return verdict
+
+    def fetch_verdict(self, url):
+        with self.session.head(url, timeout=self.timeout, allow_redirects=True) as response:
+            if self.is_image(response):
+                return True
+            if response.status_code in (404, 410):
+                return False
+        with self.session.get(url, timeout=self.timeout, headers={'Range': 'bytes=0-0'}, stream=True) as response:
+            return self.is_image(response)
+
+
+image_validator = ImageUrlValidator()
+
+
+def check_image_url(url):
+    """Check image url and return True if it exists and serves an image."""
+    return image_validator.check(url)
@@ -0,0 +1,36 @@
+from sqlalchemy.orm import make_transient_to_detached
+
+from models.database import db
+from models.user import User
+from utilities.cache import TTLCache
+
+CACHED_FIELDS = ('id', 'first_name', 'last_name', 'email', 'username', 'duration')
+
+
+class UserCache:
+    """
+    Load the session user with at most one query per request and optionally none.
+
+    With a ttl above zero the non-sensitive fields of loaded users are kept in a process wide cache. A cache hit is
+    merged into the session as a persistent User without a SELECT; fields that are not cached, like the password
+    hash, are loaded lazily if something reads them. Entries must be invalidated when a cached field changes.
+    """
+
+    def __init__(self, ttl=0, max_size=10000):
+        self.ttl = ttl
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def load(self, user_id):
+        """Return the user with user_id or None if it does not exist."""
+        fields = self.cache.get(user_id) if self.ttl > 0 else None
+        if fields is not None:
+            user = User(**fields)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+        user = db.session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            self.cache.set(user_id, {field: getattr(user, field) for field in CACHED_FIELDS}, ttl=self.ttl)
+        return user
+
+    def invalidate(self, user_id):
+        self.cache.delete(user_id)
@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+
+import requests
+
+from models.book import Book
+from models.database import db
+from utilities.page_cache import catalog_changed
+from utilities.service import image_validator
+
+logger = logging.getLogger(__name__)
+
+
+class CoverValidationQueue:
+    """
+    Validate cover images of newly added books in background worker threads.
+
+    Books are stored with pending_validation=True and are hidden from the catalog until a worker has checked the cover.
+    A book with a valid cover is published, a book with an invalid cover is removed. Network errors are retried with
+    exponential backoff; books that still cannot be checked stay pending for the validate-covers command.
+    """
+
+    def __init__(self, app, workers=2, max_size=100, max_attempts=3, backoff=1.0, validator=image_validator):
+        self.app = app
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.validator = validator
+        self.queue = queue.Queue(maxsize=max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = {'enqueued': 0, 'rejected_full': 0, 'published': 0, 'removed': 0, 'retried': 0,
+                         'gave_up': 0}
+        self.max_depth = 0
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"cover-validation-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, book_id, image_url):
+        """
+        Queue a book for cover validation.
+
+        :return: False if the queue is full. The book then stays pending until validate-covers picks it up.
+        """
+        try:
+            self.queue.put_nowait((book_id, image_url))
+        except queue.Full:
+            self._count('rejected_full')
+            logger.warning("Cover validation queue is full, book id: %s stays pending", book_id)
+            return False
+        self._count('enqueued')
+        with self._lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def stats(self):
+        """Return queue depth and counters."""
+        with self._lock:
+            return dict(self.counters, depth=self.queue.qsize(), max_depth=self.max_depth)
+
+    def render(self):
+        """Return the queue depth gauges and the outcome counters in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = ['# HELP cover_validation_queue_depth Books waiting in the cover validation queue.',
+                 '# TYPE cover_validation_queue_depth gauge',
+                 f'cover_validation_queue_depth {stats.pop("depth")}',
+                 '# HELP cover_validation_queue_max_depth Highest number of books waiting in the queue.',
+                 '# TYPE cover_validation_queue_max_depth gauge',
+                 f'cover_validation_queue_max_depth {stats.pop("max_depth")}',
+                 '# HELP cover_validation_total Cover validation outcomes, including rejected and failed attempts.',
+                 '# TYPE cover_validation_total counter']
+        lines.extend(f'cover_validation_total{{result="{name}"}} {count}' for name, count in stats.items())
+        return '\n'.join(lines) + '\n'
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                with self.app.app_context():
+                    self.process(*item)
+            except Exception:
+                logger.exception("Cover validation of %s failed", item)
+            finally:
+                self.queue.task_done()
+
+    def process(self, book_id, image_url):
+        """Validate one cover and publish or remove the book. Must run inside an application context."""
+        for attempt in range(self.max_attempts):
+            try:
+                valid = self.validator.check(image_url, raise_errors=True)
+            except requests.exceptions.RequestException:
+                if attempt + 1 < self.max_attempts:
+                    self._count('retried')
+                    time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if valid:
+                publish_book(book_id)
+                self._count('published')
+            else:
+                remove_pending_book(book_id)
+                self._count('removed')
+            return valid
+        self._count('gave_up')
+        logger.warning("Gave up validating cover of book id: %s, it stays pending", book_id)
+        return None
+
+
+def publish_book(book_id):
+    db.session.execute(db.update(Book)
+                       .where(Book.id == book_id, Book.pending_validation == True)
+                       .values(pending_validation=False))
+    db.session.commit()
+    catalog_changed()
+    logger.info("Book id: %s cover is valid, book is published", book_id)
+
+
+def remove_pending_book(book_id):
+    db.session.execute(db.delete(Book).where(Book.id == book_id, Book.pending_validation == True))
+    db.session.commit()
+    logger.warning("Book id: %s cover is not valid, book is removed", book_id)
+
+
+def validate_pending_books(validation_queue, batch_size=100):
+    """Validate every pending book in the calling thread. Used by the validate-covers command."""
+    last_id = 0
+    processed = 0
+    while True:
+        books = db.session.execute(db.select(Book.id, Book.image_url)
+                                   .where(Book.pending_validation == True, Book.id > last_id)
+                                   .order_by(Book.id).limit(batch_size)).all()
+        if not books:
+            return processed
+        for book_id, image_url in books:
+            validation_queue.process(book_id, image_url)
+            processed += 1
+        last_id = books[-1].id